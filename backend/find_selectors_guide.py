@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
 """
 Helper script to test selectors in Albert Heijn app
-Use this to verify selectors found in Appium Inspector
+Use this to verify selectors found in Appium Inspector, or run it with --batch to check every
+selector list of src/ah_automation.py against one snapshot per screen (e.g. before a deploy)
 """
 
+import argparse
+import asyncio
+import json
+import sys
 import time
 from appium import webdriver
 from appium.options.ios import XCUITestOptions
@@ -149,6 +154,198 @@ def test_multiple_selectors(driver, selectors_list, description, device_type="io
     return None
 
 
+# Screens walked by --batch and the ah_automation selector lists checked on each:
+# (list name, screen, required). A required list that misses fails the run.
+BATCH_CHECKS = [
+    ("SEARCH_BUTTON_SELECTORS", "home", True),
+    ("SEARCH_FIELD_SELECTORS", "search", True),
+    ("SEARCH_SUBMIT_SELECTORS", "typing", False),
+    ("PRODUCT_SELECTORS", "results", True),
+    ("ADD_BUTTON_SELECTORS", "detail", True),
+    ("BACK_BUTTON_SELECTORS", "detail", False),
+    ("PLUS_BUTTON_SELECTORS", "added", False),
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Test Albert Heijn app selectors")
+    parser.add_argument("--batch", action="store_true",
+                        help="Check all automation selector lists non-interactively and print a report")
+    parser.add_argument("--device-type", default="ios", choices=["ios", "android"],
+                        help="Device type for --batch (default: ios)")
+    parser.add_argument("--query", default="melk", help="Search query used to reach the result list (default: melk)")
+    parser.add_argument("--add", action="store_true",
+                        help="Tap 'Voeg toe' to check the '+' button too (adds the product to the basket)")
+    parser.add_argument("--settle", type=float, default=1.5,
+                        help="Seconds to wait for a screen before its snapshot (default: 1.5)")
+    parser.add_argument("--fake", action="store_true", help="Walk the fake device backend instead of Appium")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    return parser.parse_args()
+
+
+def _winner_rect(finder, result):
+    """Rect of the element the automation would use from an evaluated selector list"""
+    from src.snapshot import element_rect
+
+    if not result["hit"]:
+        return None
+    winner = result["winner"]
+    return element_rect(finder.find(winner["by"], winner["selector"])[0])
+
+
+async def capture_screens(driver, device_type, query, add, settle):
+    """
+    Walk the app through the screens ah_automation.py uses, one snapshot each
+
+    Navigation taps the winning element of the list that leads to the next screen, found in the
+    snapshot already taken, so the walk itself costs no element lookups.
+
+    Returns:
+        dict of screen name -> LocalFinder (screens that could not be reached are missing)
+    """
+    from src import ah_automation
+    from src.interaction import tap_rect
+    from src.interrupts import dismiss_interrupts
+    from src.locators import LocalFinder, evaluate_selectors
+    from src.snapshot import take_snapshot
+
+    screens = {}
+
+    async def capture(name):
+        time.sleep(settle)
+        snapshot = take_snapshot(driver)
+        if snapshot is not None and await dismiss_interrupts(driver, snapshot):
+            time.sleep(settle)
+            snapshot = take_snapshot(driver)
+        if snapshot is None:
+            return None
+        screens[name] = LocalFinder(snapshot)
+        return screens[name]
+
+    home = await capture("home")
+    if home is None:
+        return screens
+    rect = _winner_rect(home, evaluate_selectors(home, ah_automation.SEARCH_BUTTON_SELECTORS))
+    if rect:
+        tap_rect(driver, rect)
+        search = await capture("search")
+    else:
+        # The automation also carries on when the search box is already on screen
+        search = screens["search"] = home
+    if search is None:
+        return screens
+
+    rect = _winner_rect(search, evaluate_selectors(search, ah_automation.SEARCH_FIELD_SELECTORS))
+    if not rect:
+        return screens
+    tap_rect(driver, rect)
+    search_box = driver.switch_to.active_element
+    search_box.send_keys(query)
+    if await capture("typing") is None:
+        return screens
+    search_box.send_keys("\ue007" if device_type == "ios" else "\ue006")
+
+    results = await capture("results")
+    if results is None:
+        return screens
+    rect = _winner_rect(results, evaluate_selectors(results, ah_automation.PRODUCT_SELECTORS))
+    if not rect:
+        return screens
+    tap_rect(driver, rect)
+
+    detail = await capture("detail")
+    if detail is None or not add:
+        return screens
+    rect = _winner_rect(detail, evaluate_selectors(detail, ah_automation.ADD_BUTTON_SELECTORS))
+    if rect:
+        tap_rect(driver, rect)
+        await capture("added")
+    return screens
+
+
+def build_batch_report(device_type, screens, duration_s):
+    from src import ah_automation
+    from src.locators import evaluate_selectors
+
+    report = {
+        "device_type": device_type,
+        "duration_s": round(duration_s, 2),
+        "screens": {
+            name: {
+                "nodes": finder.node_count,
+                "source_bytes": finder.snapshot.size_bytes,
+                "signature": finder.snapshot.signature,
+            }
+            for name, finder in screens.items()
+        },
+        "lists": [],
+    }
+    ok = True
+    for list_name, screen, required in BATCH_CHECKS:
+        entry = {"name": list_name, "screen": screen, "required": required}
+        finder = screens.get(screen)
+        if finder is None:
+            entry.update(status="skipped", hit=None, winner=None, estimated_ms=None, candidates=[])
+        else:
+            entry.update(evaluate_selectors(finder, getattr(ah_automation, list_name)))
+            entry["status"] = "hit" if entry["hit"] else "miss"
+        if required and entry["status"] != "hit":
+            ok = False
+        report["lists"].append(entry)
+    report["ok"] = ok
+    return report
+
+
+def print_batch_report(report):
+    print("=" * 70)
+    print(f"SELECTOR REPORT ({report['device_type']}, {report['duration_s']}s)")
+    print("=" * 70)
+    for name, screen in report["screens"].items():
+        print(f"Screen {name:<10} {screen['nodes']:>5} nodes  {screen['source_bytes']:>8} bytes  {screen['signature']}")
+    print("-" * 70)
+    print(f"{'List':<26}{'Screen':<10}{'Status':<9}{'Winner':<8}{'Est. ms':>9}")
+    for entry in report["lists"]:
+        status = entry["status"] + ("" if entry["required"] else "*")
+        winner = f"#{entry['winner']['index'] + 1}" if entry["winner"] else "-"
+        cost = entry["estimated_ms"] if entry["estimated_ms"] is not None else "-"
+        print(f"{entry['name']:<26}{entry['screen']:<10}{status:<9}{winner:<8}{cost:>9}")
+        if entry["winner"]:
+            print(f"    ✅ {entry['winner']['by']}: {entry['winner']['selector']}")
+        for candidate in entry["candidates"]:
+            if candidate.get("error"):
+                print(f"    ⚠️  {candidate['by']}: {candidate['selector']} ({candidate['error']})")
+    print("-" * 70)
+    print("* optional list (a fallback path in the automation)")
+    print("✅ All required selector lists hit" if report["ok"] else "❌ Required selector lists missed")
+    print("=" * 70)
+
+
+def batch_main(args) -> int:
+    """Non-interactive check of all automation selector lists; returns the exit code"""
+    if args.fake:
+        from src.fake_driver import FakeDriver
+        driver = FakeDriver(args.device_type)
+    else:
+        appium_url = os.getenv("APPIUM_SERVER_URL", "http://localhost:4723")
+        driver = webdriver.Remote(appium_url, options=get_appium_options(args.device_type))
+    started = time.perf_counter()
+    try:
+        screens = asyncio.run(capture_screens(driver, args.device_type, args.query, args.add, args.settle))
+    finally:
+        driver.quit()
+    report = build_batch_report(args.device_type, screens, time.perf_counter() - started)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_batch_report(report)
+    return 0 if report["ok"] else 1
+
+
 def main():
     """Main function to test selectors"""
     print("="*70)
@@ -337,5 +534,8 @@ def main():
 
 
 if __name__ == "__main__":
+    args = parse_args()
+    if args.batch:
+        sys.exit(batch_main(args))
     main()
 
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Load test for the automation API
+Runs the FastAPI app in-process on the fake device backend and drives it with concurrent
+WebSocket and HTTP clients that follow the frontend's useAutomation.ts protocol
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+PRODUCT_NAMES = [
+    "melk", "kaas", "brood", "eieren", "boter", "appels", "bananen", "yoghurt",
+    "koffie", "thee", "pasta", "rijst", "tomaten", "komkommer", "kipfilet", "chocolade",
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test the automation API against a fake device backend")
+    parser.add_argument("--clients", type=int, default=50, help="Number of simulated clients (default: 50)")
+    parser.add_argument("--ws-ratio", type=float, default=0.8, help="Fraction of clients using the WebSocket (default: 0.8)")
+    parser.add_argument("--items", type=int, default=5, help="Products per basket (default: 5)")
+    parser.add_argument("--devices", type=int, default=4, help="Fake iOS devices (default: 4)")
+    parser.add_argument("--ramp", type=float, default=2.0, help="Seconds over which clients start (default: 2)")
+    parser.add_argument("--latency", type=float, default=0.005, help="Fake driver seconds per command (default: 0.005)")
+    parser.add_argument("--sleep-scale", type=float, default=0.01, help="Scale for UI settle delays (default: 0.01)")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the in-process server (default: 8765)")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="Show backend automation logs")
+    parser.add_argument("--scaling", type=str, default=None,
+                        help="Comma-separated device counts (e.g. 1,2,4): run the load once per count and "
+                             "check that throughput grows with the devices")
+    parser.add_argument("--min-efficiency", type=float, default=0.6,
+                        help="Scaling check: lowest acceptable speed-up per added device, relative to the "
+                             "first count (default: 0.6)")
+    return parser.parse_args()
+
+
+def configure_environment(args):
+    """Point the backend at the fake driver; must run before importing src.main"""
+    os.environ["AH_FAKE_DRIVER"] = "true"
+    os.environ["AH_FAKE_LATENCY"] = str(args.latency)
+    os.environ["AH_SLEEP_SCALE"] = str(args.sleep_scale)
+    os.environ["AH_DEVICES"] = json.dumps([
+        {"id": f"fake-{idx + 1}", "device_type": "ios"} for idx in range(args.devices)
+    ])
+    os.environ.setdefault("AH_CACHE_DIR", tempfile.mkdtemp(prefix="ah-load-"))
+    os.environ.setdefault("SCHEDULER_MAX_WAIT", "86400")
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MB"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except Exception:
+        # ru_maxrss is KB on Linux and bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+
+def start_server(app, port: int):
+    """Run uvicorn in a background thread with its own event loop"""
+    import uvicorn
+
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("Server did not start")
+        time.sleep(0.05)
+    return server, thread
+
+
+def basket(items: int):
+    return [
+        {"name": name, "quantity": random.randint(1, 3)}
+        for name in random.sample(PRODUCT_NAMES, min(items, len(PRODUCT_NAMES)))
+    ]
+
+
+async def websocket_client(base_url: str, client_id: int, items: int, stats: dict):
+    """Mirror useAutomation.ts: open socket, send request, read events until completed/error"""
+    import websockets
+
+    ws_url = base_url.replace("http", "ws") + "/ws/automate"
+    started = time.perf_counter()
+    try:
+        async with websockets.connect(ws_url, open_timeout=30, max_size=None) as ws:
+            await ws.send(json.dumps({
+                "products": basket(items),
+                "device_type": "ios",
+                "user_id": f"load-user-{client_id}",
+            }))
+            while True:
+                message = json.loads(await ws.recv())
+                if "timestamp" in message:
+                    stats["event_lag_ms"].append((time.time() - message["timestamp"]) * 1000)
+                stats["events"] += 1
+                if message.get("status") == "completed":
+                    stats["ws_latency_ms"].append((time.perf_counter() - started) * 1000)
+                    stats["ws_ok"] += 1
+                    return
+                if message.get("status") == "error":
+                    stats["ws_errors"] += 1
+                    stats["error_messages"].append(message.get("message", ""))
+                    return
+    except Exception as e:
+        stats["ws_errors"] += 1
+        stats["error_messages"].append(f"websocket: {e}")
+
+
+async def http_client(base_url: str, client_id: int, items: int, stats: dict):
+    """Mirror the HTTP fallback: POST /automate and wait for the final status"""
+    import requests
+
+    started = time.perf_counter()
+    try:
+        response = await asyncio.to_thread(
+            requests.post,
+            f"{base_url}/automate",
+            json={"products": basket(items), "device_type": "ios", "user_id": f"load-user-{client_id}"},
+            timeout=3600,
+        )
+        if response.status_code == 200:
+            stats["http_latency_ms"].append((time.perf_counter() - started) * 1000)
+            stats["http_ok"] += 1
+        else:
+            stats["http_errors"] += 1
+            stats["error_messages"].append(f"http {response.status_code}: {response.text[:200]}")
+    except Exception as e:
+        stats["http_errors"] += 1
+        stats["error_messages"].append(f"http: {e}")
+
+
+async def health_poller(base_url: str, stats: dict, stop: asyncio.Event):
+    """Measure /health latency and process memory while the load runs"""
+    import requests
+
+    session = requests.Session()
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            response = await asyncio.to_thread(session.get, f"{base_url}/health", timeout=30)
+            if response.status_code == 200:
+                stats["health_latency_ms"].append((time.perf_counter() - started) * 1000)
+            else:
+                stats["health_errors"] += 1
+        except Exception:
+            stats["health_errors"] += 1
+        stats["peak_rss_mb"] = max(stats["peak_rss_mb"], current_rss_mb())
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.2)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_load(args) -> dict:
+    base_url = f"http://127.0.0.1:{args.port}"
+    stats = {
+        "ws_latency_ms": [], "http_latency_ms": [], "event_lag_ms": [], "health_latency_ms": [],
+        "ws_ok": 0, "ws_errors": 0, "http_ok": 0, "http_errors": 0, "health_errors": 0,
+        "events": 0, "error_messages": [], "peak_rss_mb": current_rss_mb(),
+    }
+    ws_clients = int(round(args.clients * args.ws_ratio))
+
+    async def start_client(client_id: int):
+        await asyncio.sleep(random.uniform(0, args.ramp))
+        if client_id < ws_clients:
+            await websocket_client(base_url, client_id, args.items, stats)
+        else:
+            await http_client(base_url, client_id, args.items, stats)
+
+    stop = asyncio.Event()
+    poller = asyncio.create_task(health_poller(base_url, stats, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(start_client(idx) for idx in range(args.clients)))
+    stats["duration_s"] = time.perf_counter() - started
+    stop.set()
+    await poller
+    return stats
+
+
+def summarize(values) -> dict:
+    from src.metrics import percentile
+
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "p50": round(percentile(values, 0.50), 1),
+        "p95": round(percentile(values, 0.95), 1),
+        "p99": round(percentile(values, 0.99), 1),
+        "max": round(max(values), 1),
+    }
+
+
+def build_report(args, stats: dict, rss_start: float, rss_end: float) -> dict:
+    from src.metrics import metrics
+
+    finished = stats["ws_ok"] + stats["http_ok"]
+    errors = stats["ws_errors"] + stats["http_errors"]
+    # Jobs "succeed" even when products could not be added; count the products themselves
+    counters = metrics.snapshot()["counters"]
+    items_added = int(counters.get("items.added", 0))
+    items_failed = int(counters.get("items.failed", 0))
+    items = items_added + items_failed
+    return {
+        "clients": args.clients,
+        "devices": args.devices,
+        "items_per_basket": args.items,
+        "duration_s": round(stats["duration_s"], 2),
+        "jobs_per_minute": round(finished / stats["duration_s"] * 60, 1) if stats["duration_s"] else 0.0,
+        "error_rate": round(errors / args.clients, 3) if args.clients else 0.0,
+        "items": {"added": items_added, "failed": items_failed},
+        "item_failure_rate": round(items_failed / items, 3) if items else 0.0,
+        "websocket": {"ok": stats["ws_ok"], "errors": stats["ws_errors"], "latency_ms": summarize(stats["ws_latency_ms"])},
+        "http": {"ok": stats["http_ok"], "errors": stats["http_errors"], "latency_ms": summarize(stats["http_latency_ms"])},
+        "event_delivery_lag_ms": summarize(stats["event_lag_ms"]),
+        "events_received": stats["events"],
+        "health": {"errors": stats["health_errors"], "latency_ms": summarize(stats["health_latency_ms"])},
+        "memory_mb": {
+            "start": round(rss_start, 1),
+            "end": round(rss_end, 1),
+            "peak": round(stats["peak_rss_mb"], 1),
+            "growth": round(rss_end - rss_start, 1),
+        },
+        "sample_errors": stats["error_messages"][:5],
+    }
+
+
+def print_report(report: dict):
+    print("=" * 60)
+    print("LOAD TEST REPORT")
+    print("=" * 60)
+    print(f"Clients: {report['clients']}  Devices: {report['devices']}  Items/basket: {report['items_per_basket']}")
+    print(f"Duration: {report['duration_s']}s  Throughput: {report['jobs_per_minute']} jobs/min  "
+          f"Error rate: {report['error_rate'] * 100:.1f}%  "
+          f"Item failure rate: {report['item_failure_rate'] * 100:.1f}%")
+    print("-" * 60)
+    print(f"{'Metric':<28}{'count':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    rows = [
+        ("WebSocket job latency (ms)", report["websocket"]["latency_ms"]),
+        ("HTTP job latency (ms)", report["http"]["latency_ms"]),
+        ("Event delivery lag (ms)", report["event_delivery_lag_ms"]),
+        ("/health latency (ms)", report["health"]["latency_ms"]),
+    ]
+    for label, summary in rows:
+        if summary["count"]:
+            print(f"{label:<28}{summary['count']:>7}{summary['p50']:>9}{summary['p95']:>9}"
+                  f"{summary['p99']:>9}{summary['max']:>9}")
+        else:
+            print(f"{label:<28}{0:>7}")
+    print("-" * 60)
+    print(f"WebSocket ok/errors: {report['websocket']['ok']}/{report['websocket']['errors']}  "
+          f"HTTP ok/errors: {report['http']['ok']}/{report['http']['errors']}  "
+          f"/health errors: {report['health']['errors']}")
+    memory = report["memory_mb"]
+    print(f"Memory (RSS, MB): start {memory['start']}  end {memory['end']}  "
+          f"peak {memory['peak']}  growth {memory['growth']}")
+    for message in report["sample_errors"]:
+        print(f"  ✗ {message}")
+    print("=" * 60)
+
+
+def run_scaling(args) -> bool:
+    """
+    Run the load once per device count, each in its own process (devices are configured at
+    import time), and check that throughput scales with the number of devices
+
+    Returns:
+        bool: True if every count reaches `min_efficiency` of linear scaling
+    """
+    counts = [int(count) for count in args.scaling.split(",") if count.strip()]
+    results = []
+    for idx, count in enumerate(counts):
+        command = [
+            sys.executable, os.path.abspath(__file__), "--json",
+            "--devices", str(count), "--clients", str(args.clients), "--items", str(args.items),
+            "--ws-ratio", str(args.ws_ratio), "--ramp", str(args.ramp), "--latency", str(args.latency),
+            "--sleep-scale", str(args.sleep_scale), "--port", str(args.port + idx),
+        ]
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        results.append((count, json.loads(output)))
+
+    base_count, base = results[0]
+    ok = True
+    print("=" * 60)
+    print("DEVICE SCALING")
+    print("=" * 60)
+    print(f"{'Devices':<10}{'jobs/min':>10}{'speed-up':>10}{'efficiency':>12}{'/health p95':>13}{'item fail':>11}")
+    for count, report in results:
+        speedup = report["jobs_per_minute"] / base["jobs_per_minute"] if base["jobs_per_minute"] else 0.0
+        efficiency = speedup / (count / base_count) if count != base_count else 1.0
+        # Fewer clients than devices cannot use them all
+        if count > base_count and efficiency < args.min_efficiency and count <= args.clients:
+            ok = False
+        health_p95 = report["health"]["latency_ms"].get("p95", 0.0)
+        print(f"{count:<10}{report['jobs_per_minute']:>10}{speedup:>10.2f}{efficiency:>12.2f}"
+              f"{health_p95:>13}{report['item_failure_rate'] * 100:>10.1f}%")
+    print("-" * 60)
+    print("PASS" if ok else f"FAIL: throughput grows less than {args.min_efficiency:.0%} of linear")
+    print("=" * 60)
+    return ok
+
+
+def main():
+    args = parse_args()
+    if args.scaling:
+        sys.exit(0 if run_scaling(args) else 1)
+    configure_environment(args)
+
+    from src.main import app
+
+    if not args.verbose:
+        logging.getLogger("src").setLevel(logging.WARNING)
+    rss_start = current_rss_mb()
+    server, thread = start_server(app, args.port)
+    try:
+        stats = asyncio.run(run_load(args))
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+    report = build_report(args, stats, rss_start, current_rss_mb())
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\nLoad test interrupted by user")
+        sys.exit(1)
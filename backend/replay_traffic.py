@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Replay recorded traffic against the fake device backend
+Re-issues the baskets of a trace written with AH_TRAFFIC_RECORD=true at their recorded arrival
+times (compressed by --speedup) to the API running in-process on fake devices, and reports
+throughput, queue wait and per-item latency
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from load_test import configure_environment, start_server, summarize
+
+# Threads for outstanding baskets (each waits on a streaming response)
+MAX_CLIENT_THREADS = 512
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay a recorded traffic trace against a fake device backend")
+    parser.add_argument("trace", help="Trace recorded with AH_TRAFFIC_RECORD=true (cache/traffic.jsonl)")
+    parser.add_argument("--speedup", type=float, default=10.0,
+                        help="Compress arrival times and UI settle delays by this factor (default: 10)")
+    parser.add_argument("--devices", type=int, default=4, help="Fake devices per device type (default: 4)")
+    parser.add_argument("--limit", type=int, default=None, help="Replay only the first N baskets")
+    parser.add_argument("--latency", type=float, default=0.005, help="Fake driver seconds per command (default: 0.005)")
+    parser.add_argument("--sleep-scale", type=float, default=None,
+                        help="Scale for UI settle delays (default: 1 / speedup)")
+    parser.add_argument("--port", type=int, default=8766, help="Port for the in-process server (default: 8766)")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="Show backend automation logs")
+    return parser.parse_args()
+
+
+def configure_replay_environment(args):
+    """Fake iOS and Android devices; must run before importing anything from src"""
+    if args.sleep_scale is None:
+        args.sleep_scale = 1.0 / args.speedup
+    configure_environment(args)
+    os.environ["AH_DEVICES"] = json.dumps([
+        {"id": f"fake-{device_type}-{idx + 1}", "device_type": device_type}
+        for device_type in ("ios", "android") for idx in range(args.devices)
+    ])
+    # The replay must not end up in the trace it reads, and needs the spans it reports from
+    os.environ["AH_TRAFFIC_RECORD"] = "false"
+    os.environ["AH_TRACING_ENABLED"] = "true"
+    os.environ.setdefault("AH_WARMUP", "false")
+
+
+def replay_basket(base_url: str, entry: dict, stats: dict):
+    """POST one basket as a stream, then read its queue wait and item spans from the job trace"""
+    import requests
+
+    started = time.perf_counter()
+    job_id = None
+    final = None
+    try:
+        response = requests.post(
+            f"{base_url}/automate?stream=true",
+            json={
+                "products": entry["products"],
+                "device_type": entry.get("device_type", "ios"),
+                "user_id": entry.get("user", "replay"),
+                "priority": entry.get("priority", 0),
+            },
+            stream=True,
+            timeout=3600,
+        )
+        if response.status_code != 200:
+            stats["rejected" if response.status_code == 503 else "errors"] += 1
+            stats["error_messages"].append(f"http {response.status_code}: {response.text[:200]}")
+            return
+        for line in response.iter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            job_id = job_id or event.get("job_id")
+            if event.get("status") == "error":
+                stats["errors"] += 1
+                stats["error_messages"].append(event.get("message", ""))
+                return
+            if "products_added" in event:
+                final = event
+    except Exception as e:
+        stats["errors"] += 1
+        stats["error_messages"].append(f"http: {e}")
+        return
+    if final is None or job_id is None:
+        stats["errors"] += 1
+        stats["error_messages"].append("stream ended without a result")
+        return
+
+    stats["completed"] += 1
+    stats["job_latency_ms"].append((time.perf_counter() - started) * 1000)
+    stats["items_added"] += final["products_added"]
+    stats["items_failed"] += len(final.get("failed_items", []))
+    try:
+        trace = requests.get(f"{base_url}/jobs/{job_id}/trace", timeout=30).json()
+    except Exception as e:
+        stats["error_messages"].append(f"trace of {job_id}: {e}")
+        return
+    queued_us = 0.0
+    for event in trace.get("traceEvents", []):
+        if event.get("ph") != "X":
+            continue
+        if event["name"] == "queued":
+            queued_us += event["dur"]
+        elif event["cat"] == "item":
+            stats["item_latency_ms"].append(event["dur"] / 1000)
+    stats["queue_wait_ms"].append(queued_us / 1000)
+
+
+async def run_replay(args, entries) -> dict:
+    base_url = f"http://127.0.0.1:{args.port}"
+    stats = {
+        "job_latency_ms": [], "queue_wait_ms": [], "item_latency_ms": [],
+        "completed": 0, "rejected": 0, "errors": 0, "items_added": 0, "items_failed": 0,
+        "error_messages": [],
+    }
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=min(MAX_CLIENT_THREADS, max(1, len(entries))))
+    first_arrival = entries[0]["t"]
+
+    async def replay_at(entry: dict):
+        await asyncio.sleep((entry["t"] - first_arrival) / args.speedup)
+        await loop.run_in_executor(executor, replay_basket, base_url, entry, stats)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(replay_at(entry) for entry in entries))
+    stats["duration_s"] = time.perf_counter() - started
+    executor.shutdown(wait=False)
+    return stats
+
+
+def build_report(args, entries, stats: dict) -> dict:
+    duration = stats["duration_s"]
+    items = stats["items_added"] + stats["items_failed"]
+    return {
+        "trace": args.trace,
+        "baskets": len(entries),
+        "speedup": args.speedup,
+        "devices_per_type": args.devices,
+        "recorded_span_s": round(entries[-1]["t"] - entries[0]["t"], 1),
+        "duration_s": round(duration, 2),
+        "jobs_per_minute": round(stats["completed"] / duration * 60, 1) if duration else 0.0,
+        "items_per_minute": round(items / duration * 60, 1) if duration else 0.0,
+        "completed": stats["completed"],
+        "rejected": stats["rejected"],
+        "errors": stats["errors"],
+        "items": {"added": stats["items_added"], "failed": stats["items_failed"]},
+        "queue_wait_ms": summarize(stats["queue_wait_ms"]),
+        "job_latency_ms": summarize(stats["job_latency_ms"]),
+        "item_latency_ms": summarize(stats["item_latency_ms"]),
+        "sample_errors": stats["error_messages"][:5],
+    }
+
+
+def print_report(report: dict):
+    print("=" * 60)
+    print("TRAFFIC REPLAY REPORT")
+    print("=" * 60)
+    print(f"Trace: {report['trace']}  Baskets: {report['baskets']}  Speed-up: {report['speedup']}x")
+    print(f"Recorded over {report['recorded_span_s']}s, replayed in {report['duration_s']}s "
+          f"on {report['devices_per_type']} fake device(s) per type")
+    print(f"Throughput: {report['jobs_per_minute']} jobs/min, {report['items_per_minute']} items/min")
+    print(f"Completed: {report['completed']}  Rejected: {report['rejected']}  Errors: {report['errors']}  "
+          f"Items added/failed: {report['items']['added']}/{report['items']['failed']}")
+    print("-" * 60)
+    print(f"{'Metric':<28}{'count':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    rows = [
+        ("Queue wait (ms)", report["queue_wait_ms"]),
+        ("Job latency (ms)", report["job_latency_ms"]),
+        ("Item latency (ms)", report["item_latency_ms"]),
+    ]
+    for label, summary in rows:
+        if summary["count"]:
+            print(f"{label:<28}{summary['count']:>7}{summary['p50']:>9}{summary['p95']:>9}"
+                  f"{summary['p99']:>9}{summary['max']:>9}")
+        else:
+            print(f"{label:<28}{0:>7}")
+    for message in report["sample_errors"]:
+        print(f"  ✗ {message}")
+    print("=" * 60)
+
+
+def main():
+    args = parse_args()
+    if args.speedup <= 0:
+        print("--speedup must be positive")
+        sys.exit(2)
+
+    configure_replay_environment(args)
+
+    from src.main import app
+    from src.traffic import load_trace
+
+    entries = load_trace(args.trace, args.limit)
+    if not entries:
+        print(f"No baskets in {args.trace}")
+        sys.exit(1)
+
+    if not args.verbose:
+        logging.getLogger("src").setLevel(logging.WARNING)
+    server, thread = start_server(app, args.port)
+    try:
+        stats = asyncio.run(run_replay(args, entries))
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+    report = build_report(args, entries, stats)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\nReplay interrupted by user")
+        sys.exit(1)
@@ -1,2 +1,7 @@
 # Backend source package
+import logging
 
+from .logs import JobLevelLogger
+
+# Before any module of the package creates its logger (at import), so all of them follow job levels
+logging.setLoggerClass(JobLevelLogger)
@@ -0,0 +1,215 @@
+"""
+Account affinity
+Which Albert Heijn account a user's baskets go to, which account each device's app is logged
+into, and the logout/login flow used when the scheduler has to switch a device to another account
+"""
+
+import json
+import logging
+import os
+import threading
+from typing import Dict, Optional
+from appium.webdriver.common.appiumby import AppiumBy
+from .ah_automation import pause, recover_to_search, type_text
+from .config import ACCOUNTS_PATH, AH_ACCOUNT_CREDENTIALS, AH_USER_ACCOUNTS
+
+logger = logging.getLogger(__name__)
+
+# Budget of one switch (logout, login and the way back to the search screen)
+ACCOUNT_SWITCH_TIMEOUT = 120.0
+
+# Profile tab, where the app shows the logged-in account
+PROFILE_TAB_SELECTORS = [
+    (AppiumBy.ACCESSIBILITY_ID, "Profiel"),
+    (AppiumBy.ACCESSIBILITY_ID, "Mijn AH"),
+    (AppiumBy.XPATH, "//XCUIElementTypeButton[@name='Profiel' or @name='Mijn AH']"),
+    (AppiumBy.ID, "nl.ah.app:id/profile"),
+    (AppiumBy.XPATH, "//android.widget.Button[@content-desc='Profiel' or @content-desc='Mijn AH']"),
+]
+
+# Logout button on the profile screen (only shown while logged in)
+LOGOUT_SELECTORS = [
+    (AppiumBy.ACCESSIBILITY_ID, "Uitloggen"),
+    (AppiumBy.XPATH, "//XCUIElementTypeButton[@name='Uitloggen' or @name='Log out']"),
+    (AppiumBy.ID, "nl.ah.app:id/logout"),
+    (AppiumBy.XPATH, "//android.widget.Button[@text='Uitloggen' or @content-desc='Uitloggen']"),
+]
+
+# Confirmation some app versions ask for after tapping logout
+LOGOUT_CONFIRM_SELECTORS = [
+    (AppiumBy.XPATH, "//XCUIElementTypeAlert//XCUIElementTypeButton[@name='Uitloggen']"),
+    (AppiumBy.ID, "android:id/button1"),
+]
+
+# Login button on the profile screen (logged out) and submit button of the login form
+LOGIN_BUTTON_SELECTORS = [
+    (AppiumBy.ACCESSIBILITY_ID, "Inloggen"),
+    (AppiumBy.XPATH, "//XCUIElementTypeButton[@name='Inloggen' or @name='Log in']"),
+    (AppiumBy.ID, "nl.ah.app:id/login"),
+    (AppiumBy.XPATH, "//android.widget.Button[@text='Inloggen' or @content-desc='Inloggen']"),
+]
+
+EMAIL_FIELD_SELECTORS = [
+    (AppiumBy.ACCESSIBILITY_ID, "E-mailadres"),
+    (AppiumBy.XPATH, "//XCUIElementTypeTextField"),
+    (AppiumBy.ID, "nl.ah.app:id/email"),
+    (AppiumBy.XPATH, "//android.widget.EditText[@password='false']"),
+]
+
+PASSWORD_FIELD_SELECTORS = [
+    (AppiumBy.ACCESSIBILITY_ID, "Wachtwoord"),
+    (AppiumBy.XPATH, "//XCUIElementTypeSecureTextField"),
+    (AppiumBy.ID, "nl.ah.app:id/password"),
+    (AppiumBy.XPATH, "//android.widget.EditText[@password='true']"),
+]
+
+
+class AccountSwitchFailed(Exception):
+    """A device could not be logged into the account a job needs"""
+
+
+def _load_json_setting(name: str, value: str) -> dict:
+    if not value.strip():
+        return {}
+    try:
+        return json.loads(value)
+    except Exception as e:
+        logger.error("Invalid %s configuration, ignoring it: %s", name, e)
+        return {}
+
+
+_user_accounts = _load_json_setting("AH_USER_ACCOUNTS", AH_USER_ACCOUNTS)
+_credentials = _load_json_setting("AH_ACCOUNT_CREDENTIALS", AH_ACCOUNT_CREDENTIALS)
+
+
+def account_for_user(user_id: str) -> Optional[str]:
+    """Account a user's baskets go to (None: whichever account the device is logged into)"""
+    return _user_accounts.get(user_id)
+
+
+def can_switch_to(account: str) -> bool:
+    """Whether a device may be logged into this account (its credentials are configured)"""
+    return account in _credentials
+
+
+class DeviceAccounts:
+    """
+    Account each device was last logged into by a switch, persisted to disk
+
+    Read on every lookup (the file is tiny), so worker processes taking over a device's lease
+    see switches made by the others.
+
+    Args:
+        path: JSON file mapping device id -> account (null while a switch is unfinished)
+    """
+
+    def __init__(self, path: str = ACCOUNTS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self) -> Dict[str, Optional[str]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.error("Could not load device accounts %s: %s", self.path, e)
+            return {}
+
+    def get(self, device_id: str, default: Optional[str] = None) -> Optional[str]:
+        """Recorded account of a device, or `default` (e.g. from AH_DEVICES) if none is recorded"""
+        with self._lock:
+            entries = self._read()
+        return entries[device_id] if device_id in entries else default
+
+    def set(self, device_id: str, account: Optional[str]):
+        with self._lock:
+            entries = self._read()
+            entries[device_id] = account
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(entries, f, indent=2, sort_keys=True)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                logger.error("Could not save device accounts %s: %s", self.path, e)
+
+
+device_accounts = DeviceAccounts()
+
+
+def _find_first(driver, selectors):
+    """First displayed element matching one of the locators, or None"""
+    for by, selector in selectors:
+        try:
+            element = driver.find_element(by, selector)
+            if element.is_displayed():
+                return element
+        except Exception:
+            continue
+    return None
+
+
+async def _tap_first(driver, selectors) -> bool:
+    element = _find_first(driver, selectors)
+    if element is None:
+        return False
+    element.click()
+    await pause(1)
+    return True
+
+
+def _fill(element, text: str):
+    element.click()
+    element.clear()
+    type_text(element, text, delay=0.02)
+
+
+async def switch_account(driver, device_type: str, account: str) -> bool:
+    """
+    Log the app out of its current account and into `account`, then return to the search screen
+
+    Meant to run under run_step: a miss (False) lets it dismiss an interrupt and start over,
+    which is safe because logging out is skipped when the app already is.
+
+    Returns:
+        bool: True once the profile screen shows the app logged in again
+    """
+    credentials = _credentials.get(account)
+    if not credentials:
+        logger.error("❌ No credentials configured for account %s", account)
+        return False
+
+    logger.info("👤 Switching account to %s", account)
+    if not await _tap_first(driver, PROFILE_TAB_SELECTORS):
+        logger.error("   ❌ Could not find the profile tab")
+        return False
+    if await _tap_first(driver, LOGOUT_SELECTORS):
+        await _tap_first(driver, LOGOUT_CONFIRM_SELECTORS)
+    if not await _tap_first(driver, LOGIN_BUTTON_SELECTORS):
+        logger.error("   ❌ Could not find the login button")
+        return False
+
+    await pause(1)
+    email_field = _find_first(driver, EMAIL_FIELD_SELECTORS)
+    password_field = _find_first(driver, PASSWORD_FIELD_SELECTORS)
+    if email_field is None or password_field is None:
+        logger.error("   ❌ Could not find the login form")
+        return False
+    _fill(email_field, credentials.get("email", account))
+    _fill(password_field, credentials.get("password", ""))
+    if not await _tap_first(driver, LOGIN_BUTTON_SELECTORS):
+        logger.error("   ❌ Could not submit the login form")
+        return False
+    await pause(2)
+
+    # Logged in when the profile screen offers to log out again
+    await _tap_first(driver, PROFILE_TAB_SELECTORS)
+    if _find_first(driver, LOGOUT_SELECTORS) is None:
+        logger.error("   ❌ Login as %s did not succeed", account)
+        return False
+    logger.info("   ✅ Logged in as %s", account)
+    await recover_to_search(driver, device_type)
+    return True
@@ -12,9 +12,128 @@ from appium.webdriver.common.appiumby import AppiumBy
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from .config import (
+    AH_SLEEP_SCALE,
+    RANKING_ENABLED,
+    ITEM_TIMEOUT,
+    STEP_TIMEOUT,
+    STEP_RETRIES,
+    RECOVERY_ENABLED,
+    RECOVERY_TIMEOUT,
+    SEARCH_DEEP_LINK,
+    SUGGESTIONS_ENABLED,
+)
+from .artifacts import capture_failure
+from .context import current_device_id, current_item, current_user_id
+from .health import command_tally
+from .interaction import forget_window_size, tap_element, tap_rect
+from .interrupts import dismiss_interrupts
+from .metrics import metrics
+from .profiling import carry_profile
+from .ranking import choose_result, choose_suggestion, commit_choice, discard_choice, remember_choice
+from .recovery import is_search_screen, open_deep_link, restart_app
+from .replay import ReplayStep, commit_recording, discard_recording, forget_session as forget_replay
+from .resilience import SessionLost, current_deadline, deadline_scope, is_device_error, is_transient, run_step
+from .tracing import span
+from .snapshot import take_snapshot
+from .timing import item_timing, note_path, skip_step, timing_model
 
 logger = logging.getLogger(__name__)
 
+# Locator lists, tried in order (iOS and Android entries side by side). Module level so
+# find_selectors_guide.py --batch can check them against a snapshot of each screen.
+
+# Search tab/button on the home screen
+SEARCH_BUTTON_SELECTORS = [
+    # iOS selectors
+    (AppiumBy.ACCESSIBILITY_ID, "Zoek"),
+    (AppiumBy.ACCESSIBILITY_ID, "Search"),
+    (AppiumBy.XPATH, "//XCUIElementTypeButton[@name='Zoek' or @name='Search']"),
+    (AppiumBy.XPATH, "//XCUIElementTypeButton[contains(@label, 'Zoek')]"),
+    # Android selectors
+    (AppiumBy.ID, "nl.ah.app:id/search"),
+    (AppiumBy.XPATH, "//android.widget.Button[@content-desc='Zoek' or @content-desc='Search']"),
+    (AppiumBy.XPATH, "//android.widget.ImageButton[@content-desc='Zoek']"),
+]
+
+# Search box on the search screen
+SEARCH_FIELD_SELECTORS = [
+    # iOS selectors
+    (AppiumBy.ACCESSIBILITY_ID, "search_field"),
+    (AppiumBy.ACCESSIBILITY_ID, "Zoek"),
+    (AppiumBy.XPATH, "//XCUIElementTypeSearchField"),
+    (AppiumBy.XPATH, "//XCUIElementTypeTextField[@placeholder='Zoek' or @placeholder='Search']"),
+    (AppiumBy.XPATH, "//XCUIElementTypeTextField[contains(@name, 'Zoek')]"),
+    # Android selectors
+    (AppiumBy.ID, "nl.ah.app:id/search_input"),
+    (AppiumBy.ID, "nl.ah.app:id/search_box"),
+    (AppiumBy.XPATH, "//android.widget.EditText[@hint='Zoek' or @hint='Search']"),
+    (AppiumBy.XPATH, "//android.widget.EditText[contains(@content-desc, 'Zoek')]"),
+    (AppiumBy.CLASS_NAME, "android.widget.EditText"),
+]
+
+# Submit button next to the search box (used when the Enter key does not submit)
+SEARCH_SUBMIT_SELECTORS = [
+    (AppiumBy.ACCESSIBILITY_ID, "Zoeken"),
+    (AppiumBy.ACCESSIBILITY_ID, "Search"),
+    (AppiumBy.XPATH, "//XCUIElementTypeButton[@name='Zoeken' or @name='Search']"),
+    (AppiumBy.ID, "nl.ah.app:id/search_button"),
+]
+
+# Product cells on the result list ("[1]" picks the first match)
+PRODUCT_SELECTORS = [
+    # iOS selectors
+    (AppiumBy.XPATH, "//XCUIElementTypeCell[1]"),
+    (AppiumBy.XPATH, "//XCUIElementTypeCell[@visible='true'][1]"),
+    (AppiumBy.ACCESSIBILITY_ID, "product_card"),
+    (AppiumBy.XPATH, "//XCUIElementTypeStaticText[contains(@name, 'product')]/ancestor::XCUIElementTypeCell[1]"),
+    # Android selectors
+    (AppiumBy.ID, "nl.ah.app:id/product_card"),
+    (AppiumBy.XPATH, "//android.widget.RecyclerView/android.view.ViewGroup[1]"),
+    (AppiumBy.XPATH, "//android.view.ViewGroup[contains(@content-desc, 'product')][1]"),
+    (AppiumBy.CLASS_NAME, "android.widget.FrameLayout"),
+]
+
+# 'Voeg toe' button on the product detail page
+ADD_BUTTON_SELECTORS = [
+    # iOS selectors - try specific button first
+    (AppiumBy.ACCESSIBILITY_ID, "Voeg toe"),
+    (AppiumBy.ACCESSIBILITY_ID, "Voeg toe:"),
+    (AppiumBy.XPATH, "//XCUIElementTypeButton[contains(@name, 'Voeg toe')]"),
+    (AppiumBy.XPATH, "//XCUIElementTypeButton[contains(@label, 'Voeg toe')]"),
+    (AppiumBy.XPATH, "//XCUIElementTypeButton[contains(@name, 'toevoegen')]"),
+    # Android selectors
+    (AppiumBy.ID, "nl.ah.app:id/add_to_basket"),
+    (AppiumBy.ID, "nl.ah.app:id/add_button"),
+    (AppiumBy.XPATH, "//android.widget.Button[contains(@text, 'Voeg toe')]"),
+    (AppiumBy.XPATH, "//android.widget.Button[contains(@content-desc, 'Voeg toe')]"),
+]
+
+# '+' button shown on the detail page once the product is in the basket
+PLUS_BUTTON_SELECTORS = [
+    (AppiumBy.ACCESSIBILITY_ID, "+"),
+    (AppiumBy.XPATH, "//XCUIElementTypeButton[@name='+' or @label='+']"),
+    (AppiumBy.XPATH, "//android.widget.Button[@content-desc='+' or @text='+']"),
+    (AppiumBy.ID, "nl.ah.app:id/increment"),
+]
+
+# Back button of the detail page (iOS, when driver.back() fails)
+BACK_BUTTON_SELECTORS = [
+    (AppiumBy.ACCESSIBILITY_ID, "Back"),
+    (AppiumBy.XPATH, "//XCUIElementTypeButton[@name='Back']"),
+    (AppiumBy.XPATH, "//XCUIElementTypeNavigationBar//XCUIElementTypeButton[1]"),
+]
+
+
+async def pause(seconds):
+    """
+    Wait for the app to settle
+    
+    Args:
+        seconds: Nominal delay, scaled by AH_SLEEP_SCALE
+    """
+    await asyncio.sleep(seconds * AH_SLEEP_SCALE)
+
 
 def type_text(element, text, delay=0.05):
     """
@@ -27,34 +146,73 @@ def type_text(element, text, delay=0.05):
     """
     for char in text:
         element.send_keys(char)
-        time.sleep(delay)
+        time.sleep(delay * AH_SLEEP_SCALE)
 
 
-async def scroll_into_view(driver, element):
+async def open_search_screen(driver) -> bool:
     """
-    Scroll element into view (mobile app equivalent)
+    Tap the search button/tab so the search box is shown (app should already be open)
     
-    Args:
-        driver: Appium WebDriver
-        element: WebElement to scroll into view
+    Returns:
+        bool: True if a search button was found and tapped
     """
     try:
-        # For iOS
-        driver.execute_script("mobile: scroll", {"direction": "down", "element": element})
-    except:
-        try:
-            # For Android
-            driver.execute_script("mobile: scroll", {"direction": "down", "element": element})
-        except:
-            # Fallback: try to scroll using touch actions
+        for by, selector in SEARCH_BUTTON_SELECTORS:
             try:
-                location = element.location
-                size = element.size
-                x = location['x'] + size['width'] / 2
-                y = location['y'] + size['height'] / 2
-                driver.execute_script("mobile: scroll", {"direction": "down", "x": x, "y": y})
+                search_button = driver.find_element(by, selector)
+                if search_button.is_displayed():
+                    logger.debug("   Found search button: %s", selector)
+                    tap_element(driver, search_button)
+                    await pause(1)
+                    return True
             except:
-                pass
+                continue
+        
+        logger.debug("   Search button not found, trying to find search box directly")
+    except Exception as e:
+        logger.debug("   Could not find search button: %s", e)
+    return False
+
+
+# Sessions whose search step opened the product page from a suggestion (select is skipped)
+_opened_from_suggestion = set()
+
+
+def forget_session(driver):
+    """Drop the per-session state kept by the automation helpers (call when a session closes)"""
+    _opened_from_suggestion.discard(driver.session_id)
+    discard_choice(driver)
+    forget_replay(driver)
+    forget_window_size(driver)
+
+
+async def tap_suggestion(driver, item_name) -> bool:
+    """
+    Tap the search suggestion matching the item, read from one snapshot
+
+    Returns:
+        bool: True if a suggestion was tapped (the product page is opening); False if none
+        matched closely enough and the search should be submitted
+    """
+    try:
+        snapshot = take_snapshot(driver)
+        user_id = current_user_id.get()
+        best = choose_suggestion(snapshot, item_name, user_id) if snapshot else None
+    except Exception as e:
+        if is_transient(e):
+            raise
+        logger.debug("   Could not read suggestions: %s", e)
+        best = None
+    if not best:
+        note_path("miss")
+        return False
+    logger.info("   Suggestion: '%s' (score %.2f)", best.title, best.score)
+    tap_rect(driver, best.rect)
+    note_path("suggestion")
+    if best.chosen_on_match:
+        remember_choice(driver, user_id, item_name, best.title)
+    _opened_from_suggestion.add(driver.session_id)
+    return True
 
 
 async def search_item(driver, item_name, device_type="ios", websocket=None):
@@ -78,86 +236,44 @@ async def search_item(driver, item_name, device_type="ios", websocket=None):
                 "current_product": item_name
             })
         
-        logger.info(f"🔍 Searching for: {item_name}")
+        logger.info("🔍 Searching for: %s", item_name)
+        _opened_from_suggestion.discard(driver.session_id)
         
         # Navigate to home/search screen (app should already be open)
-        # Try to find search button/tab first
-        try:
-            # Look for search icon/button to open search
-            search_selectors = [
-                # iOS selectors
-                (AppiumBy.ACCESSIBILITY_ID, "Zoek"),
-                (AppiumBy.ACCESSIBILITY_ID, "Search"),
-                (AppiumBy.XPATH, "//XCUIElementTypeButton[@name='Zoek' or @name='Search']"),
-                (AppiumBy.XPATH, "//XCUIElementTypeButton[contains(@label, 'Zoek')]"),
-                # Android selectors
-                (AppiumBy.ID, "nl.ah.app:id/search"),
-                (AppiumBy.XPATH, "//android.widget.Button[@content-desc='Zoek' or @content-desc='Search']"),
-                (AppiumBy.XPATH, "//android.widget.ImageButton[@content-desc='Zoek']"),
-            ]
-            
-            search_button_found = False
-            for by, selector in search_selectors:
+        await open_search_screen(driver)
+        
+        # Find search box
+        search_box = None
+        search_box_step = ReplayStep(driver, "search_field")
+        if await search_box_step.tap():
+            # Tapping the cached rect focuses the field
+            search_box = driver.switch_to.active_element
+        else:
+            for by, selector in SEARCH_FIELD_SELECTORS:
                 try:
-                    search_button = driver.find_element(by, selector)
-                    if search_button.is_displayed():
-                        logger.info(f"   Found search button: {selector}")
-                        await scroll_into_view(driver, search_button)
-                        time.sleep(0.5)
-                        search_button.click()
-                        search_button_found = True
-                        await asyncio.sleep(1)
+                    search_box = driver.find_element(by, selector)
+                    if search_box.is_displayed():
+                        logger.debug("   Found search box: %s", selector)
                         break
                 except:
                     continue
-            
-            if not search_button_found:
-                logger.info("   Search button not found, trying to find search box directly")
-        except Exception as e:
-            logger.info(f"   Could not find search button: {e}")
-        
-        # Find search box
-        search_selectors = [
-            # iOS selectors
-            (AppiumBy.ACCESSIBILITY_ID, "search_field"),
-            (AppiumBy.ACCESSIBILITY_ID, "Zoek"),
-            (AppiumBy.XPATH, "//XCUIElementTypeSearchField"),
-            (AppiumBy.XPATH, "//XCUIElementTypeTextField[@placeholder='Zoek' or @placeholder='Search']"),
-            (AppiumBy.XPATH, "//XCUIElementTypeTextField[contains(@name, 'Zoek')]"),
-            # Android selectors
-            (AppiumBy.ID, "nl.ah.app:id/search_input"),
-            (AppiumBy.ID, "nl.ah.app:id/search_box"),
-            (AppiumBy.XPATH, "//android.widget.EditText[@hint='Zoek' or @hint='Search']"),
-            (AppiumBy.XPATH, "//android.widget.EditText[contains(@content-desc, 'Zoek')]"),
-            (AppiumBy.CLASS_NAME, "android.widget.EditText"),
-        ]
-        
-        search_box = None
-        for by, selector in search_selectors:
+
+            if not search_box:
+                logger.error("❌ Could not find search box")
+                return False
+
+            rect = search_box.rect
+            search_box_step.record(search_box, rect)
+
+            # Tap search box (scrolled to only if it is off screen)
             try:
-                search_box = driver.find_element(by, selector)
-                if search_box.is_displayed():
-                    logger.info(f"   Found search box: {selector}")
-                    break
-            except:
-                continue
-        
-        if not search_box:
-            logger.error("❌ Could not find search box")
-            return False
-        
-        # Scroll search box into view
-        await scroll_into_view(driver, search_box)
-        await asyncio.sleep(0.5)
-        
-        # Click search box
-        try:
-            search_box.click()
-        except:
-            # Try using JavaScript click
-            driver.execute_script("mobile: tap", {"x": search_box.location['x'], "y": search_box.location['y']})
-        
-        await asyncio.sleep(0.5)
+                tap_element(driver, search_box, rect)
+            except Exception as e:
+                if is_transient(e):
+                    raise
+                search_box.click()
+
+        await pause(0.5)
         
         # Clear search box thoroughly
         try:
@@ -176,15 +292,21 @@ async def search_item(driver, item_name, device_type="ios", websocket=None):
                     search_box.send_keys("\ue003")  # Delete
                 else:
                     search_box.send_keys("\ue017")  # Backspace
-                time.sleep(0.01)
+                time.sleep(0.01 * AH_SLEEP_SCALE)
         except Exception as e:
-            logger.info(f"   Error clearing search box: {e}")
+            logger.debug("   Error clearing search box: %s", e)
         
         # Type with human-like delays
-        logger.info(f"   Typing: {item_name}")
+        logger.debug("   Typing: %s", item_name)
         type_text(search_box, item_name, delay=0.05)
         
-        await asyncio.sleep(0.5)
+        await pause(0.5)
+        
+        # A suggestion shown while typing opens the product without the results page
+        if SUGGESTIONS_ENABLED and await tap_suggestion(driver, item_name):
+            await pause(2)  # Wait for product page to load
+            logger.info("   ✅ Opened suggestion")
+            return True
         
         # Submit search (press enter or search button)
         try:
@@ -196,13 +318,7 @@ async def search_item(driver, item_name, device_type="ios", websocket=None):
         except:
             # Try finding and clicking search button
             try:
-                search_button_selectors = [
-                    (AppiumBy.ACCESSIBILITY_ID, "Zoeken"),
-                    (AppiumBy.ACCESSIBILITY_ID, "Search"),
-                    (AppiumBy.XPATH, "//XCUIElementTypeButton[@name='Zoeken' or @name='Search']"),
-                    (AppiumBy.ID, "nl.ah.app:id/search_button"),
-                ]
-                for by, selector in search_button_selectors:
+                for by, selector in SEARCH_SUBMIT_SELECTORS:
                     try:
                         search_btn = driver.find_element(by, selector)
                         search_btn.click()
@@ -212,24 +328,27 @@ async def search_item(driver, item_name, device_type="ios", websocket=None):
             except:
                 pass
         
-        await asyncio.sleep(2)  # Wait for search results
+        await pause(2)  # Wait for search results
         
         logger.info("   ✅ Search submitted")
         return True
         
     except Exception as e:
-        logger.error(f"❌ Error searching: {e}")
+        if is_transient(e):
+            raise
+        logger.error("❌ Error searching: %s", e)
         return False
 
 
-async def click_first_product(driver, device_type="ios", websocket=None):
+async def click_first_product(driver, device_type="ios", websocket=None, query=None):
     """
-    Click on the first product to go to its detail page
+    Click on the best-matching product (or the first one) to go to its detail page
     
     Args:
         driver: Appium WebDriver
         device_type: "ios" or "android"
         websocket: Optional WebSocket for real-time updates
+        query: Search query, used to rank the visible results
     
     Returns:
         bool: True if product was clicked, False otherwise
@@ -238,27 +357,42 @@ async def click_first_product(driver, device_type="ios", websocket=None):
         if websocket:
             await websocket.send_json({
                 "status": "selecting_product",
-                "message": "Clicking first product...",
+                "message": "Selecting product...",
             })
         
-        logger.info("   🖱️  Clicking first product...")
-        
+        logger.debug("   🖱️  Selecting product...")
+
+        # Rank all visible results from one snapshot and tap the best match
+        if RANKING_ENABLED and query:
+            try:
+                snapshot = take_snapshot(driver)
+                user_id = current_user_id.get()
+                best = choose_result(snapshot, query, user_id) if snapshot else None
+                if best:
+                    logger.info("   Best match: '%s' %s %s (score %.2f)", best.title, best.size, best.price, best.score)
+                    tap_rect(driver, best.rect)
+                    note_path("ranked")
+                    if best.chosen_on_match:
+                        remember_choice(driver, user_id, query, best.title)
+                    logger.info("   ✅ Clicked product")
+                    await pause(2)  # Wait for product page to load
+                    return True
+            except Exception as e:
+                # Only a ranking problem falls back to the selectors; the driver's errors are the step's
+                if is_transient(e) or is_device_error(e):
+                    raise
+                logger.info("   Could not rank results, using selectors: %s", e)
+
+        # Without a ranked pick, the first result cell sits at the same spot on a known results screen
+        result_cell_step = ReplayStep(driver, "result_cell")
+        if await result_cell_step.tap():
+            logger.info("   ✅ Clicked product")
+            await pause(2)  # Wait for product page to load
+            return True
+
         # Try multiple selectors for product links
-        product_selectors = [
-            # iOS selectors
-            (AppiumBy.XPATH, "//XCUIElementTypeCell[1]"),
-            (AppiumBy.XPATH, "//XCUIElementTypeCell[@visible='true'][1]"),
-            (AppiumBy.ACCESSIBILITY_ID, "product_card"),
-            (AppiumBy.XPATH, "//XCUIElementTypeStaticText[contains(@name, 'product')]/ancestor::XCUIElementTypeCell[1]"),
-            # Android selectors
-            (AppiumBy.ID, "nl.ah.app:id/product_card"),
-            (AppiumBy.XPATH, "//android.widget.RecyclerView/android.view.ViewGroup[1]"),
-            (AppiumBy.XPATH, "//android.view.ViewGroup[contains(@content-desc, 'product')][1]"),
-            (AppiumBy.CLASS_NAME, "android.widget.FrameLayout"),
-        ]
-        
         first_product = None
-        for by, selector in product_selectors:
+        for by, selector in PRODUCT_SELECTORS:
             try:
                 if by == AppiumBy.XPATH and "[1]" in selector:
                     # For XPath with [1], try to get first element
@@ -266,12 +400,12 @@ async def click_first_product(driver, device_type="ios", websocket=None):
                     if products and len(products) > 0:
                         first_product = products[0]
                         if first_product.is_displayed():
-                            logger.info(f"   Found product using selector: {selector}")
+                            logger.debug("   Found product using selector: %s", selector)
                             break
                 else:
                     first_product = driver.find_element(by, selector)
                     if first_product.is_displayed():
-                        logger.info(f"   Found product using selector: {selector}")
+                        logger.debug("   Found product using selector: %s", selector)
                         break
             except:
                 continue
@@ -279,39 +413,31 @@ async def click_first_product(driver, device_type="ios", websocket=None):
         if not first_product:
             logger.error("   ❌ Could not find product link")
             return False
-        
-        # Scroll to product
-        await scroll_into_view(driver, first_product)
-        await asyncio.sleep(0.5)
-        
-        # Click product
+
+        rect = first_product.rect
+        result_cell_step.record(first_product, rect)
+
+        # Tap product (scrolled to only if it is off screen)
         try:
+            tap_element(driver, first_product, rect)
+        except Exception as e:
+            if is_transient(e):
+                raise
             first_product.click()
-        except:
-            # Try using JavaScript click
-            try:
-                location = first_product.location
-                size = first_product.size
-                x = location['x'] + size['width'] / 2
-                y = location['y'] + size['height'] / 2
-                driver.execute_script("mobile: tap", {"x": x, "y": y})
-            except:
-                # Try using touch action
-                from appium.webdriver.common.touch_action import TouchAction
-                action = TouchAction(driver)
-                action.tap(first_product).perform()
         
         logger.info("   ✅ Clicked product")
-        await asyncio.sleep(2)  # Wait for product page to load
+        await pause(2)  # Wait for product page to load
         
         return True
         
     except Exception as e:
-        logger.error(f"   ❌ Error clicking product: {e}")
+        if is_transient(e) or is_device_error(e):
+            raise
+        logger.error("   ❌ Error clicking product: %s", e)
         return False
 
 
-async def click_voeg_toe_button(driver, device_type="ios", quantity=1, websocket=None):
+async def click_voeg_toe_button(driver, device_type="ios", quantity=1, websocket=None, interrupt_retries=1):
     """
     Click the 'Voeg toe' (+) button on product detail page
     
@@ -320,6 +446,7 @@ async def click_voeg_toe_button(driver, device_type="ios", quantity=1, websocket
         device_type: "ios" or "android"
         quantity: Number of times to click the button (default: 1)
         websocket: Optional WebSocket for real-time updates
+        interrupt_retries: Times to look again after dismissing a popup that hid the button
     
     Returns:
         bool: True if button was clicked, False otherwise
@@ -331,105 +458,104 @@ async def click_voeg_toe_button(driver, device_type="ios", quantity=1, websocket
                 "message": "Looking for 'Voeg toe' button...",
             })
         
-        logger.info("   🔍 Looking for 'Voeg toe' button...")
-        await asyncio.sleep(2)  # Wait for page to load
+        logger.debug("   🔍 Looking for 'Voeg toe' button...")
+        await pause(2)  # Wait for page to load
         
         # Find all buttons and filter carefully
-        logger.info("   🔍 Searching through all buttons...")
+        logger.debug("   🔍 Searching through all buttons...")
         
         # Try multiple strategies to find the add button
-        button_selectors = [
-            # iOS selectors - try specific button first
-            (AppiumBy.ACCESSIBILITY_ID, "Voeg toe"),
-            (AppiumBy.ACCESSIBILITY_ID, "Voeg toe:"),
-            (AppiumBy.XPATH, "//XCUIElementTypeButton[contains(@name, 'Voeg toe')]"),
-            (AppiumBy.XPATH, "//XCUIElementTypeButton[contains(@label, 'Voeg toe')]"),
-            (AppiumBy.XPATH, "//XCUIElementTypeButton[contains(@name, 'toevoegen')]"),
-            # Android selectors
-            (AppiumBy.ID, "nl.ah.app:id/add_to_basket"),
-            (AppiumBy.ID, "nl.ah.app:id/add_button"),
-            (AppiumBy.XPATH, "//android.widget.Button[contains(@text, 'Voeg toe')]"),
-            (AppiumBy.XPATH, "//android.widget.Button[contains(@content-desc, 'Voeg toe')]"),
-        ]
-        
         add_button = None
-        for by, selector in button_selectors:
-            try:
-                add_button = driver.find_element(by, selector)
-                if add_button.is_displayed():
-                    logger.info(f"   ✅ Found add-to-cart button: {selector}")
-                    break
-            except:
-                continue
+        add_button_step = ReplayStep(driver, "add_button")
+        if not await add_button_step.tap():
+            for by, selector in ADD_BUTTON_SELECTORS:
+                try:
+                    add_button = driver.find_element(by, selector)
+                    if add_button.is_displayed():
+                        logger.debug("   ✅ Found add-to-cart button: %s", selector)
+                        break
+                except:
+                    continue
         
-        # If not found by specific selector, try filtering all buttons
-        if not add_button:
-            logger.info("   🔍 Searching through all buttons...")
-            try:
-                all_buttons = driver.find_elements(AppiumBy.TAG_NAME, "button")
-                logger.info(f"   Found {len(all_buttons)} total buttons")
+            # If not found by specific selector, try filtering all buttons
+            if not add_button:
+                logger.debug("   🔍 Searching through all buttons...")
+                try:
+                    all_buttons = driver.find_elements(AppiumBy.TAG_NAME, "button")
+                    logger.debug("   Found %d total buttons", len(all_buttons))
                 
-                for idx, button in enumerate(all_buttons):
-                    try:
-                        if device_type.lower() == "ios":
-                            button_text = (button.get_attribute('name') or '').lower()
-                            aria_label = (button.get_attribute('label') or '').lower()
-                            button_info = f"{button_text} {aria_label}"
-                        else:
-                            button_text = (button.text or '').lower()
-                            aria_label = (button.get_attribute('content-desc') or '').lower()
-                            button_info = f"{button_text} {aria_label}"
+                    for idx, button in enumerate(all_buttons):
+                        try:
+                            if device_type.lower() == "ios":
+                                button_text = (button.get_attribute('name') or '').lower()
+                                aria_label = (button.get_attribute('label') or '').lower()
+                                button_info = f"{button_text} {aria_label}"
+                            else:
+                                button_text = (button.text or '').lower()
+                                aria_label = (button.get_attribute('content-desc') or '').lower()
+                                button_info = f"{button_text} {aria_label}"
                         
-                        # EXCLUDE favorite buttons explicitly
-                        exclude_keywords = ['favoriet', 'favorite', 'bewaar', 'save', 'hart', 'heart']
-                        if any(keyword in button_info for keyword in exclude_keywords):
-                            continue
+                            # EXCLUDE favorite buttons explicitly
+                            exclude_keywords = ['favoriet', 'favorite', 'bewaar', 'save', 'hart', 'heart']
+                            if any(keyword in button_info for keyword in exclude_keywords):
+                                continue
                         
-                        # Look for add-to-cart keywords
-                        add_keywords = ['voeg toe', 'toevoegen aan', 'in mandje', 'bestellen', 'add']
+                            # Look for add-to-cart keywords
+                            add_keywords = ['voeg toe', 'toevoegen aan', 'in mandje', 'bestellen', 'add']
                         
-                        # Check if it's an add-to-cart button
-                        if any(keyword in button_info for keyword in add_keywords):
-                            # Extra verification: should contain "voeg toe" pattern
-                            if 'voeg toe' in button_info:
-                                logger.info(f"   ✅ Found add-to-cart button #{idx}: '{button_info}'")
-                                add_button = button
-                                break
+                            # Check if it's an add-to-cart button
+                            if any(keyword in button_info for keyword in add_keywords):
+                                # Extra verification: should contain "voeg toe" pattern
+                                if 'voeg toe' in button_info:
+                                    logger.debug("   ✅ Found add-to-cart button #%d: '%s'", idx, button_info)
+                                    add_button = button
+                                    break
+                        except:
+                            continue
+                except Exception as e:
+                    logger.error("   Error searching buttons: %s", e)
+        
+            # Already in the basket: the page shows the quantity stepper instead, whose '+' adds one more
+            in_basket = False
+            if not add_button:
+                for by, selector in PLUS_BUTTON_SELECTORS:
+                    try:
+                        add_button = driver.find_element(by, selector)
+                        if add_button.is_displayed():
+                            in_basket = True
+                            logger.debug("   ✅ Product is in the basket already, using the '+' button")
+                            break
+                        add_button = None
                     except:
+                        add_button = None
                         continue
-            except Exception as e:
-                logger.error(f"   Error searching buttons: {e}")
-        
-        if not add_button:
-            logger.error("   ❌ Could not find 'Voeg toe' button")
-            return False
-        
-        # Scroll button into view
-        await scroll_into_view(driver, add_button)
-        await asyncio.sleep(0.5)
-        
-        # Click button
-        try:
-            add_button.click()
-        except:
-            # Try using JavaScript click
+            
+            if not add_button:
+                # Nothing was tapped yet, so looking again after a popup cannot add the product twice
+                if interrupt_retries > 0 and await dismiss_interrupts(driver):
+                    return await click_voeg_toe_button(driver, device_type, quantity, websocket,
+                                                       interrupt_retries - 1)
+                logger.error("   ❌ Could not find 'Voeg toe' button")
+                return False
+        
+            rect = add_button.rect
+            if not in_basket:
+                # The stepper is not where 'Voeg toe' is for products not in the basket yet
+                add_button_step.record(add_button, rect)
+            
+            # Tap button (scrolled to only if it is off screen)
             try:
-                location = add_button.location
-                size = add_button.size
-                x = location['x'] + size['width'] / 2
-                y = location['y'] + size['height'] / 2
-                driver.execute_script("mobile: tap", {"x": x, "y": y})
-            except:
-                # Try using touch action
-                from appium.webdriver.common.touch_action import TouchAction
-                action = TouchAction(driver)
-                action.tap(add_button).perform()
+                tap_element(driver, add_button, rect)
+            except Exception as e:
+                if is_transient(e):
+                    raise
+                add_button.click()
         
         logger.info("   ✅ Button clicked!")
         
         # If quantity > 1, click the button multiple times
         if quantity > 1:
-            await asyncio.sleep(1)  # Wait before clicking again
+            await pause(1)  # Wait before clicking again
             for i in range(quantity - 1):
                 try:
                     quantity_num = i + 2
@@ -438,24 +564,18 @@ async def click_voeg_toe_button(driver, device_type="ios", quantity=1, websocket
                             "status": "adding_to_basket",
                             "message": f"Adding quantity {quantity_num}/{quantity}...",
                         })
-                    logger.info(f"   Adding quantity {quantity_num}/{quantity}...")
+                    logger.debug("   Adding quantity %d/%d...", quantity_num, quantity)
                     
                     # Try clicking the same button again (might be a + button now)
                     try:
                         # First try to find if button has changed to a + button
-                        plus_selectors = [
-                            (AppiumBy.ACCESSIBILITY_ID, "+"),
-                            (AppiumBy.XPATH, "//XCUIElementTypeButton[@name='+' or @label='+']"),
-                            (AppiumBy.XPATH, "//android.widget.Button[@content-desc='+' or @text='+']"),
-                            (AppiumBy.ID, "nl.ah.app:id/increment"),
-                        ]
                         plus_button = None
-                        for by, selector in plus_selectors:
+                        for by, selector in PLUS_BUTTON_SELECTORS:
                             try:
                                 plus_button = driver.find_element(by, selector)
                                 if plus_button.is_displayed():
                                     plus_button.click()
-                                    logger.info(f"   Clicked + button for quantity {quantity_num}")
+                                    logger.debug("   Clicked + button for quantity %d", quantity_num)
                                     break
                             except:
                                 continue
@@ -464,59 +584,69 @@ async def click_voeg_toe_button(driver, device_type="ios", quantity=1, websocket
                             # Fallback: try clicking the same location (button might still be there)
                             try:
                                 add_button.click()
-                                logger.info(f"   Clicked add button again for quantity {quantity_num}")
+                                logger.debug("   Clicked add button again for quantity %d", quantity_num)
                             except:
                                 # Last resort: tap the same location
                                 try:
-                                    location = add_button.location
-                                    size = add_button.size
-                                    x = location['x'] + size['width'] / 2
-                                    y = location['y'] + size['height'] / 2
-                                    driver.execute_script("mobile: tap", {"x": x, "y": y})
-                                    logger.info(f"   Tapped button location for quantity {quantity_num}")
+                                    tap_rect(driver, add_button_step.rect or add_button.rect)
+                                    logger.debug("   Tapped button location for quantity %d", quantity_num)
                                 except Exception as tap_error:
-                                    logger.error(f"   Could not click button for quantity {quantity_num}: {tap_error}")
+                                    logger.error("   Could not click button for quantity %d: %s", quantity_num, tap_error)
                                     break
+                    except Exception as click_error:
+                        logger.error("   Error clicking for quantity %d: %s", quantity_num, click_error)
+                        break
                     
-                    await asyncio.sleep(1)  # Wait between clicks
+                    await pause(1)  # Wait between clicks
                 except Exception as e:
                     quantity_num = i + 2 if 'i' in locals() else quantity
-                    logger.error(f"   Error adding quantity {quantity_num}: {e}")
+                    logger.error("   Error adding quantity %d: %s", quantity_num, e)
                     break
         
-        await asyncio.sleep(2.5)  # Wait for item to be added
+        await pause(2.5)  # Wait for item to be added
         
         return True
         
     except Exception as e:
-        logger.error(f"   ❌ Error clicking button: {e}")
+        if is_transient(e):
+            raise
+        logger.error("   ❌ Error clicking button: %s", e)
         return False
 
 
-async def add_first_product_to_cart(driver, device_type="ios", quantity=1, websocket=None):
+async def add_first_product_to_cart(driver, device_type="ios", quantity=1, websocket=None, item_name=None):
     """
-    Navigate to first product and add it to cart
+    Navigate to the best-matching product and add it to cart
     
     Args:
         driver: Appium WebDriver
         device_type: "ios" or "android"
         quantity: Number of items to add (default: 1)
         websocket: Optional WebSocket for real-time updates
+        item_name: Searched item name, used to pick among the results
     
     Returns:
         bool: True if product was added, False otherwise
     """
     try:
-        # Step 1: Click first product to open detail page
-        if not await click_first_product(driver, device_type, websocket):
+        # Step 1: Click best-matching product to open detail page (unless a suggestion did)
+        if driver.session_id in _opened_from_suggestion:
+            _opened_from_suggestion.discard(driver.session_id)
+            skip_step("select", "suggestion")
+        elif not await run_step("select", click_first_product, driver, device_type, websocket,
+                                query=item_name, timeout=STEP_TIMEOUT, retries=min(1, STEP_RETRIES),
+                                on_miss=lambda: dismiss_interrupts(driver)):
             return False
         
         # Step 2: Click 'Voeg toe' button on detail page (with quantity)
-        if not await click_voeg_toe_button(driver, device_type, quantity, websocket):
+        # Not retried: a repeated tap could add the product twice (a popup hiding the button is
+        # handled inside the step, before anything is tapped)
+        if not await run_step("add", click_voeg_toe_button, driver, device_type, quantity, websocket,
+                              timeout=STEP_TIMEOUT + 5 * quantity):
             return False
         
         # Step 3: Go back to search results for next item
-        logger.info("   ⬅️  Going back to search results...")
+        logger.debug("   ⬅️  Going back to search results...")
         try:
             driver.back()
         except:
@@ -526,12 +656,7 @@ async def add_first_product_to_cart(driver, device_type="ios", quantity=1, webso
             else:
                 # iOS doesn't have back button, try finding back button
                 try:
-                    back_selectors = [
-                        (AppiumBy.ACCESSIBILITY_ID, "Back"),
-                        (AppiumBy.XPATH, "//XCUIElementTypeButton[@name='Back']"),
-                        (AppiumBy.XPATH, "//XCUIElementTypeNavigationBar//XCUIElementTypeButton[1]"),
-                    ]
-                    for by, selector in back_selectors:
+                    for by, selector in BACK_BUTTON_SELECTORS:
                         try:
                             back_button = driver.find_element(by, selector)
                             back_button.click()
@@ -541,12 +666,12 @@ async def add_first_product_to_cart(driver, device_type="ios", quantity=1, webso
                 except:
                     pass
         
-        await asyncio.sleep(1)
+        await pause(1)
         
         return True
         
     except Exception as e:
-        logger.error(f"   ❌ Error adding product: {e}")
+        logger.error("   ❌ Error adding product: %s", e)
         return False
 
 
@@ -564,16 +689,94 @@ async def add_item(driver, item_name, device_type="ios", quantity=1, websocket=N
     Returns:
         bool: True if item was added, False otherwise
     """
-    logger.info(f"\n{'='*60}")
-    if await search_item(driver, item_name, device_type, websocket):
-        result = await add_first_product_to_cart(driver, device_type, quantity, websocket)
-        logger.info(f"{'='*60}\n")
+    if await run_step("search", search_item, driver, item_name, device_type, websocket,
+                      timeout=STEP_TIMEOUT, retries=STEP_RETRIES, on_miss=lambda: dismiss_interrupts(driver)):
+        result = await add_first_product_to_cart(driver, device_type, quantity, websocket, item_name=item_name)
+        if result:
+            commit_recording(driver)
+            commit_choice(driver)
+        else:
+            discard_recording(driver)
+            discard_choice(driver)
         return result
-    logger.info(f"{'='*60}\n")
+    discard_recording(driver)
+    discard_choice(driver)
     return False
 
 
-async def add_multiple_products(driver, products_list, device_type="ios", websocket=None):
+async def _restore_search_screen(driver, device_type="ios") -> Optional[str]:
+    """
+    Bring the app back to the search screen, cheapest way first
+    
+    Returns:
+        str: How it got there ("none" if it already was), or None if it did not
+    """
+    snapshot = take_snapshot(driver)
+    if is_search_screen(snapshot):
+        return "none"
+    logger.info("🧭 Lost the search screen, recovering")
+    
+    # A popup over the search screen (or over a tab bar) only needs dismissing
+    if await dismiss_interrupts(driver, snapshot):
+        if is_search_screen(take_snapshot(driver)):
+            return "interrupt"
+    
+    # One tap on the search tab works from any screen without a modal on top
+    if await open_search_screen(driver) and is_search_screen(take_snapshot(driver)):
+        return "search_tab"
+    
+    if SEARCH_DEEP_LINK:
+        try:
+            open_deep_link(driver, device_type, SEARCH_DEEP_LINK)
+            await pause(1)
+            if is_search_screen(take_snapshot(driver)):
+                return "deep_link"
+        except Exception as e:
+            logger.info("   Deep link to search failed: %s", e)
+    
+    # Restarting always ends on the start screen, however deep the app was stuck
+    restart_app(driver, device_type)
+    await pause(3)
+    await open_search_screen(driver)
+    if is_search_screen(take_snapshot(driver)):
+        return "restart"
+    return None
+
+
+async def recover_to_search(driver, device_type="ios") -> bool:
+    """
+    Make sure the app is on the search screen, within AH_RECOVERY_TIMEOUT
+    
+    Used after a failed item so the next one does not start from a detail page or popup.
+    Recovery time and method are recorded in metrics ("recovery.ms", "recovery.<method>").
+    
+    Returns:
+        bool: True if the app is on the search screen
+    """
+    started = time.perf_counter()
+    method = None
+    with deadline_scope(RECOVERY_TIMEOUT) as deadline, span("recover", "recovery") as recover_span:
+        try:
+            method = await asyncio.wait_for(
+                carry_profile(_restore_search_screen(driver, device_type)), timeout=deadline.remaining()
+            )
+        except asyncio.TimeoutError:
+            logger.error("   ⏱️  Recovery to the search screen timed out")
+        except Exception as e:
+            logger.error("   ❌ Recovery to the search screen failed: %s", e)
+        recover_span.set(method=method or "failed")
+    
+    if method != "none":
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        metrics.observe("recovery.ms", elapsed_ms)
+        metrics.increment(f"recovery.{method or 'failed'}")
+        if method:
+            logger.info("🧭 Back on the search screen via %s in %.0f ms", method, elapsed_ms)
+    return method is not None
+
+
+async def add_multiple_products(driver, products_list, device_type="ios", websocket=None,
+                                start_index=0, total_products=None):
     """
     Add multiple products with quantities
     
@@ -582,16 +785,21 @@ async def add_multiple_products(driver, products_list, device_type="ios", websoc
         products_list: List of dicts with 'name' and 'quantity' keys
         device_type: "ios" or "android"
         websocket: Optional WebSocket for real-time updates
+        start_index: Position of the first product in the whole basket (when run in slices)
+        total_products: Size of the whole basket (default: len(products_list))
     
     Returns:
         tuple: (success_count, failed_items)
+    
+    Raises:
+        SessionLost: If an item failed with most of its driver commands (the session is gone)
     """
     success_count = 0
     failed_items = []
     
-    total_products = len(products_list)
+    total_products = total_products or len(products_list)
     
-    for idx, product in enumerate(products_list):
+    for idx, product in enumerate(products_list, start=start_index):
         product_name = product.get('name', product) if isinstance(product, dict) else product
         quantity = product.get('quantity', 1) if isinstance(product, dict) else 1
         
@@ -601,24 +809,73 @@ async def add_multiple_products(driver, products_list, device_type="ios", websoc
                 "status": "adding_product",
                 "message": f"Adding {product_name} (x{quantity})... ({idx + 1}/{total_products})",
                 "progress": progress,
-                "current_product": product_name
+                "current_product": product_name,
+                "index": idx,
+            })
+        
+        if current_deadline.get().expired:
+            logger.error("⏱️  Job deadline reached, skipping %s", product_name)
+            failed_items.append(product_name)
+            continue
+        
+        item_token = current_item.set(product_name)
+        item_started = time.perf_counter()
+        timing = error = None
+        try:
+            with deadline_scope(ITEM_TIMEOUT + 5 * quantity), item_timing() as timing, command_tally() as commands, \
+                    span("item", "item", product=product_name, quantity=quantity, index=idx) as item_span:
+                added = await add_item(driver, product_name, device_type, quantity, websocket)
+                item_span.set(outcome="added" if added else "failed")
+            if added:
+                timing_model.record_item(current_device_id.get() or device_type, device_type, quantity,
+                                         time.perf_counter() - item_started, timing, query=product_name)
+        except Exception as e:
+            # One broken item must not abort the rest of the basket
+            logger.error("❌ Unexpected error adding %s: %s", product_name, e)
+            discard_recording(driver)
+            discard_choice(driver)
+            added = False
+            error = str(e)
+        finally:
+            current_item.reset(item_token)
+        
+        # Steps swallow driver errors, so a dead session only shows as items whose commands fail:
+        # stop here and let the scheduler retry the rest on a fresh session
+        if not added and commands.mostly_failed:
+            logger.error("❌ %d of %d driver commands failed while adding %s, giving up on the session",
+                         commands.failed, commands.failed + commands.ok, product_name)
+            raise SessionLost(f"Driver commands failing while adding {product_name}: {error or 'step errors'}",
+                              success_count, failed_items)
+        
+        # Taken before recovery leaves the screen the item failed on; successful items skip it
+        artifact_url = None if added else await capture_failure(driver, product_name, item_started, timing, error)
+        
+        if websocket:
+            await websocket.send_json({
+                "status": "item_result",
+                "message": f"{'Added' if added else 'Could not add'} {product_name} (x{quantity})",
+                "progress": 25 + ((idx + 1) / total_products) * 70,
+                "product": product_name,
+                "quantity": quantity,
+                "index": idx,
+                "added": added,
+                **({"artifact_url": artifact_url} if artifact_url else {}),
             })
         
-        if await add_item(driver, product_name, device_type, quantity, websocket):
+        if added:
             success_count += 1
             # Human-like delay between items
-            await asyncio.sleep(1)
+            await pause(1)
         else:
             failed_items.append(product_name)
-            await asyncio.sleep(0.5)
+            await pause(0.5)
+            # The next item (or job) must not start from wherever this one left the app
+            if RECOVERY_ENABLED and not current_deadline.get().expired:
+                await recover_to_search(driver, device_type)
     
-    logger.info(f"\n{'='*60}")
-    logger.info(f"📊 SUMMARY:")
-    logger.info(f"{'='*60}")
-    logger.info(f"✅ Successfully added: {success_count}/{total_products} products")
+    logger.info("📊 Successfully added: %d/%d products", success_count, len(products_list))
     if failed_items:
-        logger.info(f"❌ Failed items: {', '.join(failed_items)}")
-    logger.info(f"{'='*60}\n")
+        logger.info("❌ Failed items: %s", ", ".join(failed_items))
     
     return success_count, failed_items
 
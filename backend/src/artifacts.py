@@ -0,0 +1,244 @@
+"""
+Failure artifacts
+When an item fails, its page source, screenshot, locator attempts, step timings and log lines
+are captured and written as one compressed zip by a background thread; the store is bounded in
+size and file count, oldest artifacts evicted first
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+from .config import (
+    ARTIFACT_CAPTURE_TIMEOUT,
+    ARTIFACTS_DIR,
+    ARTIFACTS_ENABLED,
+    ARTIFACTS_MAX_FILES,
+    ARTIFACTS_MAX_MB,
+)
+from .context import current_device_id, current_job_id
+from .logs import job_logs
+from .metrics import metrics
+from .timing import ItemTiming
+from .tracing import current_trace
+
+logger = logging.getLogger(__name__)
+
+# Saves waiting for the writer thread; failures beyond this are not captured
+MAX_PENDING = 16
+
+# Jobs whose artifact links are kept in memory (for the job result)
+MAX_JOBS = 200
+
+_ARTIFACT_ID = re.compile(r"^[0-9a-f]{16}$")
+
+
+class ArtifactStore:
+    """
+    Failure artifacts on local disk, one zip per failed item
+
+    Links are registered when an item fails; the zip appears once the writer thread has
+    saved it. Every save evicts the oldest zips until the store fits its limits again.
+
+    Args:
+        directory: Directory holding the zips
+        max_bytes: Total size of the zips kept
+        max_files: Number of zips kept
+    """
+
+    def __init__(self, directory: str = ARTIFACTS_DIR, max_bytes: int = int(ARTIFACTS_MAX_MB * 1024 * 1024),
+                 max_files: int = ARTIFACTS_MAX_FILES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self._jobs: "OrderedDict[str, List[dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="artifacts")
+        self._pending = 0
+
+    def path(self, job_id: str, artifact_id: str) -> Optional[str]:
+        """
+        Zip of one of a job's artifacts, or None if it is unknown, belongs to another job,
+        was evicted or is not written yet
+
+        The owning job is read from the zip itself, so the check holds across restarts and
+        for workers sharing the directory.
+        """
+        if not _ARTIFACT_ID.match(artifact_id):
+            return None
+        path = os.path.join(self.directory, f"{artifact_id}.zip")
+        try:
+            with zipfile.ZipFile(path) as archive:
+                meta = json.loads(archive.read("meta.json"))
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            return None
+        return path if meta.get("job_id") == job_id else None
+
+    def register(self, job_id: Optional[str], summary: dict):
+        if not job_id:
+            return
+        with self._lock:
+            entries = self._jobs.get(job_id)
+            if entries is None:
+                entries = self._jobs[job_id] = []
+                while len(self._jobs) > MAX_JOBS:
+                    self._jobs.popitem(last=False)
+            entries.append(summary)
+
+    def for_job(self, job_id: str) -> List[dict]:
+        """Artifact links of a job's failed items, in the order they failed"""
+        with self._lock:
+            return list(self._jobs.get(job_id, []))
+
+    def submit(self, artifact_id: str, meta: dict, page_source: Optional[str], screenshot: Optional[bytes]) -> bool:
+        """Hand an artifact to the writer thread; False if too many saves are already waiting"""
+        with self._lock:
+            if self._pending >= MAX_PENDING:
+                return False
+            self._pending += 1
+        self._writer.submit(self._save, artifact_id, meta, page_source, screenshot)
+        return True
+
+    def _save(self, artifact_id: str, meta: dict, page_source: Optional[str], screenshot: Optional[bytes]):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{artifact_id}.zip")
+            tmp_path = f"{path}.tmp"
+            with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                archive.writestr("meta.json", json.dumps(meta, indent=2, default=str))
+                if page_source is not None:
+                    archive.writestr("page_source.xml", page_source)
+                if screenshot is not None:
+                    # PNG is compressed already
+                    archive.writestr("screenshot.png", screenshot, compress_type=zipfile.ZIP_STORED)
+            os.replace(tmp_path, path)
+            metrics.increment("artifacts.saved")
+            self._evict()
+        except Exception as e:
+            logger.error("Could not save failure artifact %s: %s", artifact_id, e)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _evict(self):
+        files: List[Tuple[float, int, str]] = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".zip"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        while files and (total > self.max_bytes or len(files) > self.max_files):
+            _, size, path = files.pop(0)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            metrics.increment("artifacts.evicted")
+
+
+artifact_store = ArtifactStore()
+
+
+def _grab(driver) -> Tuple[Optional[str], Optional[bytes]]:
+    page_source = screenshot = None
+    try:
+        page_source = driver.page_source
+    except Exception as e:
+        logger.debug("Could not read the page source for the failure artifact: %s", e)
+    try:
+        screenshot = driver.get_screenshot_as_png()
+    except Exception as e:
+        logger.debug("Could not take a screenshot for the failure artifact: %s", e)
+    return page_source, screenshot
+
+
+def _attempts(started: float) -> Tuple[List[dict], List[dict]]:
+    """Step attempts and element lookups of this device's trace since `started`"""
+    trace = current_trace.get()
+    if trace is None:
+        return [], []
+    spans = trace.spans_since(started, current_device_id.get() or "scheduler")
+    steps = [span for span in spans if span.category == "step"]
+
+    def ms(span) -> Optional[float]:
+        return round((span.end - span.start) * 1000, 1) if span.end is not None else None
+
+    lookups = []
+    for span in spans:
+        if span.category != "driver" or "locator" not in span.args:
+            continue
+        step = next((candidate.name for candidate in reversed(steps) if candidate.start <= span.start), None)
+        lookups.append({"step": step, "locator": span.args["locator"],
+                        "outcome": span.args.get("outcome"), "ms": ms(span)})
+    return [{"step": span.name, **span.args, "ms": ms(span)} for span in steps], lookups
+
+
+async def capture_failure(driver, product: str, started: float, timing: Optional[ItemTiming] = None,
+                          error: Optional[str] = None) -> Optional[str]:
+    """
+    Capture the state of a failed item before it is recovered from
+
+    Only the page source and screenshot are read here (in a thread, bounded by
+    ARTIFACT_CAPTURE_TIMEOUT); compressing and writing happen on the writer thread.
+
+    Args:
+        driver: Appium WebDriver, still on the screen the item failed on
+        product: Product that could not be added
+        started: perf_counter() when the item started
+        timing: The item's step timings
+        error: Exception that aborted the item, if any
+
+    Returns:
+        str: Link to the artifact, or None if artifacts are disabled or the writer is backlogged
+    """
+    job_id = current_job_id.get()
+    # Downloads are scoped to the job, so outside a job nobody could fetch the zip
+    if not ARTIFACTS_ENABLED or not job_id:
+        return None
+    artifact_id = uuid.uuid4().hex[:16]
+    failed_step = timing.failed_step if timing else None
+    steps, lookups = _attempts(started)
+    wall_started = time.time() - (time.perf_counter() - started)
+    meta = {
+        "id": artifact_id,
+        "job_id": job_id,
+        "device_id": current_device_id.get(),
+        "product": product,
+        "failed_step": failed_step,
+        "error": error,
+        "captured_at": time.time(),
+        "item_seconds": round(time.perf_counter() - started, 3),
+        "step_seconds": {step: round(seconds, 3) for step, seconds in (timing.steps if timing else {}).items()},
+        "step_paths": dict(timing.paths) if timing else {},
+        "steps": steps,
+        "locator_attempts": lookups,
+        "log": [entry for entry in (job_logs.get(job_id) or []) if entry["timestamp"] >= wall_started],
+    }
+
+    capture_started = time.perf_counter()
+    try:
+        page_source, screenshot = await asyncio.wait_for(asyncio.to_thread(_grab, driver), ARTIFACT_CAPTURE_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning("⏱️  Failure artifact for %s taken without page source and screenshot", product)
+        page_source = screenshot = None
+    metrics.observe("artifacts.capture_ms", (time.perf_counter() - capture_started) * 1000)
+
+    if not artifact_store.submit(artifact_id, meta, page_source, screenshot):
+        metrics.increment("artifacts.dropped")
+        return None
+    url = f"/jobs/{job_id}/artifacts/{artifact_id}"
+    artifact_store.register(job_id, {"id": artifact_id, "product": product, "step": failed_step, "url": url})
+    metrics.increment("artifacts.captured")
+    logger.info("📎 Failure artifact for %s: %s", product, url)
+    return url
+
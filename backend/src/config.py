@@ -0,0 +1,165 @@
+"""
+Backend configuration
+Environment settings shared by the automation modules
+"""
+
+import os
+from dotenv import load_dotenv
+
+# Load environment variables before any module reads them
+load_dotenv()
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Directory for on-disk caches (replay rects, preferences, timings, device accounts)
+CACHE_DIR = os.getenv("AH_CACHE_DIR", os.path.join(BACKEND_DIR, "cache"))
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    """Read a boolean flag from the environment"""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Coordinate replay (see replay.py)
+REPLAY_ENABLED = env_flag("AH_REPLAY_ENABLED", True)
+REPLAY_CACHE_PATH = os.getenv("AH_REPLAY_CACHE_PATH", os.path.join(CACHE_DIR, "replay.json"))
+AH_APP_VERSION = os.getenv("AH_APP_VERSION", "")
+
+# Appium server and app capabilities, read once at startup
+APPIUM_SERVER_URL = os.getenv("APPIUM_SERVER_URL", "http://localhost:4723")
+IOS_DEVICE_NAME = os.getenv("IOS_DEVICE_NAME", "iPhone")
+IOS_VERSION = os.getenv("IOS_VERSION", "17.0")
+IOS_UDID = os.getenv("IOS_UDID", "")
+AH_BUNDLE_ID = os.getenv("AH_BUNDLE_ID", "nl.ah.ahapp")  # Albert Heijn app bundle ID
+ANDROID_DEVICE_NAME = os.getenv("ANDROID_DEVICE_NAME", "Android Device")
+AH_PACKAGE = os.getenv("AH_PACKAGE", "nl.ah.app")  # Albert Heijn app package
+AH_ACTIVITY = os.getenv("AH_ACTIVITY", "nl.ah.app.MainActivity")
+
+# Appium HTTP transport (see transport.py)
+WORKER_CONCURRENCY = int(os.getenv("AH_WORKER_CONCURRENCY", "4"))
+APPIUM_POOL_SIZE = int(os.getenv("APPIUM_POOL_SIZE", str(WORKER_CONCURRENCY)))
+APPIUM_CONNECT_TIMEOUT = float(os.getenv("APPIUM_CONNECT_TIMEOUT", "5"))
+APPIUM_READ_TIMEOUT = float(os.getenv("APPIUM_READ_TIMEOUT", "20"))
+APPIUM_SLOW_READ_TIMEOUT = float(os.getenv("APPIUM_SLOW_READ_TIMEOUT", "60"))
+APPIUM_SESSION_TIMEOUT = float(os.getenv("APPIUM_SESSION_TIMEOUT", "180"))
+APPIUM_QUIT_TIMEOUT = float(os.getenv("APPIUM_QUIT_TIMEOUT", "30"))
+
+# Job scheduling (see scheduler.py)
+# JSON list of devices, e.g. [{"id": "iphone-1", "device_type": "ios", "capabilities": {"appium:udid": "..."}}]
+AH_DEVICES = os.getenv("AH_DEVICES", "")
+SCHEDULER_SLICE_ITEMS = int(os.getenv("SCHEDULER_SLICE_ITEMS", "10"))
+SCHEDULER_MAX_WAIT = float(os.getenv("SCHEDULER_MAX_WAIT", "1800"))
+SCHEDULER_ADMISSION = os.getenv("SCHEDULER_ADMISSION", "reject").lower()  # "reject" or "defer"
+SCHEDULER_FAIR_SHARE_HALF_LIFE = float(os.getenv("SCHEDULER_FAIR_SHARE_HALF_LIFE", "600"))
+SCHEDULER_DEFAULT_ITEM_SECONDS = float(os.getenv("SCHEDULER_DEFAULT_ITEM_SECONDS", "20"))
+SCHEDULER_TIMINGS_PATH = os.getenv("SCHEDULER_TIMINGS_PATH", os.path.join(CACHE_DIR, "timings.json"))
+
+# Account affinity (see accounts.py)
+# JSON map of user id -> AH account their baskets go to, e.g. {"alice": "alice@example.com"}
+AH_USER_ACCOUNTS = os.getenv("AH_USER_ACCOUNTS", "")
+# JSON map of account -> {"email": ..., "password": ...}; devices are only switched to these accounts
+AH_ACCOUNT_CREDENTIALS = os.getenv("AH_ACCOUNT_CREDENTIALS", "")
+# Account each device was last switched to (the app keeps its login across sessions)
+ACCOUNTS_PATH = os.getenv("AH_ACCOUNTS_PATH", os.path.join(CACHE_DIR, "accounts.json"))
+# Queued seconds after which a job may make a device of another account switch to its account
+ACCOUNT_MAX_WAIT = float(os.getenv("AH_ACCOUNT_MAX_WAIT", "300"))
+
+# Fake device backend for load tests (see fake_driver.py)
+AH_FAKE_DRIVER = env_flag("AH_FAKE_DRIVER", False)
+AH_FAKE_LATENCY = float(os.getenv("AH_FAKE_LATENCY", "0.005"))
+AH_FAKE_FAILURE_RATE = float(os.getenv("AH_FAKE_FAILURE_RATE", "0"))
+AH_FAKE_POPUP_RATE = float(os.getenv("AH_FAKE_POPUP_RATE", "0"))
+
+# Multiplier for the fixed UI settle delays in the automation flow (0 disables them)
+AH_SLEEP_SCALE = float(os.getenv("AH_SLEEP_SCALE", "1.0"))
+
+# Search result ranking (see ranking.py)
+RANKING_ENABLED = env_flag("AH_RANKING_ENABLED", True)
+RANKING_MIN_SCORE = float(os.getenv("AH_RANKING_MIN_SCORE", "0.35"))
+PREFERENCES_PATH = os.getenv("AH_PREFERENCES_PATH", os.path.join(CACHE_DIR, "preferences.json"))
+# Tap a search suggestion shown while typing instead of submitting the search (see ranking.py)
+SUGGESTIONS_ENABLED = env_flag("AH_SUGGESTIONS", False)
+SUGGESTION_MIN_SCORE = float(os.getenv("AH_SUGGESTION_MIN_SCORE", "0.85"))
+
+# Resilience (see resilience.py)
+# Job budget as a multiple of its estimated duration (0 disables the job deadline)
+JOB_DEADLINE_FACTOR = float(os.getenv("AH_JOB_DEADLINE_FACTOR", "3"))
+JOB_MIN_DEADLINE = float(os.getenv("AH_JOB_MIN_DEADLINE", "300"))
+ITEM_TIMEOUT = float(os.getenv("AH_ITEM_TIMEOUT", "120"))
+STEP_TIMEOUT = float(os.getenv("AH_STEP_TIMEOUT", "45"))
+STEP_RETRIES = int(os.getenv("AH_STEP_RETRIES", "2"))
+RETRY_BASE_DELAY = float(os.getenv("AH_RETRY_BASE_DELAY", "0.5"))
+# Attempts per slice before its products are marked failed instead of failing the job
+SLICE_MAX_ATTEMPTS = int(os.getenv("AH_SLICE_MAX_ATTEMPTS", "3"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("AH_BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_RESET_SECONDS = float(os.getenv("AH_BREAKER_RESET_SECONDS", "300"))
+
+# Span tracing (see tracing.py)
+TRACING_ENABLED = env_flag("AH_TRACING_ENABLED", True)
+TRACE_MAX_JOBS = int(os.getenv("AH_TRACE_MAX_JOBS", "200"))
+TRACE_MAX_SPANS = int(os.getenv("AH_TRACE_MAX_SPANS", "20000"))
+
+# Job profiling (see profiling.py)
+# Fraction of jobs profiled even when the client did not ask for it
+PROFILE_SAMPLE_RATE = float(os.getenv("AH_PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("AH_PROFILE_INTERVAL_MS", "5"))
+
+# Failure artifacts (see artifacts.py)
+ARTIFACTS_ENABLED = env_flag("AH_ARTIFACTS", True)
+ARTIFACTS_DIR = os.getenv("AH_ARTIFACTS_DIR", os.path.join(CACHE_DIR, "artifacts"))
+ARTIFACTS_MAX_MB = float(os.getenv("AH_ARTIFACTS_MAX_MB", "200"))
+ARTIFACTS_MAX_FILES = int(os.getenv("AH_ARTIFACTS_MAX_FILES", "500"))
+# Seconds the page source and screenshot may take before the failed item is recovered without them
+ARTIFACT_CAPTURE_TIMEOUT = float(os.getenv("AH_ARTIFACT_CAPTURE_TIMEOUT", "10"))
+
+# Duplicate basket submissions (see idempotency.py)
+IDEMPOTENCY_ENABLED = env_flag("AH_IDEMPOTENCY", True)
+# Seconds a completed job still answers duplicates of its basket
+IDEMPOTENCY_TTL = float(os.getenv("AH_IDEMPOTENCY_TTL", "120"))
+
+# Traffic recording for replay_traffic.py (see traffic.py)
+TRAFFIC_RECORD = env_flag("AH_TRAFFIC_RECORD", False)
+TRAFFIC_PATH = os.getenv("AH_TRAFFIC_PATH", os.path.join(CACHE_DIR, "traffic.jsonl"))
+TRAFFIC_MAX_MB = float(os.getenv("AH_TRAFFIC_MAX_MB", "50"))
+# Salt of the hashed user ids (empty: random per process, so ids cannot be linked across restarts)
+TRAFFIC_SALT = os.getenv("AH_TRAFFIC_SALT", "")
+
+# Logging (see logs.py)
+LOG_LEVEL = os.getenv("AH_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("AH_LOG_FORMAT", "text").lower()  # "text" or "json"
+JOB_LOG_LINES = int(os.getenv("AH_JOB_LOG_LINES", "2000"))
+JOB_LOG_MAX_JOBS = int(os.getenv("AH_JOB_LOG_MAX_JOBS", "200"))
+
+# Job event log (see events.py)
+EVENT_BUFFER_SIZE = int(os.getenv("AH_EVENT_BUFFER_SIZE", "500"))
+
+# Multiple API worker processes (see registry.py)
+WEB_WORKERS = int(os.getenv("AH_WEB_WORKERS", "1"))
+# Shared SQLite registry; required when WEB_WORKERS > 1 (empty: in-process registry)
+REGISTRY_PATH = os.getenv("AH_REGISTRY_PATH", os.path.join(CACHE_DIR, "registry.db") if WEB_WORKERS > 1 else "")
+LEASE_TTL = float(os.getenv("AH_LEASE_TTL", "30"))
+LEASE_POLL_INTERVAL = float(os.getenv("AH_LEASE_POLL_INTERVAL", "1"))
+REGISTRY_JOB_RETENTION = float(os.getenv("AH_REGISTRY_JOB_RETENTION", "86400"))
+
+# Startup warm-up: open sessions and load caches before the first request (see main.py)
+WARMUP_ENABLED = env_flag("AH_WARMUP", True)
+WARMUP_TIMEOUT = float(os.getenv("AH_WARMUP_TIMEOUT", "120"))
+
+# Session health monitor (see health.py)
+HEALTH_PROBE_INTERVAL = float(os.getenv("AH_HEALTH_PROBE_INTERVAL", "30"))  # 0 disables
+HEALTH_PROBE_TIMEOUT = float(os.getenv("AH_HEALTH_PROBE_TIMEOUT", "10"))
+HEALTH_WINDOW = int(os.getenv("AH_HEALTH_WINDOW", "20"))
+# Recycle when the probe latency reaches this multiple of the session's baseline
+HEALTH_LATENCY_FACTOR = float(os.getenv("AH_HEALTH_LATENCY_FACTOR", "3"))
+HEALTH_MAX_ERROR_RATE = float(os.getenv("AH_HEALTH_MAX_ERROR_RATE", "0.3"))
+# Recycle when the UiAutomator2 server reaches this much memory (PSS, MB)
+HEALTH_MAX_SERVER_MEMORY_MB = float(os.getenv("AH_HEALTH_MAX_SERVER_MEMORY_MB", "400"))  # 0 disables
+
+# Recovery to the search screen after a failed item (see recovery.py)
+RECOVERY_ENABLED = env_flag("AH_RECOVERY", True)
+RECOVERY_TIMEOUT = float(os.getenv("AH_RECOVERY_TIMEOUT", "30"))
+# App link that opens the search page (tried before restarting the app), e.g. "appie://search"
+SEARCH_DEEP_LINK = os.getenv("AH_SEARCH_DEEP_LINK", "")
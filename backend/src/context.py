@@ -0,0 +1,13 @@
+"""
+Job context
+Context variables identifying the job, user, device and step the current coroutine works for
+"""
+
+from contextvars import ContextVar
+from typing import Optional
+
+current_job_id: ContextVar[Optional[str]] = ContextVar("current_job_id", default=None)
+current_user_id: ContextVar[str] = ContextVar("current_user_id", default="anonymous")
+current_device_id: ContextVar[Optional[str]] = ContextVar("current_device_id", default=None)
+current_item: ContextVar[Optional[str]] = ContextVar("current_item", default=None)
+current_step: ContextVar[Optional[str]] = ContextVar("current_step", default=None)
@@ -0,0 +1,170 @@
+"""
+Status event delivery
+Every job publishes its status events to a sequenced log with a bounded replay buffer;
+client connections subscribe to it, so a dropped connection can resume without affecting the job
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Deque, List, Optional, Tuple
+from .config import EVENT_BUFFER_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Event sent after each product; only delivered to channels that ask for it
+ITEM_RESULT = "item_result"
+
+
+class EventChannel:
+    """
+    Sends status events to a connected client
+
+    Args:
+        websocket: Connection with an async send_json method
+        item_results: Also deliver per-product "item_result" events
+    """
+
+    def __init__(self, websocket, item_results: bool = False):
+        self.websocket = websocket
+        self.item_results = item_results
+
+    async def send_json(self, event: dict):
+        if event.get("status") == ITEM_RESULT and not self.item_results:
+            return
+        await self.websocket.send_json({"timestamp": time.time(), **event})
+
+
+class JobEventLog:
+    """
+    Status events of one job, numbered from 1, with the most recent kept for replay
+
+    Acts as the job's `websocket` for the automation code (async send_json); clients read it
+    through subscribe(). Events may be published from any thread (slices run on their device's
+    thread); subscribers receive them on their own event loop, in seq order.
+
+    Args:
+        job_id: Job the events belong to
+        buffer_size: Events kept for late or reconnecting subscribers
+    """
+
+    def __init__(self, job_id: str, buffer_size: int = EVENT_BUFFER_SIZE):
+        self.job_id = job_id
+        self.last_seq = 0
+        self.closed = False
+        # Extra fields (e.g. the ETA) for events that carry a progress value
+        self.progress_fields: Optional[Callable[[dict], dict]] = None
+        self._buffer: Deque[dict] = deque(maxlen=buffer_size)
+        self._subscribers: List[Tuple[asyncio.AbstractEventLoop, "asyncio.Queue[Optional[dict]]"]] = []
+        self._lock = threading.Lock()
+
+    def _deliver(self, item: Optional[dict]):
+        for loop, queue in self._subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                # The subscriber's loop is closed
+                pass
+
+    def publish(self, event: dict) -> dict:
+        """Number, timestamp and buffer an event and hand it to live subscribers"""
+        if self.progress_fields and "progress" in event:
+            try:
+                event = {**event, **self.progress_fields(event)}
+            except Exception as e:
+                logger.debug("Could not add progress fields to an event: %s", e)
+        with self._lock:
+            if self.closed:
+                return event
+            self.last_seq += 1
+            event = {**event, "seq": self.last_seq, "job_id": self.job_id, "timestamp": time.time()}
+            self._buffer.append(event)
+            self._deliver(event)
+        return event
+
+    async def send_json(self, event: dict):
+        self.publish(event)
+
+    def close(self):
+        """No more events; subscribers finish after the buffered ones"""
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            self._deliver(None)
+
+    def replay(self, since: int = 0) -> List[dict]:
+        """Buffered events with seq greater than `since`"""
+        with self._lock:
+            return [event for event in self._buffer if event["seq"] > since]
+
+    async def subscribe(self, since: int = 0) -> AsyncIterator[dict]:
+        """
+        Missed events after `since`, then live events until the log is closed
+
+        A gap between `since` and the first replayed seq means older events were evicted.
+        """
+        queue: "asyncio.Queue[Optional[dict]]" = asyncio.Queue()
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            missed = [event for event in self._buffer if event["seq"] > since]
+            closed = self.closed
+            if not closed:
+                self._subscribers.append(subscriber)
+        if closed:
+            for event in missed:
+                yield event
+            return
+        try:
+            for event in missed:
+                yield event
+            while True:
+                event = await queue.get()
+                if event is None:
+                    return
+                yield event
+        finally:
+            with self._lock:
+                if subscriber in self._subscribers:
+                    self._subscribers.remove(subscriber)
+
+
+async def forward_events(events: JobEventLog, channel, since: int = 0):
+    """
+    Deliver a job's events to one client until the job is done or the client goes away
+
+    A failing client only ends its own subscription, never the job.
+    """
+    try:
+        async for event in events.subscribe(since):
+            await channel.send_json(event)
+    except Exception as e:
+        logger.info("Stopped sending events of job %s: %s", events.job_id, e.__class__.__name__)
+
+
+class NdjsonStream:
+    """
+    Buffers events for a streaming HTTP response, one JSON object per line
+
+    Used as the `websocket` of an EventChannel; the response body iterates lines().
+    """
+
+    def __init__(self):
+        self._queue: "asyncio.Queue[Optional[dict]]" = asyncio.Queue()
+
+    async def send_json(self, event: dict):
+        await self._queue.put(event)
+
+    def close(self):
+        """End the stream after the events sent so far"""
+        self._queue.put_nowait(None)
+
+    async def lines(self) -> AsyncIterator[str]:
+        while True:
+            event = await self._queue.get()
+            if event is None:
+                return
+            yield json.dumps(event, ensure_ascii=False) + "\n"
@@ -0,0 +1,543 @@
+"""
+In-process fake Appium driver
+Simulates the Albert Heijn app screens (home, search, results, product detail, profile and login)
+closely enough for the automation functions to run end to end without a device, e.g. for load tests
+"""
+
+import html
+import itertools
+import random
+import re
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+from appium.webdriver.common.appiumby import AppiumBy
+from selenium.common.exceptions import (
+    NoSuchElementException,
+    StaleElementReferenceException,
+    TimeoutException,
+    WebDriverException,
+)
+from .health import record_command
+from .profiling import driver_io
+from .tracing import Span, record_span
+
+SCREEN_WIDTH = 390
+SCREEN_HEIGHT = 844
+
+# W3C key codes used by search_item
+KEY_DELETE = ("\ue003", "\ue017")
+KEY_ENTER = ("\ue007", "\ue006")
+
+# Simulated UiAutomator2 server memory (KB): at start, and added per command served
+SERVER_BASE_MEMORY_KB = 80 * 1024
+SERVER_MEMORY_PER_COMMAND_KB = 2
+
+_XPATH_TYPE_RE = re.compile(r"^//([\w.]+)")
+_XPATH_LITERAL_RE = re.compile(r"'([^']*)'")
+
+
+class FakeElement:
+    """One element on a fake screen"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, driver: "FakeDriver", element_type: str, name: str = "", rect: Optional[dict] = None,
+                 on_tap=None, children: Optional[List["FakeElement"]] = None, text_input: bool = False):
+        self.id = f"fake-{next(self._ids)}"
+        self._driver = driver
+        self.type = element_type
+        self.name = name
+        self._rect = rect or {"x": 0, "y": 0, "width": SCREEN_WIDTH, "height": 44}
+        self.on_tap = on_tap
+        self.children = children or []
+        self.text_input = text_input
+        self.value = ""
+
+    # WebElement API used by the automation code
+
+    @property
+    def rect(self) -> dict:
+        self._driver._command("getElementRect")
+        return dict(self._rect)
+
+    @property
+    def location(self) -> dict:
+        self._driver._command("getElementLocation")
+        return {"x": self._rect["x"], "y": self._rect["y"]}
+
+    @property
+    def size(self) -> dict:
+        self._driver._command("getElementSize")
+        return {"width": self._rect["width"], "height": self._rect["height"]}
+
+    @property
+    def text(self) -> str:
+        self._driver._command("getElementText")
+        return self.value if self.text_input else self.name
+
+    @property
+    def tag_name(self) -> str:
+        return self.type
+
+    def is_displayed(self) -> bool:
+        self._driver._command("isElementDisplayed")
+        return True
+
+    def get_attribute(self, name: str):
+        self._driver._command("getElementAttribute")
+        if name in ("name", "label", "content-desc"):
+            return self.name
+        if name == "value":
+            return self.value
+        if name == "type":
+            return self.type
+        return None
+
+    def click(self):
+        self._driver._command("clickElement")
+        self._driver._tap(self)
+
+    def clear(self):
+        self._driver._command("clearElement")
+        self.value = ""
+        self._driver._typed(self)
+
+    def send_keys(self, *values):
+        self._driver._command("sendKeysToElement")
+        for value in values:
+            for char in value:
+                if char in KEY_DELETE:
+                    self.value = self.value[:-1]
+                elif char in KEY_ENTER:
+                    self._driver._submit(self.value)
+                else:
+                    self.value += char
+        self._driver._typed(self)
+
+    def iter(self):
+        yield self
+        for child in self.children:
+            yield from child.iter()
+
+    def to_xml(self, indent: str = "") -> str:
+        attrs = (
+            f'type="{self.type}" name="{html.escape(self.name)}" label="{html.escape(self.name)}" '
+            f'value="{html.escape(self.value)}" enabled="true" visible="true" '
+            f'x="{self._rect["x"]}" y="{self._rect["y"]}" '
+            f'width="{self._rect["width"]}" height="{self._rect["height"]}"'
+        )
+        if not self.children:
+            return f"{indent}<{self.type} {attrs}/>"
+        inner = "\n".join(child.to_xml(indent + "  ") for child in self.children)
+        return f"{indent}<{self.type} {attrs}>\n{inner}\n{indent}</{self.type}>"
+
+
+class _SwitchTo:
+    def __init__(self, driver: "FakeDriver"):
+        self._driver = driver
+
+    @property
+    def active_element(self) -> FakeElement:
+        self._driver._command("getActiveElement")
+        focused = self._driver._focused
+        if focused is None:
+            raise NoSuchElementException("No focused element")
+        return focused
+
+
+class FakeDriver:
+    """
+    Stand-in for appium.webdriver.Remote
+
+    The UI is rendered as an iOS (XCUITest) element tree for both device types; the automation
+    selector lists contain iOS and Android locators, so both flows resolve against it.
+
+    Args:
+        device_type: "ios" or "android"
+        latency: Simulated round-trip time per driver command in seconds (blocking, like the real client)
+        failure_rate: Probability that a command raises a transient driver error
+        popup_rate: Probability that a modal promo covers the screen after a navigation
+        account: Account the app is logged into (the e-mail address typed to log in)
+    """
+
+    def __init__(self, device_type: str = "ios", latency: float = 0.005, failure_rate: float = 0.0,
+                 popup_rate: float = 0.0, account: Optional[str] = None):
+        self.session_id = uuid.uuid4().hex
+        self.device_type = device_type
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.popup_rate = popup_rate
+        self.capabilities = {
+            "platformName": "Android" if device_type == "android" else "iOS",
+            "deviceName": "Fake Device",
+            "deviceModel": "FakePhone",
+        }
+        self.switch_to = _SwitchTo(self)
+        self.account = account
+        # Basket per account; the app shows the one of the logged-in account
+        self.baskets: Dict[Optional[str], Dict[str, int]] = {}
+        self.command_count = 0
+        self.swipes = 0
+        self._lock = threading.Lock()
+        self._query = ""
+        self._draft = ""
+        self._product: Optional[str] = None
+        self._history: List[str] = []
+        self._focused: Optional[FakeElement] = None
+        self._closed = False
+        self._popup = False
+        self._screen = "home"
+        self._elements: List[FakeElement] = []
+        self._login_fields: List[FakeElement] = []
+        self._render()
+
+    @property
+    def basket(self) -> Dict[str, int]:
+        return self.baskets.setdefault(self.account, {})
+
+    # Simulation internals
+
+    def _command(self, name: str, **args) -> Optional[Span]:
+        started = time.perf_counter()
+        if self._closed:
+            record_span(name, "driver", started, outcome="WebDriverException", **args)
+            record_command(False)
+            raise WebDriverException("Session is closed")
+        with self._lock:
+            self.command_count += 1
+        if self.latency:
+            with driver_io():
+                time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            # Transient errors, as seen from real devices under load
+            error = random.choice((StaleElementReferenceException, TimeoutException))
+            record_span(name, "driver", started, outcome=error.__name__, **args)
+            record_command(False)
+            raise error("Injected fake driver failure")
+        record_command(True)
+        return record_span(name, "driver", started, outcome="ok", **args)
+
+    def _navigate(self, screen: str):
+        self._history.append(self._screen)
+        self._screen = screen
+        self._draft = ""
+        if self.popup_rate and random.random() < self.popup_rate:
+            self._popup = True
+        self._render()
+
+    def show_popup(self):
+        """Cover the screen with a modal promo until its "Sluiten" button is tapped"""
+        self._popup = True
+        self._render()
+
+    def _close_popup(self):
+        self._popup = False
+        self._render()
+
+    def _tap(self, element: FakeElement):
+        if element.text_input:
+            self._focused = element
+        elif element.on_tap:
+            element.on_tap()
+
+    def _typed(self, element: FakeElement):
+        # Suggestions follow the text in the search box
+        if self._screen == "search" and element.name == "search_field" and element.value != self._draft:
+            self._draft = element.value
+            self._render()
+
+    def _submit(self, query: str):
+        self._query = query.strip()
+        self._focused = None
+        self._navigate("results")
+
+    def _open_product(self, title: str):
+        self._product = title
+        self._navigate("detail")
+
+    def _add_to_basket(self):
+        if self._product:
+            self.basket[self._product] = self.basket.get(self._product, 0) + 1
+            self._render()
+
+    def _remove_from_basket(self):
+        if self._product and self.basket.get(self._product):
+            self.basket[self._product] -= 1
+            if not self.basket[self._product]:
+                del self.basket[self._product]
+            self._render()
+
+    def _logout(self):
+        self.account = None
+        self._render()
+
+    def _login(self):
+        email, password = (field.value for field in self._login_fields)
+        if email and password:
+            self.account = email
+            self._focused = None
+            self._navigate("profile")
+
+    def _render(self):
+        nav_bar = FakeElement(self, "XCUIElementTypeNavigationBar", "Albert Heijn",
+                              {"x": 0, "y": 0, "width": SCREEN_WIDTH, "height": 88})
+        tab_bar = FakeElement(self, "XCUIElementTypeTabBar", "Tab Bar",
+                              {"x": 0, "y": 760, "width": SCREEN_WIDTH, "height": 84},
+                              children=[
+                                  FakeElement(self, "XCUIElementTypeButton", "Zoek",
+                                              {"x": 100, "y": 770, "width": 60, "height": 50},
+                                              on_tap=lambda: self._navigate("search")),
+                                  FakeElement(self, "XCUIElementTypeButton", "Profiel",
+                                              {"x": 300, "y": 770, "width": 60, "height": 50},
+                                              on_tap=lambda: self._navigate("profile")),
+                              ])
+        elements = [nav_bar]
+
+        if self._screen in ("search", "results"):
+            field = FakeElement(self, "XCUIElementTypeSearchField", "search_field",
+                                {"x": 16, "y": 96, "width": 358, "height": 36}, text_input=True)
+            if self._screen == "results":
+                field.value = self._query
+            else:
+                field.value = self._draft
+            elements.append(field)
+
+        if self._screen == "search" and len(self._draft.strip()) >= 3:
+            elements.append(FakeElement(self, "XCUIElementTypeTable", "search_suggestions",
+                                        {"x": 0, "y": 140, "width": SCREEN_WIDTH, "height": 3 * 50},
+                                        children=self._suggestion_cells()))
+
+        if self._screen == "results":
+            elements.append(FakeElement(self, "XCUIElementTypeCollectionView", "results",
+                                        {"x": 0, "y": 140, "width": SCREEN_WIDTH, "height": 620},
+                                        children=self._result_cells()))
+
+        if self._screen == "detail":
+            back = FakeElement(self, "XCUIElementTypeButton", "Back",
+                               {"x": 0, "y": 44, "width": 60, "height": 44}, on_tap=self.back)
+            nav_bar.children.append(back)
+            quantity = self.basket.get(self._product, 0)
+            elements.append(FakeElement(self, "XCUIElementTypeStaticText", self._product or "",
+                                        {"x": 16, "y": 300, "width": 358, "height": 30}))
+            elements.append(FakeElement(self, "XCUIElementTypeButton", "Favoriet",
+                                        {"x": 16, "y": 640, "width": 44, "height": 44}))
+            if quantity:
+                # In the basket already: a quantity stepper replaces "Voeg toe", like in the app
+                elements.append(FakeElement(self, "XCUIElementTypeButton", "-",
+                                            {"x": 200, "y": 640, "width": 44, "height": 44},
+                                            on_tap=self._remove_from_basket))
+                elements.append(FakeElement(self, "XCUIElementTypeStaticText", str(quantity),
+                                            {"x": 250, "y": 640, "width": 44, "height": 44}))
+                elements.append(FakeElement(self, "XCUIElementTypeButton", "+",
+                                            {"x": 300, "y": 640, "width": 44, "height": 44},
+                                            on_tap=self._add_to_basket))
+            else:
+                elements.append(FakeElement(self, "XCUIElementTypeButton", "Voeg toe",
+                                            {"x": 200, "y": 640, "width": 174, "height": 44},
+                                            on_tap=self._add_to_basket))
+
+        if self._screen == "profile":
+            if self.account:
+                elements.append(FakeElement(self, "XCUIElementTypeStaticText", self.account,
+                                            {"x": 16, "y": 120, "width": 358, "height": 30}))
+                elements.append(FakeElement(self, "XCUIElementTypeButton", "Uitloggen",
+                                            {"x": 16, "y": 640, "width": 358, "height": 44},
+                                            on_tap=self._logout))
+            else:
+                elements.append(FakeElement(self, "XCUIElementTypeButton", "Inloggen",
+                                            {"x": 16, "y": 640, "width": 358, "height": 44},
+                                            on_tap=lambda: self._navigate("login")))
+
+        if self._screen == "login":
+            self._login_fields = [
+                FakeElement(self, "XCUIElementTypeTextField", "E-mailadres",
+                            {"x": 16, "y": 200, "width": 358, "height": 44}, text_input=True),
+                FakeElement(self, "XCUIElementTypeSecureTextField", "Wachtwoord",
+                            {"x": 16, "y": 260, "width": 358, "height": 44}, text_input=True),
+            ]
+            elements.extend(self._login_fields)
+            elements.append(FakeElement(self, "XCUIElementTypeButton", "Inloggen",
+                                        {"x": 16, "y": 340, "width": 358, "height": 44},
+                                        on_tap=self._login))
+
+        elements.append(tab_bar)
+        if self._popup:
+            # Modal: swallows taps and hides the screen below from element lookups
+            elements.append(FakeElement(self, "XCUIElementTypeOther", "promo_sheet",
+                                        {"x": 0, "y": 0, "width": SCREEN_WIDTH, "height": SCREEN_HEIGHT},
+                                        on_tap=lambda: None,
+                                        children=[
+                                            FakeElement(self, "XCUIElementTypeStaticText", "Nieuwe bonusaanbiedingen",
+                                                        {"x": 16, "y": 300, "width": 358, "height": 30}),
+                                            FakeElement(self, "XCUIElementTypeButton", "Sluiten",
+                                                        {"x": 16, "y": 600, "width": 358, "height": 44},
+                                                        on_tap=self._close_popup),
+                                        ]))
+        self._elements = elements
+
+    def _result_cells(self) -> List[FakeElement]:
+        query = self._query.title() or "Product"
+        titles = [
+            (f"Gesponsord: {query} actiepakket", "1 st", "€ 9,99"),
+            (f"AH {query}", "1 l", "€ 1,29"),
+            (f"AH Biologisch {query}", "1 l", "€ 1,79"),
+            (f"{query} voordeelverpakking", "6 x 1 l", "€ 6,49"),
+        ]
+        cells = []
+        for idx, (title, size, price) in enumerate(titles):
+            y = 150 + idx * 150
+            cells.append(FakeElement(
+                self, "XCUIElementTypeCell", "",
+                {"x": 0, "y": y, "width": SCREEN_WIDTH, "height": 140},
+                on_tap=lambda title=title: self._open_product(title),
+                children=[
+                    FakeElement(self, "XCUIElementTypeStaticText", title, {"x": 16, "y": y + 10, "width": 300, "height": 24}),
+                    FakeElement(self, "XCUIElementTypeStaticText", size, {"x": 16, "y": y + 40, "width": 100, "height": 20}),
+                    FakeElement(self, "XCUIElementTypeStaticText", price, {"x": 16, "y": y + 70, "width": 100, "height": 20}),
+                ],
+            ))
+        return cells
+
+    def _suggestion_cells(self) -> List[FakeElement]:
+        query = self._draft.strip().title()
+        titles = [f"AH {query}", f"AH Biologisch {query}", f"{query} voordeelverpakking"]
+        cells = []
+        for idx, title in enumerate(titles):
+            y = 140 + idx * 50
+            cells.append(FakeElement(
+                self, "XCUIElementTypeCell", "",
+                {"x": 0, "y": y, "width": SCREEN_WIDTH, "height": 50},
+                on_tap=lambda title=title: self._open_product(title),
+                children=[FakeElement(self, "XCUIElementTypeStaticText", title,
+                                      {"x": 16, "y": y + 13, "width": 300, "height": 24})],
+            ))
+        return cells
+
+    def _roots(self) -> List[FakeElement]:
+        # A modal hides the screen below it, from lookups and page source alike
+        return self._elements[-1:] if self._popup else self._elements
+
+    def _all_elements(self) -> List[FakeElement]:
+        return [element for root in self._roots() for element in root.iter()]
+
+    def _matches(self, element: FakeElement, by: str, selector: str) -> bool:
+        if by in (AppiumBy.ACCESSIBILITY_ID, AppiumBy.ID):
+            # XCUITest resolves "id" like accessibility id
+            return element.name == selector
+        if by in (AppiumBy.CLASS_NAME, AppiumBy.TAG_NAME):
+            return element.type.lower().endswith(selector.lower())
+        if by == AppiumBy.XPATH:
+            match = _XPATH_TYPE_RE.match(selector)
+            if not match or match.group(1) != element.type:
+                return False
+            literals = [literal for literal in _XPATH_LITERAL_RE.findall(selector) if literal != "true"]
+            return not literals or any(literal in element.name for literal in literals)
+        return False
+
+    def _hit_test(self, x: float, y: float) -> Optional[FakeElement]:
+        hit = None
+        for element in self._all_elements():
+            rect = element._rect
+            if rect["x"] <= x <= rect["x"] + rect["width"] and rect["y"] <= y <= rect["y"] + rect["height"]:
+                if element.on_tap or element.text_input:
+                    hit = element
+        return hit
+
+    # WebDriver API used by the automation code
+
+    def find_elements(self, by: str, selector: str) -> List[FakeElement]:
+        self._command("findElements", locator=f"{by}={selector}")
+        selector = selector.replace("[1]", "").replace("[@visible='true']", "")
+        return [element for element in self._all_elements() if self._matches(element, by, selector)]
+
+    def find_element(self, by: str, selector: str) -> FakeElement:
+        self._command("findElement", locator=f"{by}={selector}")
+        selector = selector.replace("[1]", "").replace("[@visible='true']", "")
+        for element in self._all_elements():
+            if self._matches(element, by, selector):
+                return element
+        raise NoSuchElementException(f"No element matching {by}={selector}")
+
+    @property
+    def page_source(self) -> str:
+        command_span = self._command("getPageSource")
+        body = "\n".join(element.to_xml("    ") for element in self._roots())
+        source = (
+            '<?xml version="1.0" encoding="UTF-8"?>\n<AppiumAUT>\n'
+            f'  <XCUIElementTypeApplication type="XCUIElementTypeApplication" name="AH" '
+            f'x="0" y="0" width="{SCREEN_WIDTH}" height="{SCREEN_HEIGHT}">\n'
+            f"{body}\n  </XCUIElementTypeApplication>\n</AppiumAUT>"
+        )
+        if command_span:
+            command_span.set(bytes=len(source))
+        return source
+
+    def get_window_size(self) -> dict:
+        self._command("getWindowSize")
+        return {"width": SCREEN_WIDTH, "height": SCREEN_HEIGHT}
+
+    def get_performance_data(self, package_name: str, data_type: str, data_read_timeout: Optional[int] = None):
+        self._command("getPerformanceData")
+        if data_type != "memoryinfo":
+            return []
+        # The server's memory grows with the commands it served, like UiAutomator2 over a long session
+        total_pss = SERVER_BASE_MEMORY_KB + self.command_count * SERVER_MEMORY_PER_COMMAND_KB
+        return [["totalPrivateDirty", "totalPss"], [str(total_pss), str(total_pss)]]
+
+    def get_screenshot_as_png(self) -> bytes:
+        self._command("screenshot")
+        return b"\x89PNG\r\n\x1a\n" + self._screen.encode("utf-8")
+
+    def execute_script(self, script: str, *args):
+        self._command(f"w3cExecuteScript[{script}]")
+        params = args[0] if args and isinstance(args[0], dict) else {}
+        if script == "mobile: tap":
+            element = self._hit_test(params.get("x", 0), params.get("y", 0))
+            if element:
+                self._tap(element)
+        return None
+
+    def execute(self, command: str, params: Optional[dict] = None) -> dict:
+        self._command(command)
+        if command == "actions":
+            for source in (params or {}).get("actions", []):
+                x = y = down = None
+                for action in source.get("actions", []):
+                    if action.get("type") == "pointerMove":
+                        x, y = action.get("x"), action.get("y")
+                    elif action.get("type") == "pointerDown":
+                        down = (x, y)
+                    elif action.get("type") == "pointerUp" and x is not None:
+                        if down and abs(down[1] - y) > 10:
+                            # A swipe: the fake screens all fit without scrolling
+                            self.swipes += 1
+                            continue
+                        element = self._hit_test(x, y)
+                        if element:
+                            self._tap(element)
+        return {"value": None}
+
+    def back(self):
+        self._command("back")
+        if self._history:
+            self._screen = self._history.pop()
+            self._render()
+
+    def press_keycode(self, keycode: int):
+        if keycode == 4:
+            self.back()
+
+    def activate_app(self, app_id: str):
+        self._command("activateApp")
+
+    def terminate_app(self, app_id: str, **options) -> bool:
+        self._command("terminateApp")
+        self._screen = "home"
+        self._history = []
+        self._render()
+        return True
+
+    def quit(self):
+        self._closed = True
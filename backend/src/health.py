@@ -0,0 +1,315 @@
+"""
+Device session health
+Per-device probe latency trend and command error rate, and a background monitor that probes
+idle sessions and recycles dead or degraded ones before the next basket runs into them
+"""
+
+import asyncio
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from .config import (
+    HEALTH_PROBE_INTERVAL,
+    HEALTH_PROBE_TIMEOUT,
+    HEALTH_WINDOW,
+    HEALTH_LATENCY_FACTOR,
+    HEALTH_MAX_ERROR_RATE,
+    HEALTH_MAX_SERVER_MEMORY_MB,
+)
+from .context import current_device_id
+from .metrics import metrics
+
+if TYPE_CHECKING:
+    from .scheduler import Device, Scheduler
+
+logger = logging.getLogger(__name__)
+
+# Probes after a new session whose median is the latency baseline
+BASELINE_PROBES = 5
+
+# Recent probes compared against the baseline
+TREND_PROBES = 3
+
+# Failed probes in a row after which the session is considered dead
+DEAD_AFTER_FAILURES = 2
+
+# Driver commands kept for the error rate (and needed before it counts)
+COMMAND_WINDOW = 200
+MIN_COMMANDS = 20
+
+# Floor for the latency increase that counts as degraded (ms), so a 5 ms -> 15 ms change does not
+MIN_LATENCY_INCREASE_MS = 100.0
+
+# App running the UiAutomator2 server behind an Android session
+UIAUTOMATOR2_SERVER_PACKAGE = "io.appium.uiautomator2.server"
+
+# Seconds dumpsys may take to report the server's memory
+MEMORY_READ_TIMEOUT = 5
+
+
+class DeviceHealth:
+    """
+    Health of a device's current session
+
+    Latency comes from identical probe commands (comparable over time); the error rate from all
+    driver commands the session ran. A slowly rising probe latency is the visible symptom of
+    WebDriverAgent / UiAutomator2 growing memory over a long session; on Android the
+    UiAutomator2 server's memory is also sampled directly.
+
+    Args:
+        window: Probe latencies kept
+    """
+
+    def __init__(self, window: int = HEALTH_WINDOW):
+        self.window = window
+        self.session_key: Optional[int] = None
+        self.session_started_at: Optional[float] = None
+        self.probes: Deque[float] = deque(maxlen=window)
+        self.baseline_ms: Optional[float] = None
+        self.consecutive_failures = 0
+        self.last_probe_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.server_memory_mb: Optional[float] = None
+        self.recycles = 0
+        self._commands: Deque[bool] = deque(maxlen=COMMAND_WINDOW)
+        self._lock = threading.Lock()
+
+    def new_session(self, key: int):
+        """Start over for a new session (identified by the driver object)"""
+        with self._lock:
+            self.session_key = key
+            self.session_started_at = time.time()
+            self.probes.clear()
+            self.baseline_ms = None
+            self.consecutive_failures = 0
+            self.last_error = None
+            self.server_memory_mb = None
+            self._commands.clear()
+
+    def record_probe(self, latency_ms: Optional[float], error: Optional[str] = None):
+        """Record a probe result (latency_ms None if it failed)"""
+        with self._lock:
+            self.last_probe_at = time.time()
+            if error is not None:
+                self.consecutive_failures += 1
+                self.last_error = error
+                return
+            self.consecutive_failures = 0
+            self.probes.append(latency_ms)
+            if self.baseline_ms is None and len(self.probes) >= BASELINE_PROBES:
+                self.baseline_ms = statistics.median(self.probes)
+
+    def record_command(self, ok: bool):
+        with self._lock:
+            self._commands.append(ok)
+
+    def record_memory(self, memory_mb: Optional[float]):
+        """Record the automation server's memory (None if it could not be read)"""
+        with self._lock:
+            self.server_memory_mb = memory_mb
+
+    @property
+    def error_rate(self) -> float:
+        with self._lock:
+            commands = list(self._commands)
+        if len(commands) < MIN_COMMANDS:
+            return 0.0
+        return commands.count(False) / len(commands)
+
+    def recent_ms(self) -> Optional[float]:
+        with self._lock:
+            recent = list(self.probes)[-TREND_PROBES:]
+        return statistics.median(recent) if recent else None
+
+    def trend(self) -> Optional[float]:
+        """Recent probe latency relative to the session's baseline (None until known)"""
+        recent = self.recent_ms()
+        if self.baseline_ms is None or recent is None or len(self.probes) < BASELINE_PROBES + TREND_PROBES:
+            return None
+        return recent / self.baseline_ms if self.baseline_ms > 0 else None
+
+    @property
+    def state(self) -> str:
+        """"unknown", "healthy", "degraded" (recycle when idle) or "dead" (session is gone)"""
+        if self.session_key is None:
+            return "unknown"
+        if self.consecutive_failures >= DEAD_AFTER_FAILURES:
+            return "dead"
+        if self.error_rate > HEALTH_MAX_ERROR_RATE:
+            return "degraded"
+        if HEALTH_MAX_SERVER_MEMORY_MB > 0 and self.server_memory_mb is not None \
+                and self.server_memory_mb >= HEALTH_MAX_SERVER_MEMORY_MB:
+            return "degraded"
+        trend = self.trend()
+        if trend is not None and trend >= HEALTH_LATENCY_FACTOR \
+                and self.recent_ms() - self.baseline_ms >= MIN_LATENCY_INCREASE_MS:
+            return "degraded"
+        return "healthy"
+
+    def to_dict(self) -> dict:
+        recent = self.recent_ms()
+        trend = self.trend()
+        return {
+            "state": self.state,
+            "probe_ms": round(recent, 1) if recent is not None else None,
+            "baseline_ms": round(self.baseline_ms, 1) if self.baseline_ms is not None else None,
+            "latency_trend": round(trend, 2) if trend is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "server_memory_mb": round(self.server_memory_mb, 1) if self.server_memory_mb is not None else None,
+            "probes": len(self.probes),
+            "consecutive_failures": self.consecutive_failures,
+            "last_probe_at": self.last_probe_at,
+            "last_error": self.last_error,
+            "session_started_at": self.session_started_at,
+            "recycles": self.recycles,
+        }
+
+
+_devices: Dict[str, DeviceHealth] = {}
+
+
+class CommandTally:
+    """Driver commands counted while the tally is active (e.g. during one item)"""
+
+    def __init__(self):
+        self.ok = 0
+        self.failed = 0
+
+    @property
+    def mostly_failed(self) -> bool:
+        """More commands failed on the device than succeeded (a dead or dying session)"""
+        return self.failed > self.ok
+
+
+_tallies: ContextVar[Tuple[CommandTally, ...]] = ContextVar("command_tallies", default=())
+
+
+@contextmanager
+def command_tally():
+    """Count the driver commands of the current coroutine (and the tasks and threads it starts)"""
+    tally = CommandTally()
+    token = _tallies.set(_tallies.get() + (tally,))
+    try:
+        yield tally
+    finally:
+        _tallies.reset(token)
+
+
+def health_for(device_id: str) -> DeviceHealth:
+    health = _devices.get(device_id)
+    if health is None:
+        health = _devices.setdefault(device_id, DeviceHealth())
+    return health
+
+
+def record_command(ok: bool):
+    """Count a driver command of the device the current coroutine works for"""
+    device_id = current_device_id.get()
+    if device_id:
+        health_for(device_id).record_command(ok)
+    for tally in _tallies.get():
+        if ok:
+            tally.ok += 1
+        else:
+            tally.failed += 1
+
+
+def probe(driver):
+    """Cheapest command that still round-trips to WebDriverAgent / UiAutomator2"""
+    driver.get_window_size()
+
+
+def server_memory_mb(driver) -> Optional[float]:
+    """
+    Memory (total PSS) of the UiAutomator2 server behind an Android session, in MB
+
+    WebDriverAgent's memory is not exposed through the session, so iOS sessions return None
+    and are judged by the probe latency trend alone.
+    """
+    platform = str((driver.capabilities or {}).get("platformName", "")).lower()
+    if platform != "android":
+        return None
+    table: List[List] = driver.get_performance_data(UIAUTOMATOR2_SERVER_PACKAGE, "memoryinfo",
+                                                    MEMORY_READ_TIMEOUT)
+    if not table or len(table) < 2 or "totalPss" not in table[0]:
+        return None
+    value = table[1][table[0].index("totalPss")]
+    return float(value) / 1024 if value not in (None, "") else None
+
+
+class HealthMonitor:
+    """
+    Periodically probes the sessions of idle devices and recycles unhealthy ones
+
+    Busy devices are not probed: the running basket's own commands feed the error rate.
+
+    Args:
+        scheduler: Scheduler owning the devices
+        recycle: Coroutine replacing a device's session with a fresh one
+        interval: Seconds between probe rounds
+    """
+
+    def __init__(self, scheduler: "Scheduler", recycle: Callable[["Device"], Awaitable[None]],
+                 interval: float = HEALTH_PROBE_INTERVAL):
+        self.scheduler = scheduler
+        self.recycle = recycle
+        self.interval = interval
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await asyncio.gather(*(self.check(device) for device in self.scheduler.devices.values()))
+
+    @staticmethod
+    def _idle(device: "Device") -> bool:
+        return device.current_job is None and not device.session_lock.locked()
+
+    async def check(self, device: "Device"):
+        driver = device.driver
+        if driver is None or not device.leased:
+            return
+        health = device.health
+        if health.session_key != id(driver):
+            health.new_session(id(driver))
+        if not self._idle(device):
+            return
+
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.to_thread(probe, driver), timeout=HEALTH_PROBE_TIMEOUT)
+        except Exception as e:
+            health.record_probe(None, str(e).strip() or e.__class__.__name__)
+            metrics.increment("health.probe_failures")
+            logger.info("Health probe of %s failed: %s", device.id, health.last_error)
+        else:
+            latency_ms = (time.perf_counter() - started) * 1000
+            health.record_probe(latency_ms)
+            metrics.observe(f"health.probe.{device.id}", latency_ms)
+            if HEALTH_MAX_SERVER_MEMORY_MB > 0:
+                await self._sample_memory(device, driver)
+
+        state = health.state
+        if state in ("dead", "degraded") and self._idle(device) and device.driver is driver:
+            logger.warning("Recycling %s session on %s: %s", state, device.id, health.to_dict())
+            try:
+                await self.recycle(device)
+            except Exception as e:
+                logger.error("Could not recycle the session on %s: %s", device.id, e)
+            health.recycles += 1
+            metrics.increment("health.recycles")
+
+    async def _sample_memory(self, device: "Device", driver):
+        health = device.health
+        try:
+            memory_mb = await asyncio.wait_for(asyncio.to_thread(server_memory_mb, driver),
+                                               timeout=HEALTH_PROBE_TIMEOUT)
+        except Exception as e:
+            # Not every server build reports memory; a failed read says nothing about the session
+            logger.debug("Could not read the server memory on %s: %s", device.id, e)
+            memory_mb = None
+        health.record_memory(memory_mb)
@@ -0,0 +1,135 @@
+"""
+Duplicate basket submissions
+A basket is identified by the client's idempotency key, or by its user, device type, account
+and product list; a duplicate follows the job already running for it (or its result, for a
+short while after it completed) instead of adding every product a second time
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import List, Optional, Union
+from .config import IDEMPOTENCY_ENABLED, IDEMPOTENCY_TTL
+from .registry import LocalRegistry, Registry
+from .scheduler import Job
+
+logger = logging.getLogger(__name__)
+
+# Keys kept at most (oldest dropped first, even if their job is still running)
+MAX_KEYS = 1000
+
+# User id of requests that do not name a user; different people, so never matched by content
+ANONYMOUS_USER = "anonymous"
+
+
+def idempotency_key(client_key: Optional[str], user_id: str, device_type: str, account: Optional[str],
+                    products: List[dict]) -> Optional[str]:
+    """
+    Key of a basket submission (None when it is not deduplicated)
+
+    A client key is scoped to the user; without one the key is derived from the basket's
+    content, with products compared by name (case and spacing ignored) and quantity, in any order.
+    Anonymous submissions without a client key are not deduplicated: the same basket from two
+    anonymous users must not end up on one job.
+    """
+    if not IDEMPOTENCY_ENABLED:
+        return None
+    if client_key:
+        basis = ["key", user_id, client_key]
+    elif not user_id or user_id == ANONYMOUS_USER:
+        return None
+    else:
+        items = sorted((" ".join(str(product["name"]).lower().split()), int(product.get("quantity", 1)))
+                       for product in products)
+        basis = ["content", user_id, device_type.lower(), account, items]
+    return hashlib.sha256(json.dumps(basis, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class IdempotentJobs:
+    """
+    Jobs by idempotency key: while they run, and for `ttl` seconds after they completed
+
+    Failed jobs are forgotten when they fail, so a retry of the basket runs again. Keys are
+    claimed in the registry shared by the worker processes, so a duplicate reaching another
+    worker follows the job the first one runs.
+
+    Args:
+        registry: Registry shared with the other worker processes
+        ttl: Seconds a completed job keeps answering duplicates
+        max_keys: Keys kept at most
+    """
+
+    def __init__(self, registry: Optional[Registry] = None, ttl: float = IDEMPOTENCY_TTL,
+                 max_keys: int = MAX_KEYS):
+        self.registry = registry or LocalRegistry()
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        # Held from looking a key up to claiming it, so two local duplicates cannot both claim
+        self._claiming = asyncio.Lock()
+
+    def _usable(self, job: Job, now: float) -> bool:
+        if not job.finished:
+            return True
+        return job.status == "completed" and now - (job.finished_at or 0) < self.ttl
+
+    def get(self, key: Optional[str]) -> Optional[Job]:
+        """Running or recently completed job for a key"""
+        if key is None:
+            return None
+        job = self._jobs.get(key)
+        if job is None:
+            return None
+        if not self._usable(job, time.time()):
+            del self._jobs[key]
+            return None
+        return job
+
+    def add(self, key: Optional[str], job: Job):
+        if key is None:
+            return
+        now = time.time()
+        for stale in [stale for stale, entry in self._jobs.items() if not self._usable(entry, now)]:
+            del self._jobs[stale]
+        self._jobs[key] = job
+        while len(self._jobs) > self.max_keys:
+            self._jobs.popitem(last=False)
+
+    async def claim(self, key: Optional[str], job: Job) -> Union[Job, str]:
+        """
+        Job answering a basket submission
+
+        Returns:
+            The job of this process already answering the key, the id of a job another worker
+            process runs for it, or `job` itself once the key is claimed for it
+        """
+        if key is None:
+            return job
+        async with self._claiming:
+            existing = self.get(key)
+            if existing is not None:
+                return existing
+            try:
+                holder = await asyncio.to_thread(self.registry.claim_key, key, job.id, self.ttl)
+            except Exception as e:
+                # Running a basket twice is better than not running it
+                logger.error("Could not claim idempotency key for job %s: %s", job.id, e)
+                holder = job.id
+            if holder != job.id:
+                return holder
+            self.add(key, job)
+            return job
+
+    async def discard(self, key: Optional[str], job: Job):
+        """Forget a key if it still points to `job` (e.g. the job was never admitted)"""
+        if key is None:
+            return
+        if self._jobs.get(key) is job:
+            del self._jobs[key]
+        try:
+            await asyncio.to_thread(self.registry.release_key, key, job.id)
+        except Exception as e:
+            logger.error("Could not release idempotency key of job %s: %s", job.id, e)
@@ -0,0 +1,173 @@
+"""
+Low-level touch interaction helpers
+Taps are sent as single W3C actions calls instead of element lookups and clicks. Elements are
+only scrolled to when too little of them is on screen (checked against the session's window
+size, fetched once), with one swipe sized to the distance
+"""
+
+import time
+from typing import Dict, Optional, Tuple
+from selenium.webdriver.common.action_chains import ActionChains
+from selenium.webdriver.common.actions import interaction
+from selenium.webdriver.common.actions.action_builder import ActionBuilder
+from selenium.webdriver.common.actions.pointer_input import PointerInput
+from .config import AH_SLEEP_SCALE
+
+# Width and height of an element that must be on screen for a tap on it to land
+MIN_VISIBLE = 10
+
+# Swipes stay within this band of the screen height, clear of navigation and tab bars
+SCROLL_BAND = (0.25, 0.75)
+
+# Duration of a swipe's move (ms); slow enough that the list stops where the finger lifts
+SWIPE_MS = 400
+
+# Swipes per element before tapping wherever it ended up
+MAX_SCROLLS = 3
+
+# Window size per session id (sessions are few; the cache is cleared past this many)
+MAX_CACHED_SESSIONS = 64
+
+_window_sizes: Dict[str, Dict[str, int]] = {}
+
+
+def window_size(driver) -> Dict[str, int]:
+    """Window size of the driver's session, fetched once per session"""
+    session_id = getattr(driver, "session_id", None) or str(id(driver))
+    size = _window_sizes.get(session_id)
+    if size is None:
+        size = dict(driver.get_window_size())
+        if len(_window_sizes) >= MAX_CACHED_SESSIONS:
+            _window_sizes.clear()
+        _window_sizes[session_id] = size
+    return size
+
+
+def forget_window_size(driver):
+    """Drop the cached window size of a session that is closing"""
+    _window_sizes.pop(getattr(driver, "session_id", None) or str(id(driver)), None)
+
+
+def rect_center(rect: Dict[str, int]) -> Tuple[int, int]:
+    """Center point of an element rect"""
+    return (
+        int(rect["x"] + rect["width"] / 2),
+        int(rect["y"] + rect["height"] / 2),
+    )
+
+
+def visible_part(rect: Dict[str, int], size: Dict[str, int]) -> Optional[Dict[str, int]]:
+    """Part of an element rect inside the window, or None if too little of it is"""
+    left = max(rect["x"], 0)
+    top = max(rect["y"], 0)
+    right = min(rect["x"] + rect["width"], size["width"])
+    bottom = min(rect["y"] + rect["height"], size["height"])
+    if right - left < MIN_VISIBLE or bottom - top < MIN_VISIBLE:
+        return None
+    return {"x": left, "y": top, "width": right - left, "height": bottom - top}
+
+
+def in_view(driver, rect: Dict[str, int]) -> bool:
+    """Whether an element rect can be tapped without scrolling"""
+    return visible_part(rect, window_size(driver)) is not None
+
+
+def _touch_actions(driver, duration: int = 250) -> ActionChains:
+    actions = ActionChains(driver)
+    actions.w3c_actions = ActionBuilder(
+        driver, mouse=PointerInput(interaction.POINTER_TOUCH, "touch"), duration=duration
+    )
+    return actions
+
+
+def tap_at(driver, x: int, y: int):
+    """
+    Tap a screen coordinate with one W3C actions call
+
+    Args:
+        driver: Appium WebDriver
+        x: Horizontal coordinate in points/pixels
+        y: Vertical coordinate in points/pixels
+    """
+    actions = _touch_actions(driver)
+    actions.w3c_actions.pointer_action.move_to_location(x, y)
+    actions.w3c_actions.pointer_action.pointer_down()
+    actions.w3c_actions.pointer_action.pause(0.05)
+    actions.w3c_actions.pointer_action.release()
+    actions.perform()
+
+
+def tap_rect(driver, rect: Dict[str, int]):
+    """Tap the center of an element rect"""
+    x, y = rect_center(rect)
+    tap_at(driver, x, y)
+
+
+def swipe(driver, x: int, from_y: int, to_y: int):
+    """Vertical swipe with one W3C actions call"""
+    actions = _touch_actions(driver, SWIPE_MS)
+    actions.w3c_actions.pointer_action.move_to_location(x, from_y)
+    actions.w3c_actions.pointer_action.pointer_down()
+    actions.w3c_actions.pointer_action.pause(0.1)
+    actions.w3c_actions.pointer_action.move_to_location(x, to_y)
+    actions.w3c_actions.pointer_action.release()
+    actions.perform()
+
+
+def scroll_by(driver, offset: int) -> int:
+    """
+    Scroll the content by `offset` (positive: bring content below the screen up) with one swipe
+
+    Returns:
+        int: Distance actually swiped (at most the height of SCROLL_BAND)
+    """
+    size = window_size(driver)
+    top, bottom = (int(size["height"] * fraction) for fraction in SCROLL_BAND)
+    distance = max(top - bottom, min(bottom - top, offset))
+    x = size["width"] // 2
+    if distance > 0:
+        swipe(driver, x, bottom, bottom - distance)
+    elif distance < 0:
+        swipe(driver, x, top, top - distance)
+    return distance
+
+
+def scroll_into_view(driver, element, rect: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    """
+    Make an element tappable, scrolling only when too little of it is on screen
+
+    Each swipe moves the element's center towards the middle of the screen; the rect is
+    fetched once per swipe (and not at all if the caller already has it).
+
+    Args:
+        driver: Appium WebDriver
+        element: WebElement to bring into view
+        rect: The element's rect, if already known
+
+    Returns:
+        dict: On-screen part of the element's rect (its whole rect if it stayed off screen)
+    """
+    rect = rect or element.rect
+    size = window_size(driver)
+    for _ in range(MAX_SCROLLS):
+        visible = visible_part(rect, size)
+        if visible:
+            return visible
+        offset = int(rect["y"] + rect["height"] / 2 - size["height"] / 2)
+        if not scroll_by(driver, offset):
+            break
+        time.sleep(0.3 * AH_SLEEP_SCALE)
+        rect = element.rect
+    return visible_part(rect, size) or rect
+
+
+def tap_element(driver, element, rect: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    """
+    Tap an element: one rect fetch (unless given), a swipe only if it is off screen, one tap
+
+    Returns:
+        dict: The rect that was tapped
+    """
+    visible = scroll_into_view(driver, element, rect)
+    tap_rect(driver, visible)
+    return visible
@@ -0,0 +1,182 @@
+"""
+Popup and interrupt handling
+Registry of known interrupts (splash/login skip, cookie consent, promos, rating prompts, system
+alerts). They are only looked for when a step misses its target: one page snapshot is checked
+against each handler's cheap text signature, and a matching interrupt is dismissed with one tap
+"""
+
+import asyncio
+import logging
+from typing import Dict, List, Optional, Sequence
+import xml.etree.ElementTree as ET
+from .config import AH_SLEEP_SCALE
+from .interaction import tap_rect
+from .metrics import metrics
+from .snapshot import Snapshot, element_is_displayed, element_label, element_rect, element_tag, take_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Interrupts dismissed per miss (a promo can appear right after the cookie banner)
+MAX_STACKED_INTERRUPTS = 3
+
+# Element types that can dismiss an interrupt
+BUTTON_TAGS = (
+    "XCUIElementTypeButton",
+    "XCUIElementTypeLink",
+    "android.widget.Button",
+    "android.widget.ImageButton",
+    "android.widget.TextView",
+)
+
+# Element types of modal containers (alerts, sheets, popovers)
+MODAL_TAGS = (
+    "XCUIElementTypeAlert",
+    "XCUIElementTypeSheet",
+    "XCUIElementTypePopover",
+)
+
+# Parts of the resource-id / accessibility id of modal containers (lowercase)
+MODAL_IDS = ("modal", "sheet", "dialog", "popup", "parentpanel")
+
+
+class InterruptHandler:
+    """
+    One kind of interrupt and how to dismiss it
+
+    Args:
+        name: Interrupt name (used in logs and metrics)
+        markers: Texts of which at least one appears in the page source while the interrupt
+            is shown (checked as plain substrings, before any parsing work)
+        dismiss: Labels of the button that closes the interrupt, in order of preference
+        container_tags: If set (or container_ids), the dismiss button only counts inside a node
+            of one of these types (e.g. an alert)
+        container_ids: Parts of the resource-id / accessibility id of such a container
+            (e.g. "promo"), matched case-insensitively
+    """
+
+    def __init__(self, name: str, markers: Sequence[str], dismiss: Sequence[str],
+                 container_tags: Sequence[str] = (), container_ids: Sequence[str] = ()):
+        self.name = name
+        self.markers = tuple(markers)
+        self.dismiss = tuple(label.lower() for label in dismiss)
+        self.container_tags = tuple(container_tags)
+        self.container_ids = tuple(marker.lower() for marker in container_ids)
+
+    def matches(self, snapshot: Snapshot) -> bool:
+        """Cheap check of the raw page source"""
+        return any(marker in snapshot.source for marker in self.markers)
+
+    def is_container(self, element: ET.Element) -> bool:
+        if element_tag(element) in self.container_tags:
+            return True
+        identifier = (element.get("resource-id") or element.get("name") or "").lower()
+        return bool(identifier) and any(marker in identifier for marker in self.container_ids)
+
+    def dismiss_target(self, snapshot: Snapshot) -> Optional[Dict[str, int]]:
+        """Rect of the button closing the interrupt, or None if it is not on screen"""
+        if self.container_tags or self.container_ids:
+            # A "Sluiten" on the page itself is not this interrupt's button
+            roots = [element for element in snapshot.iter() if self.is_container(element)]
+        else:
+            roots = [snapshot.root]
+        best: Optional[ET.Element] = None
+        best_rank = len(self.dismiss)
+        for root in roots:
+            for element in root.iter():
+                if element_tag(element) not in BUTTON_TAGS or not element_is_displayed(element):
+                    continue
+                label = element_label(element).strip().lower()
+                if label in self.dismiss and self.dismiss.index(label) < best_rank:
+                    best, best_rank = element, self.dismiss.index(label)
+        return element_rect(best) if best is not None else None
+
+
+# Checked in order; the first handler whose signature and dismiss button are both on screen wins
+INTERRUPT_HANDLERS: List[InterruptHandler] = [
+    InterruptHandler(
+        "system_alert",
+        markers=("XCUIElementTypeAlert", "com.android.permissioncontroller"),
+        dismiss=("Niet toestaan", "Don’t Allow", "Don't Allow", "Deny", "OK"),
+        container_tags=("XCUIElementTypeAlert", "android.widget.FrameLayout"),
+    ),
+    InterruptHandler(
+        "cookie_consent",
+        markers=("cookie", "Cookie"),
+        dismiss=("Accepteren", "Alles accepteren", "Akkoord", "Accept", "Accept all"),
+    ),
+    InterruptHandler(
+        "splash_skip",
+        markers=("Overslaan", "Skip"),
+        dismiss=("Overslaan", "Skip"),
+    ),
+    InterruptHandler(
+        "rating_prompt",
+        markers=("Beoordeel", "beoordelen", "Rate ", "Enjoying"),
+        dismiss=("Niet nu", "Not now", "Later", "Nee, bedankt", "No thanks"),
+    ),
+    InterruptHandler(
+        "login_nag",
+        markers=("Inloggen", "Log in"),
+        dismiss=("Later", "Niet nu", "Not now", "Sluiten", "Close"),
+        container_tags=MODAL_TAGS,
+        container_ids=MODAL_IDS,
+    ),
+    InterruptHandler(
+        "promo",
+        markers=("Sluiten", "Close", "Niet nu", "Not now"),
+        dismiss=("Sluiten", "Close", "Niet nu", "Not now", "✕", "×"),
+        container_tags=MODAL_TAGS,
+        container_ids=MODAL_IDS + ("promo", "bonus"),
+    ),
+]
+
+
+def register_handler(handler: InterruptHandler, first: bool = False):
+    """Add an interrupt handler (checked last, or first)"""
+    if first:
+        INTERRUPT_HANDLERS.insert(0, handler)
+    else:
+        INTERRUPT_HANDLERS.append(handler)
+
+
+def find_interrupt(snapshot: Snapshot):
+    """First handler matching the snapshot, with the rect of its dismiss button"""
+    for handler in INTERRUPT_HANDLERS:
+        if not handler.matches(snapshot):
+            continue
+        rect = handler.dismiss_target(snapshot)
+        if rect:
+            return handler, rect
+    return None, None
+
+
+async def dismiss_interrupts(driver, snapshot: Optional[Snapshot] = None) -> bool:
+    """
+    Dismiss interrupts covering the screen
+
+    Meant to be called when a step missed its target (see run_step's on_miss), never on the
+    happy path: it costs a page source per call.
+
+    Args:
+        driver: Appium WebDriver
+        snapshot: Snapshot already taken of the current screen (saves one page source)
+
+    Returns:
+        bool: True if at least one interrupt was dismissed
+    """
+    dismissed = False
+    for _ in range(MAX_STACKED_INTERRUPTS):
+        snapshot = snapshot or take_snapshot(driver)
+        if snapshot is None:
+            break
+        handler, rect = find_interrupt(snapshot)
+        if handler is None:
+            break
+        logger.info("   🧹 Dismissing interrupt '%s'", handler.name)
+        tap_rect(driver, rect)
+        metrics.increment(f"interrupts.{handler.name}")
+        dismissed = True
+        snapshot = None
+        # Let the dismiss animation finish before the step looks again
+        await asyncio.sleep(0.5 * AH_SLEEP_SCALE)
+    return dismissed
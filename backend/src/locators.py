@@ -0,0 +1,321 @@
+"""
+Local locator evaluation
+Resolves Appium locators (accessibility id, id, class name and a subset of XPath) against a page
+snapshot without a driver round trip, and estimates what the same lookup costs on a device
+"""
+
+import re
+import xml.etree.ElementTree as ET
+from typing import Callable, Dict, List, Optional, Tuple
+from appium.webdriver.common.appiumby import AppiumBy
+from .snapshot import Snapshot, element_is_displayed
+
+# Estimated cost of a find command on a device, excluding the tree walk (ms)
+ROUND_TRIP_MS = 50.0
+
+# Extra cost per node in the page for strategies the driver resolves by walking the whole
+# tree: XPath needs the full XML source built first, class name only a typed query (ms)
+XPATH_MS_PER_NODE = 0.5
+CLASS_MS_PER_NODE = 0.05
+
+_TOKEN_RE = re.compile(
+    r"\s*(?:"
+    r"(?P<literal>'[^']*'|\"[^\"]*\")"
+    r"|(?P<number>\d+)"
+    r"|(?P<op>//|/|::|\[|\]|\(|\)|!=|=|@|,|\*|\.\.|\.)"
+    r"|(?P<name>[A-Za-z_][\w.\-]*)"
+    r")"
+)
+
+_AXES = ("child", "descendant", "descendant-or-self", "parent", "ancestor", "ancestor-or-self", "self")
+
+
+class UnsupportedLocator(ValueError):
+    """The locator uses a strategy or XPath feature the local evaluator does not handle"""
+
+
+def _tokenize(xpath: str) -> List[Tuple[str, str]]:
+    tokens = []
+    position = 0
+    xpath = xpath.strip()
+    while position < len(xpath):
+        match = _TOKEN_RE.match(xpath, position)
+        if not match or match.end() == position:
+            raise UnsupportedLocator(f"Cannot parse XPath at {xpath[position:]!r}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "literal":
+            value = value[1:-1]
+        tokens.append((kind, value))
+        position = match.end()
+    return tokens
+
+
+Predicate = Callable[[ET.Element, int, int], bool]
+
+
+class _XPathParser:
+    """Recursive-descent parser for location paths with attribute and position predicates"""
+
+    def __init__(self, xpath: str):
+        self.xpath = xpath
+        self.tokens = _tokenize(xpath)
+        self.position = 0
+
+    def _peek(self, offset: int = 0) -> Tuple[Optional[str], Optional[str]]:
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def _take(self, value: Optional[str] = None) -> str:
+        kind, token = self._peek()
+        if token is None or (value is not None and token != value):
+            raise UnsupportedLocator(f"Expected {value or 'a token'} in XPath {self.xpath!r}")
+        self.position += 1
+        return token
+
+    def parse(self) -> List[Tuple[bool, str, str, List[Predicate]]]:
+        """Steps as (descendant separator, axis, name test, predicates)"""
+        steps = []
+        if self._peek()[1] not in ("/", "//"):
+            raise UnsupportedLocator(f"Only absolute XPath is supported: {self.xpath!r}")
+        while self._peek()[1] in ("/", "//"):
+            descendant = self._take() == "//"
+            steps.append((descendant, *self._step()))
+        if self._peek()[1] is not None:
+            raise UnsupportedLocator(f"Unexpected {self._peek()[1]!r} in XPath {self.xpath!r}")
+        return steps
+
+    def _step(self) -> Tuple[str, str, List[Predicate]]:
+        if self._peek()[1] == "..":
+            self._take()
+            return "parent", "*", []
+        if self._peek()[1] == ".":
+            self._take()
+            return "self", "*", []
+        axis = "child"
+        if self._peek(1)[1] == "::":
+            axis = self._take()
+            self._take("::")
+            if axis not in _AXES:
+                raise UnsupportedLocator(f"Axis {axis!r} is not supported")
+        kind, name = self._peek()
+        if name != "*" and kind != "name":
+            raise UnsupportedLocator(f"Expected an element name in XPath {self.xpath!r}")
+        self._take()
+        predicates = []
+        while self._peek()[1] == "[":
+            self._take("[")
+            predicates.append(self._predicate())
+            self._take("]")
+        return axis, name, predicates
+
+    def _predicate(self) -> Predicate:
+        kind, token = self._peek()
+        if kind == "number" and self._peek(1)[1] == "]":
+            index = int(self._take())
+            return lambda element, position, size: position == index
+        if token == "last" and self._peek(1)[1] == "(":
+            self._take()
+            self._take("(")
+            self._take(")")
+            return lambda element, position, size: position == size
+        test = self._or()
+        return lambda element, position, size: test(element)
+
+    def _or(self) -> Callable[[ET.Element], bool]:
+        tests = [self._and()]
+        while self._peek()[1] == "or":
+            self._take()
+            tests.append(self._and())
+        return tests[0] if len(tests) == 1 else lambda element: any(test(element) for test in tests)
+
+    def _and(self) -> Callable[[ET.Element], bool]:
+        tests = [self._atom()]
+        while self._peek()[1] == "and":
+            self._take()
+            tests.append(self._atom())
+        return tests[0] if len(tests) == 1 else lambda element: all(test(element) for test in tests)
+
+    def _attribute(self) -> str:
+        self._take("@")
+        return self._take()
+
+    def _literal(self) -> str:
+        kind, token = self._peek()
+        if kind not in ("literal", "number"):
+            raise UnsupportedLocator(f"Expected a literal in XPath {self.xpath!r}")
+        return self._take()
+
+    def _atom(self) -> Callable[[ET.Element], bool]:
+        token = self._peek()[1]
+        if token == "(":
+            self._take()
+            test = self._or()
+            self._take(")")
+            return test
+        if token == "not" and self._peek(1)[1] == "(":
+            self._take()
+            self._take("(")
+            test = self._or()
+            self._take(")")
+            return lambda element: not test(element)
+        if token in ("contains", "starts-with") and self._peek(1)[1] == "(":
+            function = self._take()
+            self._take("(")
+            attribute = self._attribute()
+            self._take(",")
+            value = self._literal()
+            self._take(")")
+            if function == "contains":
+                return lambda element: value in (element.get(attribute) or "")
+            return lambda element: (element.get(attribute) or "").startswith(value)
+        if token == "@":
+            attribute = self._attribute()
+            operator = self._peek()[1]
+            if operator in ("=", "!="):
+                self._take()
+                value = self._literal()
+                if operator == "=":
+                    return lambda element: element.get(attribute) == value
+                return lambda element: element.get(attribute) != value
+            return lambda element: element.get(attribute) is not None
+        raise UnsupportedLocator(f"Unsupported predicate {token!r} in XPath {self.xpath!r}")
+
+
+class LocalFinder:
+    """
+    Evaluates locators against one snapshot
+
+    Args:
+        snapshot: Parsed page source
+    """
+
+    def __init__(self, snapshot: Snapshot):
+        self.snapshot = snapshot
+        # Document node above the root element, so "//X" can match the root itself
+        self._document = ET.Element("#document")
+        self._document.append(snapshot.root)
+        self._parents: Dict[ET.Element, ET.Element] = {}
+        self._order: Dict[ET.Element, int] = {}
+        for index, element in enumerate(self._document.iter()):
+            self._order[element] = index
+            for child in element:
+                self._parents[child] = element
+        self.node_count = len(self._order) - 1
+
+    def _elements(self) -> List[ET.Element]:
+        return list(self.snapshot.iter())
+
+    def find(self, by: str, selector: str) -> List[ET.Element]:
+        """
+        All nodes the driver would return for a locator, in document order
+
+        Raises:
+            UnsupportedLocator: For strategies that only the device can resolve
+        """
+        if by == AppiumBy.ACCESSIBILITY_ID:
+            return [e for e in self._elements() if selector in (e.get("name"), e.get("content-desc"))]
+        if by == AppiumBy.ID:
+            return [e for e in self._elements() if selector in (e.get("resource-id"), e.get("name"))]
+        if by in (AppiumBy.CLASS_NAME, AppiumBy.TAG_NAME):
+            names = {selector, f"XCUIElementType{selector[:1].upper()}{selector[1:]}"}
+            return [e for e in self._elements() if e.tag in names or e.get("class") in names]
+        if by == AppiumBy.XPATH:
+            return self._xpath(selector)
+        raise UnsupportedLocator(f"Strategy {by!r} cannot be evaluated locally")
+
+    def _axis(self, element: ET.Element, axis: str) -> List[ET.Element]:
+        # Reverse axes are returned nearest first, as XPath positions count them
+        if axis == "child":
+            return list(element)
+        if axis == "descendant":
+            return [node for node in element.iter() if node is not element]
+        if axis == "descendant-or-self":
+            return list(element.iter())
+        if axis == "self":
+            return [element]
+        ancestors = []
+        parent = self._parents.get(element)
+        while parent is not None and parent is not self._document:
+            ancestors.append(parent)
+            if axis == "parent":
+                break
+            parent = self._parents.get(parent)
+        if axis == "ancestor-or-self":
+            return [element] + ancestors
+        return ancestors
+
+    def _xpath(self, xpath: str) -> List[ET.Element]:
+        context = [self._document]
+        for descendant, axis, name, predicates in _XPathParser(xpath).parse():
+            if descendant:
+                expanded = {node for element in context for node in element.iter()}
+                context = sorted(expanded, key=self._order.__getitem__)
+            selected = []
+            seen = set()
+            for element in context:
+                candidates = [node for node in self._axis(element, axis) if name == "*" or node.tag == name]
+                for predicate in predicates:
+                    size = len(candidates)
+                    candidates = [node for position, node in enumerate(candidates, 1)
+                                  if predicate(node, position, size)]
+                for node in candidates:
+                    if id(node) not in seen:
+                        seen.add(id(node))
+                        selected.append(node)
+            context = sorted(selected, key=self._order.__getitem__)
+        return [element for element in context if element is not self._document]
+
+    def estimate_ms(self, by: str, matches: int) -> float:
+        """
+        Estimated device time of one find for this locator on this screen
+
+        One round trip, plus a walk of the whole tree for XPath and class name lookups, plus an
+        is_displayed round trip when something matched (as the automation loops check it).
+        """
+        cost = ROUND_TRIP_MS
+        if by == AppiumBy.XPATH:
+            cost += XPATH_MS_PER_NODE * self.node_count
+        elif by in (AppiumBy.CLASS_NAME, AppiumBy.TAG_NAME):
+            cost += CLASS_MS_PER_NODE * self.node_count
+        if matches:
+            cost += ROUND_TRIP_MS
+        return cost
+
+
+def evaluate_selectors(finder: LocalFinder, selectors: List[Tuple[str, str]]) -> dict:
+    """
+    Check an ordered locator list the way the automation loops use it
+
+    The first locator whose first match is displayed wins; the estimated cost is that of every
+    lookup up to and including the winner (or of the whole list when nothing wins).
+
+    Returns:
+        dict with hit, winner (index, by, selector), estimated_ms and per-candidate results
+    """
+    candidates = []
+    winner = None
+    estimated_ms = 0.0
+    for index, (by, selector) in enumerate(selectors):
+        result = {"index": index, "by": by, "selector": selector}
+        try:
+            matches = finder.find(by, selector)
+        except UnsupportedLocator as e:
+            result.update(matches=None, displayed=None, hit=None, error=str(e))
+            candidates.append(result)
+            continue
+        displayed = sum(1 for element in matches if element_is_displayed(element))
+        hit = bool(matches) and element_is_displayed(matches[0])
+        cost = finder.estimate_ms(by, len(matches))
+        result.update(matches=len(matches), displayed=displayed, hit=hit, estimated_ms=round(cost, 1))
+        candidates.append(result)
+        if winner is None:
+            estimated_ms += cost
+            if hit:
+                winner = {"index": index, "by": by, "selector": selector}
+    return {
+        "hit": winner is not None,
+        "winner": winner,
+        "estimated_ms": round(estimated_ms, 1),
+        "candidates": candidates,
+    }
@@ -0,0 +1,219 @@
+"""
+Logging pipeline
+Records are put on a queue by the calling code and formatted and written by a background
+listener thread, tagged with the job, device, item and step they belong to, and kept per job
+for GET /jobs/{job_id}/logs
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, List, Optional
+from .config import LOG_LEVEL, LOG_FORMAT, JOB_LOG_LINES, JOB_LOG_MAX_JOBS
+from .context import current_device_id, current_item, current_job_id, current_step, current_user_id
+
+# Logger of this package ("src"); the automation modules log below it
+PACKAGE_LOGGER = __name__.rsplit(".", 1)[0]
+
+CONTEXT_FIELDS = ("job_id", "device_id", "user_id", "item", "step")
+
+# Verbosity of the job the current coroutine works for (None: server default)
+current_log_level: ContextVar[Optional[int]] = ContextVar("current_log_level", default=None)
+
+
+def parse_level(level) -> int:
+    """Logging level from a name ("debug") or number; INFO if unknown"""
+    if isinstance(level, int):
+        return level
+    value = logging.getLevelName(str(level).upper())
+    return value if isinstance(value, int) else logging.INFO
+
+
+DEFAULT_LEVEL = parse_level(LOG_LEVEL)
+
+
+class JobLevelLogger(logging.Logger):
+    """
+    Logger whose level follows the verbosity of the job the caller works for
+
+    Decided in isEnabledFor(), before a record is built, so a job logging at debug level costs
+    the other jobs nothing. Installed as the logger class by the package's __init__, before any
+    module logger exists; loggers outside this package keep their own level.
+    """
+
+    def __init__(self, name: str, level: int = logging.NOTSET):
+        super().__init__(name, level)
+        self._follows_job = name == PACKAGE_LOGGER or name.startswith(PACKAGE_LOGGER + ".")
+
+    def isEnabledFor(self, level: int) -> bool:
+        threshold = current_log_level.get() if self._follows_job else None
+        if threshold is None:
+            return super().isEnabledFor(level)
+        return not self.disabled and level > self.manager.disable and level >= threshold
+
+
+class ContextFilter(logging.Filter):
+    """
+    Applies the current job's verbosity and tags records with the job context
+
+    Runs on the calling thread, before the record is queued, so context variables are visible.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        threshold = current_log_level.get()
+        if record.levelno < (DEFAULT_LEVEL if threshold is None else threshold):
+            return False
+        record.job_id = current_job_id.get()
+        record.device_id = current_device_id.get()
+        record.user_id = current_user_id.get() if record.job_id else None
+        record.item = current_item.get()
+        record.step = current_step.get()
+        return True
+
+
+def record_to_dict(record: logging.LogRecord) -> dict:
+    entry = {
+        "timestamp": record.created,
+        "level": record.levelname.lower(),
+        "logger": record.name,
+        "message": record.getMessage().strip(),
+    }
+    for field in CONTEXT_FIELDS:
+        value = getattr(record, field, None)
+        if value is not None:
+            entry[field] = value
+    if record.exc_text:
+        entry["exception"] = record.exc_text
+    return entry
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(record_to_dict(record), ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Plain text with a [job/device/step] tag when the record belongs to a job"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s%(tag)s %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        job_id = getattr(record, "job_id", None)
+        if job_id:
+            parts = [job_id, getattr(record, "device_id", None) or "-"]
+            if getattr(record, "step", None):
+                parts.append(record.step)
+            record.tag = f" [{'/'.join(parts)}]"
+        else:
+            record.tag = ""
+        return super().format(record)
+
+
+class JobLogStore:
+    """
+    Recent log records per job (oldest jobs evicted first)
+
+    Args:
+        max_lines: Records kept per job
+        max_jobs: Jobs kept
+    """
+
+    def __init__(self, max_lines: int = JOB_LOG_LINES, max_jobs: int = JOB_LOG_MAX_JOBS):
+        self.max_lines = max_lines
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, Deque[dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, job_id: str, entry: dict):
+        with self._lock:
+            lines = self._jobs.get(job_id)
+            if lines is None:
+                lines = self._jobs[job_id] = deque(maxlen=self.max_lines)
+                while len(self._jobs) > self.max_jobs:
+                    self._jobs.popitem(last=False)
+            lines.append(entry)
+
+    def get(self, job_id: str, min_level: int = logging.NOTSET) -> Optional[List[dict]]:
+        with self._lock:
+            lines = self._jobs.get(job_id)
+            if lines is None:
+                return None
+            lines = list(lines)
+        return [entry for entry in lines if parse_level(entry["level"]) >= min_level]
+
+
+job_logs = JobLogStore()
+
+
+class JobLogHandler(logging.Handler):
+    """Keeps records that belong to a job in job_logs"""
+
+    def emit(self, record: logging.LogRecord):
+        job_id = getattr(record, "job_id", None)
+        if job_id:
+            job_logs.add(job_id, record_to_dict(record))
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging():
+    """
+    Route all logging through a queue to a background writer (idempotent)
+
+    AH_LOG_FORMAT selects text or JSON lines on stderr; AH_LOG_LEVEL the default verbosity.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(min(DEFAULT_LEVEL, logging.INFO))
+    logging.getLogger(PACKAGE_LOGGER).setLevel(DEFAULT_LEVEL)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, JobLogHandler())
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+@contextmanager
+def job_log_level(level=None):
+    """
+    Log the enclosed block at a job-specific verbosity (e.g. "debug"); None keeps the default
+    """
+    if level is None:
+        yield
+        return
+    token = current_log_level.set(parse_level(level))
+    try:
+        yield
+    finally:
+        current_log_level.reset(token)
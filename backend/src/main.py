@@ -5,26 +5,94 @@ Handles automation of the Albert Heijn mobile app via Appium
 
 import asyncio
 import logging
-from typing import List, Optional
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from appium import webdriver
 from appium.options.ios import XCUITestOptions
 from appium.options.android import UiAutomator2Options
-from appium.webdriver.common.appiumby import AppiumBy
-import os
 from dotenv import load_dotenv
-from .ah_automation import add_multiple_products
+from .accounts import ACCOUNT_SWITCH_TIMEOUT, AccountSwitchFailed, account_for_user, switch_account
+from .ah_automation import add_multiple_products, forget_session, open_search_screen, pause
+from .artifacts import artifact_store
+from .config import (
+    AH_FAKE_DRIVER,
+    AH_FAKE_LATENCY,
+    AH_FAKE_FAILURE_RATE,
+    AH_FAKE_POPUP_RATE,
+    WEB_WORKERS,
+    APPIUM_SERVER_URL,
+    IOS_DEVICE_NAME,
+    IOS_VERSION,
+    IOS_UDID,
+    AH_BUNDLE_ID,
+    ANDROID_DEVICE_NAME,
+    AH_PACKAGE,
+    AH_ACTIVITY,
+    WARMUP_ENABLED,
+    WARMUP_TIMEOUT,
+    HEALTH_PROBE_INTERVAL,
+    LEASE_POLL_INTERVAL,
+)
+from .context import current_device_id, current_job_id, current_user_id
+from .logs import configure_logging, job_log_level, job_logs, parse_level
+from .events import EventChannel, NdjsonStream, forward_events
+from .fake_driver import FakeDriver
+from .health import HealthMonitor
+from .idempotency import IdempotentJobs, idempotency_key as idempotency_key_for
+from .interrupts import dismiss_interrupts
+from .metrics import metrics
+from .ranking import preference_store
+from .registry import create_registry
+from .scheduler import (
+    AdmissionRejected,
+    Device,
+    Job,
+    JobFailed,
+    NoCompatibleDevice,
+    Scheduler,
+    load_devices,
+)
+from .replay import replay_store
+from .resilience import run_step
+from .timing import timing_model
+from .traffic import traffic_recorder
+from .tracing import span, trace_store
+from .transport import close_all_executors, get_command_executor, transport_stats
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (queued, written by a background thread)
+configure_logging()
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Albert Heijn Automation API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up devices in the background on start; hand idle devices over on shutdown"""
+    if WARMUP_ENABLED:
+        warmup_task = asyncio.create_task(warm_up())
+    else:
+        warmup_task = None
+        warmup.state = "ready"
+    monitor_task = asyncio.create_task(health_monitor.run()) if HEALTH_PROBE_INTERVAL > 0 else None
+    yield
+    for task in (warmup_task, monitor_task):
+        if task and not task.done():
+            task.cancel()
+    # Lets the remaining worker processes take the devices right away
+    await scheduler.release_all()
+    # After the sessions are quit: their quit calls go through the pools
+    close_all_executors()
+    timing_model.save(force=True)
+
+
+app = FastAPI(title="Albert Heijn Automation API", lifespan=lifespan)
 
 # CORS middleware for Expo app
 app.add_middleware(
@@ -35,10 +103,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global driver instance
-driver: Optional[webdriver.Remote] = None
-
-
 class Product(BaseModel):
     name: str
     quantity: int = 1
@@ -47,6 +111,12 @@ class Product(BaseModel):
 class AutomationRequest(BaseModel):
     products: List[Product]
     device_type: str = "ios"  # "ios" or "android"
+    user_id: str = "anonymous"  # Used for fair sharing of devices
+    priority: int = 0  # Higher runs first
+    profile: bool = False  # Run under the sampling profiler (see /jobs/{job_id}/profile)
+    log_level: Optional[str] = None  # Verbosity of this job's logs, e.g. "debug" (see /jobs/{job_id}/logs)
+    account: Optional[str] = None  # AH account whose basket to fill (default: the user's, see AH_USER_ACCOUNTS)
+    idempotency_key: Optional[str] = None  # Same key (or same basket from the same user): follow the first run
 
 
 class AutomationStatus(BaseModel):
@@ -60,19 +130,19 @@ def get_appium_options(device_type: str):
     if device_type.lower() == "ios":
         options = XCUITestOptions()
         options.platform_name = "iOS"
-        options.device_name = os.getenv("IOS_DEVICE_NAME", "iPhone")
-        options.platform_version = os.getenv("IOS_VERSION", "17.0")
-        options.bundle_id = os.getenv("AH_BUNDLE_ID", "nl.ah.ahapp")  # Albert Heijn app bundle ID
-        options.udid = os.getenv("IOS_UDID", "")  # Device UDID if needed
+        options.device_name = IOS_DEVICE_NAME
+        options.platform_version = IOS_VERSION
+        options.bundle_id = AH_BUNDLE_ID  # Albert Heijn app bundle ID
+        options.udid = IOS_UDID  # Device UDID if needed
         options.automation_name = "XCUITest"
         options.no_reset = True
         options.full_reset = False
     else:  # Android
         options = UiAutomator2Options()
         options.platform_name = "Android"
-        options.device_name = os.getenv("ANDROID_DEVICE_NAME", "Android Device")
-        options.app_package = os.getenv("AH_PACKAGE", "nl.ah.app")  # Albert Heijn app package
-        options.app_activity = os.getenv("AH_ACTIVITY", "nl.ah.app.MainActivity")
+        options.device_name = ANDROID_DEVICE_NAME
+        options.app_package = AH_PACKAGE  # Albert Heijn app package
+        options.app_activity = AH_ACTIVITY
         options.automation_name = "UiAutomator2"
         options.no_reset = True
         options.full_reset = False
@@ -80,135 +150,397 @@ def get_appium_options(device_type: str):
     return options
 
 
-async def connect_to_appium():
+async def connect_to_appium(device: Optional[Device] = None):
     """Connect to Appium server"""
-    appium_server_url = os.getenv("APPIUM_SERVER_URL", "http://localhost:4723")
-    return appium_server_url
+    if device and device.appium_url:
+        return device.appium_url
+    return APPIUM_SERVER_URL
+
+
+async def create_driver(device: Device):
+    """Open a new Appium session (or a fake one when AH_FAKE_DRIVER is set)"""
+    if AH_FAKE_DRIVER:
+        return FakeDriver(device.device_type, latency=AH_FAKE_LATENCY, failure_rate=AH_FAKE_FAILURE_RATE,
+                          popup_rate=AH_FAKE_POPUP_RATE, account=device.account)
+    
+    appium_url = await connect_to_appium(device)
+    options = get_appium_options(device.device_type)
+    for name, value in device.capabilities.items():
+        options.set_capability(name, value)
+    
+    # Use the shared keep-alive pool for this Appium server
+    # (direct_connection would swap in an unpooled RemoteConnection).
+    # Session creation takes seconds (WebDriverAgent / UiAutomator2 launch), so it runs in a
+    # thread and several devices can connect at once.
+    return await asyncio.to_thread(
+        webdriver.Remote,
+        command_executor=get_command_executor(appium_url),
+        options=options,
+        direct_connection=False,
+    )
+
+
+async def ensure_session(device: Device, websocket: WebSocket = None):
+    """
+    Return the device's Appium session, opening it (and passing the splash screen) if needed
+    
+    Args:
+        device: Device to connect to
+        websocket: Optional WebSocket for real-time updates
+    """
+    async with device.session_lock:
+        if device.driver is not None:
+            return device.driver
+        return await open_session(device, websocket)
+
+
+async def open_session(device: Device, websocket: WebSocket = None):
+    """
+    Open a new Appium session on the device and pass the splash screen
+    
+    Callers hold device.session_lock.
+    """
+    # Send status update
+    if websocket:
+        await websocket.send_json({
+            "status": "connecting",
+            "message": "Connecting to device...",
+            "progress": 10.0
+        })
+    
+    # Initialize driver
+    driver = await create_driver(device)
+    device.driver = driver
+    device.health.new_session(id(driver))
+    logger.info("Connected to Appium server and device %s", device.id)
+    
+    if websocket:
+        await websocket.send_json({
+            "status": "connected",
+            "message": "Device connected successfully",
+            "progress": 20.0
+        })
+    
+    # Wait for app to load
+    await pause(3)
+    
+    # Handle potential login/splash screen
+    if websocket:
+        await websocket.send_json({
+            "status": "navigating",
+            "message": "App opened, navigating...",
+            "progress": 20.0
+        })
+    
+    # Splash, login and consent screens are not probed for here: they are dismissed as
+    # interrupts when a step first misses its target (see interrupts.py)
+    
+    return driver
+
+
+class WarmUp:
+    """Progress of the startup warm-up, reported by /health"""
+    
+    def __init__(self):
+        self.state = "pending"  # "pending", "warming" or "ready"
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.devices: Dict[str, dict] = {}
+    
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+    
+    def to_dict(self) -> dict:
+        return {
+            "state": self.state,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "devices": self.devices,
+        }
+
+
+warmup = WarmUp()
+
+
+async def warm_device(device: Device):
+    """Open the device's session and bring the app to the search screen"""
+    current_device_id.set(device.id)
+    started = time.perf_counter()
+    if not await scheduler.acquire_lease(device):
+        warmup.devices[device.id] = {"warm": False, "skipped": "leased by another worker"}
+        return
+    
+    async def connect():
+        async with device.session_lock:
+            driver = device.driver or await open_session(device)
+            return await run_step("open_search", open_search_screen, driver,
+                                  on_miss=lambda: dismiss_interrupts(driver))
+    
+    try:
+        on_search_screen = await asyncio.wait_for(device.run(connect), timeout=WARMUP_TIMEOUT)
+    except Exception as e:
+        error = str(e) or e.__class__.__name__
+        logger.error("Warm-up of %s failed: %s", device.id, error)
+        # Leave the device to a later job (or another worker) instead of keeping a half-open session
+        await scheduler.release_lease(device)
+        warmup.devices[device.id] = {"warm": False, "error": error}
+        return
+    seconds = time.perf_counter() - started
+    logger.info("Warmed up %s in %.1fs", device.id, seconds)
+    warmup.devices[device.id] = {
+        "warm": True,
+        "search_screen": on_search_screen,
+        "seconds": round(seconds, 2),
+    }
+
+
+async def warm_up():
+    """
+    Prepare for the first request: load the on-disk caches and open sessions on all devices
+    in parallel
+    """
+    warmup.state = "warming"
+    warmup.started_at = time.time()
+    scheduler.start()
+    # Otherwise loaded on first use, inside the first job
+    await asyncio.to_thread(replay_store.load)
+    await asyncio.to_thread(preference_store.load)
+    await asyncio.gather(*(warm_device(device) for device in scheduler.devices.values()))
+    warmup.state = "ready"
+    warmup.finished_at = time.time()
+    logger.info("Warm-up finished in %.1fs", warmup.finished_at - warmup.started_at)
+
+
+async def recycle_session(device: Device):
+    """Replace an idle device's session with a fresh one on the search screen"""
+    current_device_id.set(device.id)
+    
+    async def reopen():
+        async with device.session_lock:
+            if device.current_job is not None:
+                return
+            await scheduler.drop_session(device)
+            driver = await open_session(device)
+            await run_step("open_search", open_search_screen, driver, on_miss=lambda: dismiss_interrupts(driver))
+    
+    await device.run(reopen)
+    logger.info("Recycled the session on %s", device.id)
 
 
-async def automate_albert_heijn_app(products: List[Product], device_type: str, websocket: WebSocket = None):
+async def run_job_slice(device: Device, job: Job, products: List[dict]):
+    """
+    Scheduler runner: add a slice of a job's products on a device
+    
+    Returns:
+        tuple: (success_count, failed_items)
+    """
+    current_job_id.set(job.id)
+    current_user_id.set(job.user_id)
+    current_device_id.set(device.id)
+    
+    with job_log_level(job.log_level):
+        return await _run_job_slice(device, job, products)
+
+
+async def _run_job_slice(device: Device, job: Job, products: List[dict]):
+    try:
+        with span("session", "session", reused=device.driver is not None):
+            driver = await ensure_session(device, job.events)
+    except Exception:
+        if device.driver is not None:
+            forget_session(device.driver)
+        device.driver = None
+        raise
+    
+    if job.next_index == 0:
+        await job.events.send_json({
+            "status": "ready",
+            "message": "Ready to add products...",
+            "progress": 25.0
+        })
+    
+    # Use the adapted automation functions
+    return await add_multiple_products(
+        driver,
+        products,
+        device.device_type,
+        job.events,
+        start_index=job.next_index,
+        total_products=job.total_products,
+    )
+
+
+async def switch_device_account(device: Device, account: str):
+    """
+    Scheduler account switcher: log the device's app out and into another account
+    
+    Raises:
+        AccountSwitchFailed: If the app did not end up logged in
+    """
+    driver = await ensure_session(device)
+    switched = await run_step("switch_account", switch_account, driver, device.device_type, account,
+                              timeout=ACCOUNT_SWITCH_TIMEOUT, retries=1,
+                              on_miss=lambda: dismiss_interrupts(driver))
+    if not switched:
+        raise AccountSwitchFailed(f"Could not log {device.id} into account {account}")
+
+
+scheduler = Scheduler(load_devices(), run_job_slice, registry=create_registry(), switcher=switch_device_account)
+health_monitor = HealthMonitor(scheduler, recycle_session)
+idempotent_jobs = IdempotentJobs(scheduler.registry)
+
+
+async def submit_job(job: Job, key: Optional[str]):
+    """Queue a new job and announce its position; rejections end its event log"""
+    try:
+        await scheduler.submit(job)
+    except AdmissionRejected as e:
+        await idempotent_jobs.discard(key, job)
+        job.events.publish({
+            "status": "error",
+            "message": str(e),
+            "progress": 0.0
+        })
+        job.events.close()
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(int(e.projected_wait - e.max_wait) + 1)},
+        )
+    except NoCompatibleDevice as e:
+        await idempotent_jobs.discard(key, job)
+        job.events.publish({
+            "status": "error",
+            "message": str(e),
+            "progress": 0.0
+        })
+        job.events.close()
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    position = scheduler.queue_position(job)
+    job.events.publish({
+        "status": job.status,
+        "message": f"Job queued (position {position})" if position else "Job deferred until devices free up",
+        "progress": 5.0,
+        "job_id": job.id,
+    })
+
+
+async def automate_albert_heijn_app(products: List[Product], device_type: str, websocket: WebSocket = None,
+                                    user_id: str = "anonymous", priority: int = 0, profile: bool = False,
+                                    log_level: Optional[str] = None, account: Optional[str] = None,
+                                    idempotency_key: Optional[str] = None):
     """
     Automate Albert Heijn mobile app to add products to basket
     
     This function:
-    1. Opens Albert Heijn app
-    2. Navigates to search/product selection
-    3. Adds products to basket
+    1. Queues the basket as a job for a device of the requested type
+       (preferably one logged into the basket's account)
+    2. Opens Albert Heijn app on that device (once per session)
+    3. Adds products to basket, sharing the device fairly with other users' jobs
     4. Returns status updates via WebSocket if provided
+    
+    Status events go to the job's event log; the WebSocket (if any) is just one subscriber,
+    so a dropped connection does not affect the job and can resume via /ws/jobs/{job_id}.
+    A duplicate submission (same idempotency key, or same basket from the same user) follows
+    the job already running for it, replaying its events, instead of starting another run.
     """
-    global driver
-    appium_url = await connect_to_appium()
-    options = get_appium_options(device_type)
+    # Prepare product list with quantities
+    products_list = [
+        {"name": product.name, "quantity": product.quantity}
+        for product in products
+    ]
+    account = account or account_for_user(user_id)
+    traffic_recorder.record(time.time(), user_id, device_type, priority, products_list)
+    key = idempotency_key_for(idempotency_key, user_id, device_type, account, products_list)
+    new_job = Job(products_list, device_type, user_id=user_id, priority=priority,
+                  profile=profile, log_level=log_level, account=account)
+    job = await idempotent_jobs.claim(key, new_job)
+    if isinstance(job, str):
+        logger.info("Duplicate submission of job %s, following it in another worker process", job)
+        metrics.increment("jobs.coalesced")
+        return await follow_remote_job(job, websocket)
+    duplicate = job is not new_job
+    if duplicate:
+        logger.info("Duplicate submission of job %s (%s), following it", job.id, job.status)
+        metrics.increment("jobs.coalesced")
+    current_job_id.set(job.id)
+    current_user_id.set(user_id)
+    forwarder = asyncio.create_task(forward_events(job.events, websocket)) if websocket else None
     
     try:
-        # Send status update
-        if websocket:
-            await websocket.send_json({
-                "status": "connecting",
-                "message": "Connecting to device...",
-                "progress": 10.0
-            })
-        
-        # Initialize driver
-        driver = webdriver.Remote(appium_url, options=options)
-        logger.info("Connected to Appium server and device")
+        if not duplicate:
+            await submit_job(job, key)
         
-        if websocket:
-            await websocket.send_json({
-                "status": "connected",
-                "message": "Device connected successfully",
-                "progress": 20.0
-            })
-        
-        # Wait for app to load
-        await asyncio.sleep(3)
-        
-        # Handle potential login/splash screen
-        if websocket:
-            await websocket.send_json({
-                "status": "navigating",
-                "message": "App opened, navigating...",
-                "progress": 20.0
-            })
-        
-        # Try to find and handle login/skip if needed
-        # This is app-specific and may need adjustment
         try:
-            # Example: Skip login or handle splash screen
-            # Try multiple selectors for skip/close buttons
-            skip_selectors = [
-                (AppiumBy.ACCESSIBILITY_ID, "Skip"),
-                (AppiumBy.ACCESSIBILITY_ID, "Overslaan"),
-                (AppiumBy.XPATH, "//XCUIElementTypeButton[@name='Skip' or @name='Overslaan']"),
-                (AppiumBy.XPATH, "//android.widget.Button[@text='Skip' or @text='Overslaan']"),
-            ]
-            for by, selector in skip_selectors:
-                try:
-                    skip_button = driver.find_element(by, selector)
-                    if skip_button.is_displayed():
-                        logger.info(f"Found skip button: {selector}")
-                        skip_button.click()
-                        await asyncio.sleep(1)
-                        break
-                except:
-                    continue
-        except Exception as e:
-            logger.info(f"No skip button found or already past login: {e}")
-        
-        if websocket:
-            await websocket.send_json({
-                "status": "ready",
-                "message": "Ready to add products...",
-                "progress": 25.0
-            })
-        
-        # Prepare product list with quantities
-        products_list = [
-            {"name": product.name, "quantity": product.quantity}
-            for product in products
-        ]
-        
-        # Use the adapted automation functions
-        total_products = len(products)
-        success_count, failed_items = await add_multiple_products(
-            driver, 
-            products_list, 
-            device_type, 
-            websocket
-        )
-        
-        # Calculate actual products added
-        added_count = success_count
-        
-        if websocket:
+            return await job.wait()
+        except JobFailed as e:
+            error_msg = f"Automation error: {str(e)}"
+            logger.error(error_msg)
+            raise HTTPException(status_code=500, detail=error_msg)
+    finally:
+        if forwarder:
+            # Let the client receive the final events before the request ends
+            if job.events.closed:
+                await forwarder
+            else:
+                forwarder.cancel()
+
+
+async def follow_remote_job(job_id: str, websocket=None) -> dict:
+    """
+    Wait for a job another worker process runs, relaying its status snapshots from the registry
+
+    Returns:
+        dict: Job result, as the worker running it reports it
+
+    Raises:
+        HTTPException: If the job failed or disappeared from the registry
+    """
+    reported = None
+    while True:
+        snapshot = await scheduler.get_remote(job_id)
+        if snapshot is None:
+            raise HTTPException(status_code=500, detail=f"Job {job_id} is no longer known")
+        total = snapshot["total_products"]
+        if snapshot["finished_at"] is not None:
+            break
+        progress = (snapshot["status"], snapshot["processed_products"])
+        if websocket and progress != reported:
             await websocket.send_json({
-                "status": "completed",
-                "message": f"Successfully added {added_count}/{total_products} products",
-                "progress": 100.0
+                "status": snapshot["status"],
+                "message": f"Following job {job_id} ({snapshot['processed_products']}/{total} products)",
+                "progress": 5.0 + 90.0 * snapshot["processed_products"] / max(1, total),
+                "job_id": job_id,
             })
-        
-        return {
-            "status": "success",
-            "message": f"Added {added_count}/{total_products} products to basket",
-            "products_added": added_count,
-            "total_products": total_products,
-            "failed_items": failed_items
-        }
-        
-    except Exception as e:
-        error_msg = f"Automation error: {str(e)}"
-        logger.error(error_msg)
+            reported = progress
+        await asyncio.sleep(LEASE_POLL_INTERVAL)
+
+    if snapshot["error"]:
+        error_msg = f"Automation error: {snapshot['error']}"
         if websocket:
-            await websocket.send_json({
-                "status": "error",
-                "message": error_msg,
-                "progress": 0.0
-            })
+            await websocket.send_json({"status": "error", "message": error_msg, "progress": 0.0})
         raise HTTPException(status_code=500, detail=error_msg)
-    
-    finally:
-        # Don't close driver immediately - keep it open for potential further actions
-        pass
+    added = snapshot["products_added"]
+    result = {
+        "status": "success",
+        "message": f"Added {added}/{total} products to basket",
+        "products_added": added,
+        "total_products": total,
+        "failed_items": snapshot["failed_items"],
+        "job_id": job_id,
+    }
+    if snapshot.get("artifacts"):
+        result["artifacts"] = snapshot["artifacts"]
+    if websocket:
+        await websocket.send_json({
+            "status": "completed",
+            "message": f"Successfully added {added}/{total} products",
+            "progress": 100.0,
+        })
+        await websocket.send_json(result)
+    return result
 
 
 @app.get("/")
@@ -218,26 +550,202 @@ async def root():
 
 @app.get("/health")
 async def health_check():
+    """Device status; 503 until the startup warm-up has finished"""
+    status = scheduler.status()
+    tripped = [device["id"] for device in status["devices"] if device["breaker"]["state"] == "open"]
+    # Devices whose warm-up failed and that have not connected since
+    cold = [
+        device_id for device_id, device in warmup.devices.items()
+        if device.get("error") and scheduler.devices[device_id].driver is None
+    ]
+    unhealthy = [device["id"] for device in status["devices"] if device["health"]["state"] in ("dead", "degraded")]
+    if not warmup.ready:
+        overall = "warming"
+    elif tripped or cold or unhealthy:
+        overall = "degraded"
+    else:
+        overall = "healthy"
+    body = {
+        "status": overall,
+        "ready": warmup.ready,
+        "driver_connected": any(device.driver is not None for device in scheduler.devices.values()),
+        **status,
+        "lease_holders": await asyncio.to_thread(scheduler.registry.holders),
+        "warmup": warmup.to_dict(),
+    }
+    if not warmup.ready:
+        return JSONResponse(body, status_code=503)
+    return body
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Command round-trip times, Appium connection reuse, the learned item timings and search path times per query"""
     return {
-        "status": "healthy",
-        "driver_connected": driver is not None
+        **metrics.snapshot(),
+        "transport": transport_stats(),
+        "item_timings": timing_model.to_dict(),
+        "search_paths": timing_model.search_paths(),
     }
 
 
+async def stream_automation(request: AutomationRequest):
+    """
+    Run automation and yield its status events as NDJSON lines
+    
+    Yields the same events as the WebSocket, an "item_result" line per product and the
+    final result. The job keeps running if the client goes away.
+    """
+    stream = NdjsonStream()
+    channel = EventChannel(stream, item_results=True)
+    
+    async def run():
+        try:
+            await automate_albert_heijn_app(
+                request.products,
+                request.device_type,
+                channel,
+                user_id=request.user_id,
+                priority=request.priority,
+                profile=request.profile,
+                log_level=request.log_level,
+                account=request.account,
+                idempotency_key=request.idempotency_key,
+            )
+        except HTTPException:
+            # Already reported to the client as an error event
+            pass
+        except Exception as e:
+            await channel.send_json({"status": "error", "message": f"Automation error: {str(e)}"})
+        finally:
+            stream.close()
+    
+    task = asyncio.create_task(run())
+    async for line in stream.lines():
+        yield line
+    await task
+
+
 @app.post("/automate", response_model=AutomationStatus)
-async def start_automation(request: AutomationRequest):
-    """Start automation via HTTP POST"""
+async def start_automation(request: AutomationRequest, stream: bool = False,
+                           accept: Optional[str] = Header(None),
+                           idempotency_key: Optional[str] = Header(None)):
+    """
+    Start automation via HTTP POST
+    
+    With ?stream=true (or Accept: application/x-ndjson) the response streams status events
+    as newline-delimited JSON instead of waiting for the final status. The idempotency key may
+    also be sent as an Idempotency-Key header.
+    """
+    if idempotency_key and not request.idempotency_key:
+        request.idempotency_key = idempotency_key
+    if stream or (accept and "application/x-ndjson" in accept):
+        return StreamingResponse(stream_automation(request), media_type="application/x-ndjson")
     try:
-        result = await automate_albert_heijn_app(request.products, request.device_type)
+        result = await automate_albert_heijn_app(
+            request.products,
+            request.device_type,
+            user_id=request.user_id,
+            priority=request.priority,
+            profile=request.profile,
+            log_level=request.log_level,
+            account=request.account,
+            idempotency_key=request.idempotency_key,
+        )
         return AutomationStatus(
             status=result["status"],
             message=result["message"],
             progress=100.0
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status of a queued, running or finished job"""
+    job = scheduler.get(job_id)
+    if not job:
+        # Submitted to another worker process
+        snapshot = await scheduler.get_remote(job_id)
+        if snapshot is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return snapshot
+    return {
+        **job.to_dict(),
+        "queue_position": scheduler.queue_position(job),
+        "projected_wait": round(scheduler.projected_wait(job), 1) if not job.finished else 0.0,
+        "eta_seconds": scheduler.eta(job),
+    }
+
+
+@app.get("/jobs/{job_id}/trace")
+async def get_job_trace(job_id: str):
+    """Spans of a job as Chrome trace-event JSON (load in ui.perfetto.dev or chrome://tracing)"""
+    trace = trace_store.get(job_id)
+    if not trace:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return JSONResponse(
+        trace.to_chrome(),
+        headers={"Content-Disposition": f'inline; filename="trace-{job_id}.json"'},
+    )
+
+
+@app.get("/jobs/{job_id}/profile")
+async def get_job_profile(job_id: str, format: str = "json"):
+    """
+    Sampling profile of a job: driver I/O vs CPU time and hottest functions,
+    or folded stacks with ?format=collapsed (for speedscope / flamegraph.pl)
+    """
+    job = scheduler.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not job.profile:
+        raise HTTPException(status_code=404, detail="Job was not profiled")
+    if format == "collapsed":
+        return PlainTextResponse(
+            job.profile.collapsed(),
+            headers={"Content-Disposition": f'attachment; filename="profile-{job_id}.txt"'},
+        )
+    return job.profile.to_dict()
+
+
+@app.get("/jobs/{job_id}/logs")
+async def get_job_logs(job_id: str, level: str = "debug", format: str = "json"):
+    """Log records of a job, oldest first (?format=text for plain lines)"""
+    lines = job_logs.get(job_id, parse_level(level))
+    if lines is None:
+        if not scheduler.get(job_id):
+            raise HTTPException(status_code=404, detail="Job not found")
+        lines = []
+    if format == "text":
+        return PlainTextResponse("".join(
+            f"{entry['timestamp']:.3f} {entry['level'].upper()} [{entry.get('step') or '-'}] {entry['message']}\n"
+            for entry in lines
+        ))
+    return {"job_id": job_id, "lines": lines}
+
+
+@app.get("/jobs/{job_id}/artifacts")
+async def get_job_artifacts(job_id: str):
+    """Failure artifacts of a job's failed items, with their download links"""
+    artifacts = artifact_store.for_job(job_id)
+    if not artifacts and not scheduler.get(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"job_id": job_id, "artifacts": artifacts}
+
+
+@app.get("/jobs/{job_id}/artifacts/{artifact_id}")
+async def get_artifact(job_id: str, artifact_id: str):
+    """Zip with the page source, screenshot, locator attempts and timings of a failed item of the job"""
+    path = artifact_store.path(job_id, artifact_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="Artifact not found (evicted or still being written)")
+    return FileResponse(path, media_type="application/zip", filename=f"failure-{artifact_id}.zip")
+
+
 @app.websocket("/ws/automate")
 async def websocket_automate(websocket: WebSocket):
     """Start automation via WebSocket for real-time updates"""
@@ -248,18 +756,24 @@ async def websocket_automate(websocket: WebSocket):
         data = await websocket.receive_json()
         request = AutomationRequest(**data)
         
-        # Start automation with real-time updates
-        result = await automate_albert_heijn_app(
+        # Start automation with real-time updates (the final result arrives as the last event)
+        await automate_albert_heijn_app(
             request.products,
             request.device_type,
-            websocket
+            EventChannel(websocket),
+            user_id=request.user_id,
+            priority=request.priority,
+            profile=request.profile,
+            log_level=request.log_level,
+            account=request.account,
+            idempotency_key=request.idempotency_key,
         )
         
-        # Send final result
-        await websocket.send_json(result)
-        
     except WebSocketDisconnect:
         logger.info("WebSocket disconnected")
+    except HTTPException as e:
+        # Already reported to the client as an error event
+        logger.info("WebSocket automation ended: %s", e.detail)
     except Exception as e:
         error_msg = f"WebSocket error: {str(e)}"
         logger.error(error_msg)
@@ -269,18 +783,50 @@ async def websocket_automate(websocket: WebSocket):
         })
 
 
+@app.websocket("/ws/jobs/{job_id}")
+async def websocket_job_events(websocket: WebSocket, job_id: str, since: int = 0):
+    """
+    Follow a job's status events, e.g. after a dropped /ws/automate connection
+    
+    Replays buffered events with a sequence number greater than `since`, then streams live
+    events until the job finishes.
+    """
+    await websocket.accept()
+    job = scheduler.get(job_id)
+    if job is None:
+        # Events are kept by the worker process running the job; others only have its status
+        snapshot = await scheduler.get_remote(job_id)
+        message = f"Job {job_id} not found" if snapshot is None else \
+            f"Job {job_id} runs in another worker process, poll /jobs/{job_id} for its status"
+        await websocket.send_json({"status": "error", "message": message})
+        await websocket.close()
+        return
+    await forward_events(job.events, EventChannel(websocket), since)
+    try:
+        await websocket.close()
+    except Exception:
+        pass
+
+
 @app.post("/disconnect")
 async def disconnect_driver():
-    """Disconnect from Appium driver"""
-    global driver
-    if driver:
-        driver.quit()
-        driver = None
-        return {"status": "disconnected", "message": "Driver disconnected successfully"}
-    return {"status": "already_disconnected", "message": "No active driver"}
+    """Disconnect idle devices from Appium"""
+    disconnected = []
+    for device in scheduler.devices.values():
+        if device.driver and not device.current_job:
+            # Also lets another worker process take the device
+            await scheduler.release_lease(device)
+            disconnected.append(device.id)
+    if disconnected:
+        return {"status": "disconnected", "message": f"Disconnected {', '.join(disconnected)}"}
+    return {"status": "already_disconnected", "message": "No idle active driver"}
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    if WEB_WORKERS > 1:
+        # Workers share devices and job status through the registry (AH_REGISTRY_PATH)
+        uvicorn.run("src.main:app", host="0.0.0.0", port=8000, workers=WEB_WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
 
@@ -0,0 +1,76 @@
+"""
+In-process metrics
+Counters and latency samples shared by the automation modules and exposed via /metrics
+"""
+
+import threading
+from collections import defaultdict, deque
+from typing import Deque, Dict
+
+
+def percentile(samples, fraction: float) -> float:
+    """Nearest-rank percentile of a list of numbers"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class Metrics:
+    """
+    Thread-safe counters and rolling latency windows
+    
+    Args:
+        window: Number of recent samples kept per timing for percentiles
+    """
+    
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._samples: Dict[str, Deque[float]] = {}
+        self._totals: Dict[str, float] = defaultdict(float)
+        self._counts: Dict[str, int] = defaultdict(int)
+    
+    def increment(self, name: str, value: float = 1):
+        """Add to a counter"""
+        with self._lock:
+            self._counters[name] += value
+    
+    def observe(self, name: str, value: float):
+        """Record one sample (typically milliseconds) for a timing"""
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+            samples.append(value)
+            self._totals[name] += value
+            self._counts[name] += 1
+    
+    def timing(self, name: str) -> dict:
+        """Summary of one timing: count, mean and percentiles of the recent window"""
+        with self._lock:
+            samples = list(self._samples.get(name, ()))
+            count = self._counts.get(name, 0)
+            total = self._totals.get(name, 0.0)
+        return {
+            "count": count,
+            "mean": round(total / count, 2) if count else 0.0,
+            "p50": round(percentile(samples, 0.50), 2),
+            "p95": round(percentile(samples, 0.95), 2),
+            "max": round(max(samples), 2) if samples else 0.0,
+        }
+    
+    def snapshot(self) -> dict:
+        """All counters and timing summaries"""
+        with self._lock:
+            counters = dict(self._counters)
+            names = list(self._samples)
+        return {
+            "counters": counters,
+            "timings": {name: self.timing(name) for name in sorted(names)},
+        }
+
+
+metrics = Metrics()
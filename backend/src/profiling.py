@@ -0,0 +1,290 @@
+"""
+Sampling profiler for automation jobs
+Periodically samples the stack of threads running profiled jobs and separates time blocked on
+driver I/O (Appium round trips) from CPU time spent in our own code and other blocking waits
+(sleeps, locks), read from each sampled thread's CPU clock
+"""
+
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Dict, List, Optional, Tuple
+from .config import PROFILE_INTERVAL_MS, PROFILE_SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# Distinct stacks kept per profile (the rest are folded into one "[other]" entry)
+MAX_STACKS = 2000
+
+# Functions listed in the profile summary
+TOP_FUNCTIONS = 25
+
+# Threads currently inside a blocking driver call (thread id -> nesting depth)
+_io_depth: Dict[int, int] = {}
+
+
+@contextmanager
+def driver_io():
+    """Mark the enclosed block as waiting on the device (Appium HTTP round trip)"""
+    thread_id = threading.get_ident()
+    _io_depth[thread_id] = _io_depth.get(thread_id, 0) + 1
+    try:
+        yield
+    finally:
+        depth = _io_depth.get(thread_id, 1) - 1
+        if depth:
+            _io_depth[thread_id] = depth
+        else:
+            _io_depth.pop(thread_id, None)
+
+
+def should_profile(requested: bool = False) -> bool:
+    """Profile a job if the client asked for it, or as part of the server-wide sample"""
+    return requested or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class JobProfile:
+    """
+    Samples collected for one job
+
+    Args:
+        job_id: Profiled job
+        interval: Seconds between samples
+    """
+
+    def __init__(self, job_id: str, interval: float):
+        self.job_id = job_id
+        self.interval = interval
+        self.samples = 0
+        self.io_samples = 0
+        self.wait_samples = 0
+        self.wall_seconds = 0.0
+        self.stacks: Counter = Counter()
+        self.self_samples: Counter = Counter()
+        self.io_by_function: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def add_sample(self, stack: List[str], in_driver_io: bool, on_cpu: bool = True):
+        """
+        Args:
+            stack: Frame labels, outermost first
+            in_driver_io: The thread was inside driver_io()
+            on_cpu: The thread used CPU since the previous sample (False: sleeping or blocked)
+        """
+        with self._lock:
+            self.samples += 1
+            if in_driver_io:
+                self.io_samples += 1
+            elif not on_cpu:
+                self.wait_samples += 1
+            key = ";".join(stack)
+            if key in self.stacks or len(self.stacks) < MAX_STACKS:
+                self.stacks[key] += 1
+            else:
+                self.stacks["[other]"] += 1
+            if stack:
+                # Attribute I/O to the innermost frame of our own code, CPU to the leaf frame
+                self.self_samples[stack[-1]] += 1
+                if in_driver_io:
+                    self.io_by_function[stack[-1]] += 1
+
+    def collapsed(self) -> str:
+        """Folded stacks ("frame;frame;frame count"), for flamegraph.pl or speedscope"""
+        with self._lock:
+            return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            cpu_samples = self.samples - self.io_samples - self.wait_samples
+            return {
+                "job_id": self.job_id,
+                "interval_ms": round(self.interval * 1000, 2),
+                "samples": self.samples,
+                "wall_seconds": round(self.wall_seconds, 3),
+                "sampled_seconds": round(self.samples * self.interval, 3),
+                "driver_io_seconds": round(self.io_samples * self.interval, 3),
+                "cpu_seconds": round(cpu_samples * self.interval, 3),
+                # Blocked outside driver calls: time.sleep() pauses, locks, other blocking calls
+                "blocked_seconds": round(self.wait_samples * self.interval, 3),
+                # Suspended: UI settle pauses, or the event loop running other jobs
+                "awaiting_seconds": round(max(0.0, self.wall_seconds - self.samples * self.interval), 3),
+                "driver_io_fraction": round(self.io_samples / self.samples, 3) if self.samples else 0.0,
+                "top_functions": [
+                    {
+                        "function": name,
+                        "samples": count,
+                        "seconds": round(count * self.interval, 3),
+                        "driver_io_samples": self.io_by_function.get(name, 0),
+                    }
+                    for name, count in self.self_samples.most_common(TOP_FUNCTIONS)
+                ],
+            }
+
+
+class SamplingProfiler:
+    """
+    Background sampler shared by all profiled jobs
+
+    A job is attached through the frame of the coroutine running it; every sample of a thread
+    whose stack contains that frame is attributed to the job (prefixed with the stack that led
+    to the frame, for coroutines running in child tasks). The sampler thread only runs while at
+    least one job is attached.
+
+    Args:
+        interval: Seconds between samples
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000):
+        self.interval = interval
+        self._attached: Dict[int, Tuple[object, int, JobProfile, List[str]]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def attach(self, frame, profile: JobProfile, prefix: Optional[List[str]] = None) -> int:
+        """
+        Start attributing samples below `frame` (on the current thread) to `profile`
+
+        Returns:
+            Token for detach()
+        """
+        token = id(frame)
+        with self._lock:
+            self._attached[token] = (frame, threading.get_ident(), profile, prefix or [])
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="job-profiler", daemon=True)
+                self._thread.start()
+        return token
+
+    def detach(self, token: int):
+        with self._lock:
+            self._attached.pop(token, None)
+
+    def _on_cpu(self, thread_ids, clocks: Dict[int, Tuple[float, float]]) -> Dict[int, bool]:
+        """
+        Whether each thread used CPU for most of the time since its previous sample
+
+        Threads whose CPU clock cannot be read (first sample, or no pthread_getcpuclockid on this
+        platform) count as on CPU, as before this was measured.
+        """
+        now = time.perf_counter()
+        on_cpu = {}
+        for thread_id in thread_ids:
+            try:
+                cpu = time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+            except (AttributeError, OSError):
+                on_cpu[thread_id] = True
+                continue
+            previous = clocks.get(thread_id)
+            clocks[thread_id] = (now, cpu)
+            on_cpu[thread_id] = previous is None or cpu - previous[1] >= (now - previous[0]) / 2
+        for thread_id in list(clocks):
+            if thread_id not in on_cpu:
+                del clocks[thread_id]
+        return on_cpu
+
+    def _run(self):
+        own_files = {__file__}
+        # Thread id -> (perf_counter, thread CPU time) at its previous sample
+        clocks: Dict[int, Tuple[float, float]] = {}
+        while True:
+            with self._lock:
+                if not self._attached:
+                    self._thread = None
+                    return
+                attached = list(self._attached.values())
+            frames = sys._current_frames()
+            on_cpu = self._on_cpu({thread_id for _, thread_id, _, _ in attached}, clocks)
+            for root, thread_id, profile, prefix in attached:
+                frame = frames.get(thread_id)
+                stack = []
+                found = False
+                while frame is not None:
+                    if frame is root:
+                        found = True
+                        stack.append(_frame_label(frame))
+                        break
+                    if frame.f_code.co_filename not in own_files:
+                        stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if found:
+                    stack.reverse()
+                    profile.add_sample(prefix + stack, _io_depth.get(thread_id, 0) > 0, on_cpu[thread_id])
+            time.sleep(self.interval)
+
+
+profiler = SamplingProfiler()
+
+# Profile of the job the current coroutine works for, with the frame it was attached at
+current_profile: ContextVar[Optional[Tuple[JobProfile, object, List[str]]]] = ContextVar(
+    "current_profile", default=None
+)
+
+
+@contextmanager
+def profile_block(frame, profile: Optional[JobProfile]):
+    """
+    Profile the enclosed block of the coroutine owning `frame` (no-op when profile is None)
+
+    Args:
+        frame: Frame of the calling coroutine (sys._getframe())
+        profile: Profile receiving the samples
+    """
+    if profile is None:
+        yield
+        return
+    token = profiler.attach(frame, profile)
+    context_token = current_profile.set((profile, frame, []))
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.wall_seconds += time.perf_counter() - started
+        current_profile.reset(context_token)
+        profiler.detach(token)
+
+
+def _stack_between(frame, root) -> List[str]:
+    """Labels from `root` (inclusive) down to `frame` (inclusive), outermost first"""
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame))
+        if frame is root:
+            break
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+async def _run_profiled(coro: Awaitable, profile: JobProfile, prefix: List[str]):
+    frame = sys._getframe()
+    token = profiler.attach(frame, profile, prefix)
+    context_token = current_profile.set((profile, frame, prefix))
+    try:
+        return await coro
+    finally:
+        current_profile.reset(context_token)
+        profiler.detach(token)
+
+
+def carry_profile(coro: Awaitable) -> Awaitable:
+    """
+    Keep profiling a coroutine that will run in its own task (e.g. under asyncio.wait_for)
+
+    Returns the coroutine unchanged when the current job is not profiled.
+    """
+    active = current_profile.get()
+    if active is None:
+        return coro
+    profile, root, prefix = active
+    return _run_profiled(coro, profile, prefix + _stack_between(sys._getframe(1), root))
@@ -0,0 +1,310 @@
+"""
+Search result ranking
+Reads every visible result cell (title, size, price) from one page-source snapshot and
+scores them against the query, so the best match is tapped instead of the first cell; search
+suggestions shown while typing are scored the same way
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Tuple
+import xml.etree.ElementTree as ET
+from .config import RANKING_MIN_SCORE, PREFERENCES_PATH, SUGGESTION_MIN_SCORE
+from .snapshot import Snapshot, element_is_displayed, element_label, element_rect, element_tag
+
+logger = logging.getLogger(__name__)
+
+# Result cell containers per platform
+IOS_CELL_TAGS = ("XCUIElementTypeCell",)
+ANDROID_LIST_TAGS = ("android.widget.RecyclerView", "android.widget.ListView")
+
+# Suggestion list under the search box (matched against its name / resource-id)
+SUGGESTION_CONTAINER_KEYWORD = "suggest"
+
+# Labels marking paid placements in the result list
+PROMOTED_KEYWORDS = ("gesponsord", "advertentie", "sponsored", "promoted")
+
+_PRICE_RE = re.compile(r"(€\s*\d+[.,]\d{2})|(^\d+[.,]\d{2}$)")
+_SIZE_RE = re.compile(r"^(ca\.\s*)?\d+([.,]\d+)?\s*(x\s*\d+\s*)?(g|gr|gram|kg|ml|cl|l|liter|st|stuk|stuks)\b", re.I)
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Score adjustments
+PROMOTED_PENALTY = 0.25
+PREFERENCE_BOOST = 0.1
+MAX_PREFERENCE_BOOST = 0.3
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip accents and punctuation"""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(_TOKEN_RE.findall(text.lower()))
+
+
+def _token_matches(query_token: str, title_tokens: List[str]) -> float:
+    best = 0.0
+    for token in title_tokens:
+        if token == query_token:
+            return 1.0
+        if token.startswith(query_token) or query_token.startswith(token):
+            best = max(best, 0.9)
+        elif abs(len(token) - len(query_token)) <= 3:
+            best = max(best, SequenceMatcher(None, query_token, token).ratio())
+    return best if best >= 0.75 else 0.0
+
+
+def match_score(query: str, title: str) -> float:
+    """
+    Fuzzy similarity between a search query and a product title (0..1)
+
+    Combines how many query words appear in the title (allowing typos and plurals)
+    with the overall character similarity, and slightly prefers titles without extra words.
+    """
+    query_norm = normalize(query)
+    title_norm = normalize(title)
+    if not query_norm or not title_norm:
+        return 0.0
+
+    query_tokens = query_norm.split()
+    title_tokens = title_norm.split()
+    coverage = sum(_token_matches(token, title_tokens) for token in query_tokens) / len(query_tokens)
+    extra_words = max(0, len(title_tokens) - len(query_tokens)) / len(title_tokens)
+    similarity = SequenceMatcher(None, query_norm, title_norm).ratio()
+    return 0.7 * coverage + 0.2 * similarity + 0.1 * (1 - extra_words)
+
+
+class ResultCandidate:
+    """One visible search result"""
+
+    def __init__(self, index: int, title: str, size: str, price: str, rect: Dict[str, int], promoted: bool):
+        self.index = index
+        self.title = title
+        self.size = size
+        self.price = price
+        self.rect = rect
+        self.promoted = promoted
+        self.score = 0.0
+        # Score from the title alone, without the sponsored penalty or the preference boost
+        self.match_score = 0.0
+        # Picked because it matched the query (not as a fallback), so worth remembering
+        self.chosen_on_match = False
+
+    def to_dict(self) -> dict:
+        return {
+            "index": self.index,
+            "title": self.title,
+            "size": self.size,
+            "price": self.price,
+            "promoted": self.promoted,
+            "score": round(self.score, 3),
+        }
+
+
+def _cell_nodes(snapshot: Snapshot) -> List[ET.Element]:
+    cells = [element for element in snapshot.iter() if element_tag(element) in IOS_CELL_TAGS]
+    if cells:
+        return cells
+    for element in snapshot.iter():
+        if element_tag(element) in ANDROID_LIST_TAGS:
+            cells.extend(list(element))
+    return cells
+
+
+def extract_results(snapshot: Snapshot) -> List[ResultCandidate]:
+    """
+    Read all visible result cells from a snapshot
+
+    Args:
+        snapshot: Page snapshot of the search results screen
+
+    Returns:
+        list of ResultCandidate in on-screen order
+    """
+    viewport = snapshot.viewport()
+    candidates = []
+    for cell in _cell_nodes(snapshot):
+        rect = element_rect(cell)
+        if not rect or rect["width"] <= 0 or rect["height"] <= 0 or not element_is_displayed(cell):
+            continue
+        if viewport:
+            center_y = rect["y"] + rect["height"] / 2
+            if center_y < viewport["y"] or center_y > viewport["y"] + viewport["height"]:
+                continue
+
+        title = size = price = ""
+        promoted = False
+        texts = [element_label(node).strip() for node in cell.iter() if node is not cell]
+        texts.append(element_label(cell).strip())
+        for text in texts:
+            if not text:
+                continue
+            lowered = text.lower()
+            if any(keyword in lowered for keyword in PROMOTED_KEYWORDS):
+                promoted = True
+            if not price and _PRICE_RE.search(text):
+                price = text
+            elif not size and _SIZE_RE.match(text):
+                size = text
+            elif not title and len(normalize(text)) > 1:
+                title = text
+        if title:
+            candidates.append(ResultCandidate(len(candidates), title, size, price, rect, promoted))
+    return candidates
+
+
+def extract_suggestions(snapshot: Snapshot) -> List[ResultCandidate]:
+    """
+    Read the visible search suggestions from a snapshot
+
+    Returns:
+        list of ResultCandidate (title and rect only) in on-screen order; empty if no
+        suggestion list is shown
+    """
+    candidates = []
+    for container in snapshot.iter():
+        identifier = (container.get("resource-id") or container.get("name") or "").lower()
+        if SUGGESTION_CONTAINER_KEYWORD not in identifier:
+            continue
+        for row in container:
+            rect = element_rect(row)
+            if not rect or rect["width"] <= 0 or rect["height"] <= 0 or not element_is_displayed(row):
+                continue
+            title = next((text for text in (element_label(node).strip() for node in row.iter())
+                          if len(normalize(text)) > 1), "")
+            if title:
+                candidates.append(ResultCandidate(len(candidates), title, "", "", rect, False))
+    return candidates
+
+
+class PreferenceStore:
+    """
+    Products previously chosen per user and query, persisted to disk
+
+    Layout: user -> normalized query -> title -> times chosen
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: Dict[str, Dict[str, Dict[str, int]]] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except FileNotFoundError:
+                self._entries = {}
+            except Exception as e:
+                logger.error("Could not load preferences %s: %s", self.path, e)
+                self._entries = {}
+
+    def preferred(self, user_id: str, query: str) -> Dict[str, int]:
+        self.load()
+        return self._entries.get(user_id, {}).get(normalize(query), {})
+
+    def record(self, user_id: str, query: str, title: str):
+        self.load()
+        with self._lock:
+            titles = self._entries.setdefault(user_id, {}).setdefault(normalize(query), {})
+            titles[title] = titles.get(title, 0) + 1
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self._entries, f, indent=2, sort_keys=True)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                logger.error("Could not save preferences %s: %s", self.path, e)
+
+
+preference_store = PreferenceStore(PREFERENCES_PATH)
+
+# Choice made during the current item, remembered only if the item gets added
+_pending_choice: Dict[str, Tuple[str, str, str]] = {}
+
+
+def rank_results(candidates: List[ResultCandidate], query: str, user_id: str = "anonymous") -> List[ResultCandidate]:
+    """
+    Score candidates against the query and the user's earlier choices, best first
+    """
+    preferred = preference_store.preferred(user_id, query)
+    for candidate in candidates:
+        score = match_score(query, candidate.title)
+        candidate.match_score = score
+        if candidate.promoted:
+            score -= PROMOTED_PENALTY
+        times_chosen = preferred.get(candidate.title, 0)
+        if times_chosen:
+            score += min(MAX_PREFERENCE_BOOST, PREFERENCE_BOOST * times_chosen)
+        candidate.score = score
+    return sorted(candidates, key=lambda candidate: (-candidate.score, candidate.index))
+
+
+def choose_result(snapshot: Snapshot, query: str, user_id: str = "anonymous") -> Optional[ResultCandidate]:
+    """
+    Pick the result to open for a query
+
+    Falls back to the first visible result when nothing scores above AH_RANKING_MIN_SCORE.
+    Only a result whose own match score clears it is marked chosen_on_match: a fallback pick,
+    or one that only ranks first because of an earlier boost, must not add to the boost.
+
+    Returns:
+        ResultCandidate, or None if the snapshot has no recognizable result cells
+    """
+    candidates = extract_results(snapshot)
+    if not candidates:
+        return None
+    ranked = rank_results(candidates, query, user_id)
+    best = ranked[0]
+    if best.score < RANKING_MIN_SCORE:
+        logger.info("   No result scored above %s for '%s', using first result", RANKING_MIN_SCORE, query)
+        best = candidates[0]
+    best.chosen_on_match = best.match_score >= RANKING_MIN_SCORE
+    return best
+
+
+def choose_suggestion(snapshot: Snapshot, query: str, user_id: str = "anonymous") -> Optional[ResultCandidate]:
+    """
+    Pick the search suggestion to tap for a query
+
+    Unlike results there is no fallback: a suggestion is only tapped when it scores at least
+    AH_SUGGESTION_MIN_SCORE, otherwise the search is submitted.
+
+    Returns:
+        ResultCandidate, or None if no suggestion is a close enough match
+    """
+    candidates = extract_suggestions(snapshot)
+    if not candidates:
+        return None
+    best = rank_results(candidates, query, user_id)[0]
+    if best.score < SUGGESTION_MIN_SCORE:
+        return None
+    best.chosen_on_match = best.match_score >= SUGGESTION_MIN_SCORE
+    return best
+
+
+def remember_choice(driver, user_id: str, query: str, title: str):
+    """Hold the chosen title until the item is known to be added"""
+    _pending_choice[driver.session_id] = (user_id, query, title)
+
+
+def commit_choice(driver):
+    """Record the pending choice as a preference (item added successfully)"""
+    choice = _pending_choice.pop(driver.session_id, None)
+    if choice:
+        preference_store.record(*choice)
+
+
+def discard_choice(driver):
+    """Forget the pending choice (item failed)"""
+    _pending_choice.pop(driver.session_id, None)
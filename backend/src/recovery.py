@@ -0,0 +1,69 @@
+"""
+Recovery to a known screen
+After a failed item the app can be anywhere (detail page, popup, keyboard open). Instead of
+walking back screen by screen, these helpers recognise the search screen from one snapshot and
+restore it with a single deep link or an app restart
+"""
+
+import logging
+from typing import Optional
+from .config import AH_BUNDLE_ID, AH_PACKAGE
+from .snapshot import Snapshot, element_is_displayed, element_tag
+
+logger = logging.getLogger(__name__)
+
+# Element type that is only ever a search box (iOS); other text fields need an id or hint
+SEARCH_FIELD_TAGS = ("XCUIElementTypeSearchField",)
+
+# Generic text fields (login e-mail, popup inputs) that are the search box only with a search hint
+TEXT_FIELD_TAGS = ("XCUIElementTypeTextField", "android.widget.EditText")
+
+# Hint / placeholder / content-desc of the search box
+SEARCH_FIELD_HINTS = ("zoek", "search")
+
+# Identifiers of the search box (accessibility id / resource id)
+SEARCH_FIELD_IDS = ("search_field", "nl.ah.app:id/search_input", "nl.ah.app:id/search_box")
+
+
+def app_id(device_type: str) -> str:
+    """Bundle id (iOS) or package (Android) of the Albert Heijn app"""
+    return AH_BUNDLE_ID if device_type.lower() == "ios" else AH_PACKAGE
+
+
+def is_search_screen(snapshot: Optional[Snapshot]) -> bool:
+    """Whether the search box is on screen (search page or result list)"""
+    if snapshot is None:
+        return False
+    for element in snapshot.iter():
+        if not element_is_displayed(element):
+            continue
+        identifier = element.get("resource-id") or element.get("name") or ""
+        if element_tag(element) in SEARCH_FIELD_TAGS or identifier in SEARCH_FIELD_IDS:
+            return True
+        if element_tag(element) in TEXT_FIELD_TAGS and _has_search_hint(element):
+            return True
+    return False
+
+
+def _has_search_hint(element) -> bool:
+    hints = (element.get(attribute) or "" for attribute in ("hint", "placeholderValue", "content-desc"))
+    return any(marker in hint.lower() for hint in hints for marker in SEARCH_FIELD_HINTS)
+
+
+def open_deep_link(driver, device_type: str, url: str):
+    """Open a URL in the app (e.g. its search page) without going through the UI"""
+    if device_type.lower() == "ios":
+        driver.execute_script("mobile: deepLink", {"url": url, "bundleId": AH_BUNDLE_ID})
+    else:
+        driver.execute_script("mobile: deepLink", {"url": url, "package": AH_PACKAGE})
+
+
+def restart_app(driver, device_type: str):
+    """Terminate and relaunch the app; it comes back on its start screen"""
+    app = app_id(device_type)
+    try:
+        driver.terminate_app(app)
+    except Exception as e:
+        # Not running (or already gone): activating starts it fresh either way
+        logger.debug("   Could not terminate %s: %s", app, e)
+    driver.activate_app(app)
@@ -0,0 +1,321 @@
+"""
+Device lease and job status registry
+Lets several API worker processes share the configured devices: a device's Appium session is
+only held by the process owning the device's lease, job status snapshots are visible to
+every process, and a basket's idempotency key points at the one job run for it
+"""
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Optional
+from .config import LEASE_TTL, REGISTRY_JOB_RETENTION, REGISTRY_PATH
+
+logger = logging.getLogger(__name__)
+
+
+def process_owner() -> str:
+    """Identity of this worker process in the registry"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Registry(ABC):
+    """
+    Device leases and job snapshots shared between the scheduler instances of all workers
+
+    A lease expires `ttl` seconds after it was last acquired or renewed, so the devices of a
+    crashed worker become available again.
+
+    Args:
+        ttl: Lease lifetime in seconds
+    """
+
+    def __init__(self, ttl: float = LEASE_TTL):
+        self.ttl = ttl
+
+    @property
+    def owner(self) -> str:
+        # Computed on use: the registry may be created before uvicorn forks its workers
+        return process_owner()
+
+    @abstractmethod
+    def acquire(self, device_id: str) -> bool:
+        """
+        Take (or extend) the lease on a device
+
+        Returns:
+            bool: True if this process now holds the lease; otherwise the attempt is recorded
+            so the holder can see the device is wanted
+        """
+
+    @abstractmethod
+    def renew(self, device_id: str) -> bool:
+        """Extend a lease held by this process (False if it was lost)"""
+
+    @abstractmethod
+    def release(self, device_id: str):
+        """Give up a lease held by this process"""
+
+    @abstractmethod
+    def contended(self, device_id: str) -> bool:
+        """True if another process recently tried to acquire the device"""
+
+    @abstractmethod
+    def holders(self) -> Dict[str, str]:
+        """Current (unexpired) lease holder per device"""
+
+    @abstractmethod
+    def save_job(self, job: dict):
+        """Store the latest status snapshot of a job (Job.to_dict())"""
+
+    @abstractmethod
+    def get_job(self, job_id: str) -> Optional[dict]:
+        """Latest status snapshot of a job submitted to any worker"""
+
+    @abstractmethod
+    def claim_key(self, key: str, job_id: str, ttl: float) -> str:
+        """
+        Point an idempotency key at a job, unless a job submitted to any worker still answers it
+
+        A job answers its key while it is queued or running in a live worker process, and for
+        `ttl` seconds after it completed.
+
+        Returns:
+            str: Id of the job answering the key (`job_id` if the key was claimed for it)
+        """
+
+    @abstractmethod
+    def release_key(self, key: str, job_id: str):
+        """Forget a key if it still points to the job (e.g. the job was rejected)"""
+
+
+class LocalRegistry(Registry):
+    """
+    Registry for a single worker process: leases are always granted, and jobs and their
+    idempotency keys are only visible through the scheduler that runs them
+    """
+
+    def __init__(self, ttl: float = LEASE_TTL):
+        super().__init__(ttl)
+        self._leases: Dict[str, float] = {}
+
+    def acquire(self, device_id: str) -> bool:
+        self._leases[device_id] = time.time() + self.ttl
+        return True
+
+    def renew(self, device_id: str) -> bool:
+        return self.acquire(device_id)
+
+    def release(self, device_id: str):
+        self._leases.pop(device_id, None)
+
+    def contended(self, device_id: str) -> bool:
+        return False
+
+    def holders(self) -> Dict[str, str]:
+        now = time.time()
+        return {device_id: self.owner for device_id, expires in self._leases.items() if expires > now}
+
+    def save_job(self, job: dict):
+        pass
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        return None
+
+    def claim_key(self, key: str, job_id: str, ttl: float) -> str:
+        return job_id
+
+    def release_key(self, key: str, job_id: str):
+        pass
+
+
+class SqliteRegistry(Registry):
+    """
+    Registry in a SQLite database shared by the worker processes on one host
+
+    Args:
+        path: Database file
+        ttl: Lease lifetime in seconds
+        job_retention: Seconds finished job snapshots are kept
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS leases (
+            device_id TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS lease_requests (
+            device_id TEXT NOT NULL,
+            owner TEXT NOT NULL,
+            requested_at REAL NOT NULL,
+            PRIMARY KEY (device_id, owner)
+        );
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            finished INTEGER NOT NULL,
+            updated_at REAL NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS job_keys (
+            key TEXT PRIMARY KEY,
+            job_id TEXT NOT NULL,
+            owner TEXT NOT NULL,
+            claimed_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, path: str, ttl: float = LEASE_TTL, job_retention: float = REGISTRY_JOB_RETENTION):
+        super().__init__(ttl)
+        self.path = path
+        self.job_retention = job_retention
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread (registry calls run in worker threads)
+        db = getattr(self._local, "db", None)
+        if db is None or getattr(self._local, "pid", None) != os.getpid():
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._connection()
+        # Take the write lock up front so check-then-update is atomic across processes
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def acquire(self, device_id: str) -> bool:
+        now = time.time()
+        owner = self.owner
+        with self._transaction() as db:
+            row = db.execute("SELECT owner, expires_at FROM leases WHERE device_id = ?", (device_id,)).fetchone()
+            if row is None or row[0] == owner or row[1] <= now:
+                if row is not None and row[0] != owner:
+                    logger.warning("Taking over expired lease on %s from %s", device_id, row[0])
+                db.execute(
+                    "INSERT OR REPLACE INTO leases (device_id, owner, expires_at) VALUES (?, ?, ?)",
+                    (device_id, owner, now + self.ttl),
+                )
+                db.execute("DELETE FROM lease_requests WHERE device_id = ? AND owner = ?", (device_id, owner))
+                return True
+            db.execute(
+                "INSERT OR REPLACE INTO lease_requests (device_id, owner, requested_at) VALUES (?, ?, ?)",
+                (device_id, owner, now),
+            )
+            return False
+
+    def renew(self, device_id: str) -> bool:
+        with self._transaction() as db:
+            updated = db.execute(
+                "UPDATE leases SET expires_at = ? WHERE device_id = ? AND owner = ?",
+                (time.time() + self.ttl, device_id, self.owner),
+            ).rowcount
+        return updated == 1
+
+    def release(self, device_id: str):
+        with self._transaction() as db:
+            db.execute("DELETE FROM leases WHERE device_id = ? AND owner = ?", (device_id, self.owner))
+
+    def contended(self, device_id: str) -> bool:
+        # Requests are repeated while a worker waits, so older ones are from workers that gave up
+        row = self._connection().execute(
+            "SELECT 1 FROM lease_requests WHERE device_id = ? AND owner != ? AND requested_at > ? LIMIT 1",
+            (device_id, self.owner, time.time() - self.ttl),
+        ).fetchone()
+        return row is not None
+
+    def holders(self) -> Dict[str, str]:
+        rows = self._connection().execute(
+            "SELECT device_id, owner FROM leases WHERE expires_at > ?", (time.time(),)
+        ).fetchall()
+        return dict(rows)
+
+    def save_job(self, job: dict):
+        now = time.time()
+        finished = job.get("finished_at") is not None
+        with self._transaction() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, owner, finished, updated_at, data) VALUES (?, ?, ?, ?, ?)",
+                (job["job_id"], self.owner, int(finished), now, json.dumps(job)),
+            )
+            if finished:
+                db.execute(
+                    "DELETE FROM jobs WHERE finished = 1 AND updated_at < ?", (now - self.job_retention,)
+                )
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        row = self._connection().execute(
+            "SELECT owner, data FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {**json.loads(row[1]), "worker": row[0]}
+
+    def claim_key(self, key: str, job_id: str, ttl: float) -> str:
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute("SELECT job_id, owner, claimed_at FROM job_keys WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[0] != job_id and self._answers(db, *row, ttl, now):
+                return row[0]
+            db.execute(
+                "INSERT OR REPLACE INTO job_keys (key, job_id, owner, claimed_at) VALUES (?, ?, ?, ?)",
+                (key, job_id, self.owner, now),
+            )
+            db.execute("DELETE FROM job_keys WHERE claimed_at < ?", (now - self.job_retention,))
+        return job_id
+
+    def _answers(self, db: sqlite3.Connection, job_id: str, owner: str, claimed_at: float,
+                 ttl: float, now: float) -> bool:
+        row = db.execute("SELECT finished, updated_at, data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is not None and row[0]:
+            job = json.loads(row[2])
+            return job.get("status") == "completed" and (job.get("finished_at") or 0) > now - ttl
+        # Queued or running (or claimed and not published yet): recent news of it is enough,
+        # otherwise its worker must still be alive
+        last_seen = max(claimed_at, row[1] if row is not None else 0)
+        return last_seen > now - self.ttl or self._alive(db, owner, now)
+
+    def _alive(self, db: sqlite3.Connection, owner: str, now: float) -> bool:
+        """
+        Whether a worker process is still running: while it has unfinished jobs it either renews
+        its leases or keeps asking for one
+        """
+        if owner == self.owner:
+            return True
+        row = db.execute(
+            "SELECT 1 FROM leases WHERE owner = ? AND expires_at > ? "
+            "UNION ALL SELECT 1 FROM lease_requests WHERE owner = ? AND requested_at > ? LIMIT 1",
+            (owner, now, owner, now - self.ttl),
+        ).fetchone()
+        return row is not None
+
+    def release_key(self, key: str, job_id: str):
+        with self._transaction() as db:
+            db.execute("DELETE FROM job_keys WHERE key = ? AND job_id = ?", (key, job_id))
+
+
+def create_registry() -> Registry:
+    """SQLite registry if AH_REGISTRY_PATH is set (needed for multiple workers), else local"""
+    if REGISTRY_PATH:
+        logger.info("Using shared device registry %s", REGISTRY_PATH)
+        return SqliteRegistry(REGISTRY_PATH)
+    return LocalRegistry()
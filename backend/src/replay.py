@@ -0,0 +1,236 @@
+"""
+Coordinate replay fast path
+Records element rects of successful steps per device profile and replays them as direct taps
+when the screen signature matches, skipping locator resolution entirely
+"""
+
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+from .config import REPLAY_ENABLED, REPLAY_CACHE_PATH, AH_APP_VERSION
+from .interaction import in_view, tap_rect, window_size
+from .snapshot import Snapshot, take_snapshot
+from .timing import note_path
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayStore:
+    """
+    On-disk cache of element rects
+    
+    Layout: profile -> step -> screen signature -> rect
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: Dict[str, Dict[str, Dict[str, dict]]] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+    
+    def load(self):
+        """Load cached rects from disk (once)"""
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+                logger.info("Loaded replay cache with %d device profiles", len(self._entries))
+            except FileNotFoundError:
+                self._entries = {}
+            except Exception as e:
+                logger.error("Could not load replay cache %s: %s", self.path, e)
+                self._entries = {}
+    
+    def save(self):
+        """Write cached rects to disk"""
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self._entries, f, indent=2, sort_keys=True)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                logger.error("Could not save replay cache %s: %s", self.path, e)
+    
+    def has_step(self, profile: str, step: str) -> bool:
+        self.load()
+        return bool(self._entries.get(profile, {}).get(step))
+    
+    def lookup(self, profile: str, step: str, signature: str) -> Optional[dict]:
+        self.load()
+        return self._entries.get(profile, {}).get(step, {}).get(signature)
+    
+    def record(self, profile: str, step: str, signature: str, rect: dict):
+        self.load()
+        with self._lock:
+            self._entries.setdefault(profile, {}).setdefault(step, {})[signature] = rect
+    
+    def forget(self, profile: str, step: str, signature: str):
+        self.load()
+        with self._lock:
+            self._entries.get(profile, {}).get(step, {}).pop(signature, None)
+
+
+replay_store = ReplayStore(REPLAY_CACHE_PATH)
+
+# Device profile per session id (computed once per session)
+_profiles: Dict[str, str] = {}
+
+# Rects recorded during the current item, committed only when the item succeeds
+_pending: Dict[str, List[Tuple[str, str, str, dict]]] = {}
+
+# Cached rects replayed during the current item, invalidated if the item fails
+_replayed: Dict[str, List[Tuple[str, str, str]]] = {}
+
+
+def device_profile(driver) -> str:
+    """
+    Profile key for the device behind a session: model, resolution and app version
+    
+    Args:
+        driver: Appium WebDriver
+    """
+    session_id = driver.session_id
+    profile = _profiles.get(session_id)
+    if profile:
+        return profile
+    
+    caps = driver.capabilities or {}
+    model = caps.get("deviceModel") or caps.get("deviceName") or "unknown"
+    try:
+        size = window_size(driver)
+        resolution = f"{size['width']}x{size['height']}"
+    except Exception:
+        resolution = "unknown"
+    app_version = AH_APP_VERSION or caps.get("appVersion") or "unknown"
+    
+    profile = f"{model}|{resolution}|{app_version}"
+    _profiles[session_id] = profile
+    return profile
+
+
+class ReplayStep:
+    """
+    Replay/record helper for one interaction step
+    
+    Usage:
+        step = ReplayStep(driver, "add_button")
+        if not await step.tap():
+            element = ...full locator resolution...
+            step.record(element, element.rect)
+            tap_element(driver, element)
+    """
+    
+    def __init__(self, driver, name: str):
+        self.driver = driver
+        self.name = name
+        self.snapshot: Optional[Snapshot] = None
+        self.rect: Optional[dict] = None
+        self.replayed = False
+    
+    async def tap(self) -> bool:
+        """
+        Tap the cached rect if the current screen matches a recorded signature
+        
+        Returns:
+            bool: True if the cached coordinates were tapped, False to fall back
+        """
+        if not REPLAY_ENABLED:
+            return False
+        
+        try:
+            profile = device_profile(self.driver)
+            if not replay_store.has_step(profile, self.name):
+                return False
+            
+            self.snapshot = take_snapshot(self.driver)
+            if not self.snapshot:
+                return False
+            
+            rect = replay_store.lookup(profile, self.name, self.snapshot.signature)
+            if not rect:
+                logger.debug("   Replay miss for '%s' (screen %s)", self.name, self.snapshot.signature)
+                return False
+            
+            tap_rect(self.driver, rect)
+            self.rect = rect
+            self.replayed = True
+            note_path("replay")
+            _replayed.setdefault(self.driver.session_id, []).append(
+                (profile, self.name, self.snapshot.signature)
+            )
+            logger.info("   ⚡ Replayed '%s' at cached rect %s", self.name, rect)
+            return True
+        except Exception as e:
+            logger.info("   Replay of '%s' failed, falling back to locators: %s", self.name, e)
+            return False
+    
+    def record(self, element, rect: Optional[dict] = None):
+        """
+        Remember the rect of an element resolved through the full locator path
+        
+        Must be called before the element is tapped, while the screen still shows it. Elements
+        that need scrolling are not recorded: one tap on the cached rect would miss them.
+        
+        Args:
+            element: Resolved WebElement
+            rect: Its rect, if the caller already fetched it
+        """
+        if not REPLAY_ENABLED:
+            return
+        
+        try:
+            profile = device_profile(self.driver)
+            if self.snapshot is None:
+                self.snapshot = take_snapshot(self.driver)
+            if not self.snapshot:
+                return
+            signature = self.snapshot.signature
+            if replay_store.lookup(profile, self.name, signature):
+                return
+            rect = dict(rect or element.rect)
+            if not in_view(self.driver, rect):
+                return
+            self.rect = rect
+            _pending.setdefault(self.driver.session_id, []).append(
+                (profile, self.name, signature, self.rect)
+            )
+        except Exception as e:
+            logger.debug("   Could not record rect for '%s': %s", self.name, e)
+
+
+def commit_recording(driver):
+    """Persist rects recorded during an item that completed successfully"""
+    _replayed.pop(driver.session_id, None)
+    pending = _pending.pop(driver.session_id, [])
+    if not pending:
+        return
+    for profile, step, signature, rect in pending:
+        replay_store.record(profile, step, signature, rect)
+    replay_store.save()
+    logger.debug("   Recorded %d step rect(s) for replay", len(pending))
+
+
+def discard_recording(driver):
+    """Drop rects recorded during a failed item and invalidate the ones it replayed"""
+    _pending.pop(driver.session_id, None)
+    replayed = _replayed.pop(driver.session_id, [])
+    if not replayed:
+        return
+    for profile, step, signature in replayed:
+        replay_store.forget(profile, step, signature)
+    replay_store.save()
+    logger.info("   Invalidated %d replayed rect(s) after failure", len(replayed))
+
+
+def forget_session(driver):
+    """Drop everything held for a session that is closing (nothing is persisted)"""
+    _profiles.pop(driver.session_id, None)
+    _pending.pop(driver.session_id, None)
+    _replayed.pop(driver.session_id, None)
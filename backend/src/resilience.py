@@ -0,0 +1,306 @@
+"""
+Resilience primitives
+Deadlines propagated from job to item to step, bounded retries with backoff for transient
+driver errors, and a per-device circuit breaker
+"""
+
+import asyncio
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, List, Optional
+import urllib3
+from selenium.common.exceptions import (
+    StaleElementReferenceException,
+    TimeoutException,
+    WebDriverException,
+)
+from .context import current_step
+from .profiling import carry_profile
+from .timing import record_step_time
+from .tracing import span
+from .config import (
+    AH_SLEEP_SCALE,
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_RESET_SECONDS,
+    RETRY_BASE_DELAY,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# Times a step is re-run after its on_miss handler cleared the screen
+MAX_MISS_RETRIES = 2
+
+
+class DeadlineExceeded(TimeoutError):
+    """The job, item or step ran out of time"""
+
+
+class SessionLost(Exception):
+    """
+    The session stopped answering partway through a slice
+
+    Args:
+        message: What the last item failed on
+        success_count: Items added before the session was lost
+        failed_items: Items that failed before the session was lost
+    """
+
+    def __init__(self, message: str, success_count: int, failed_items: List[str]):
+        super().__init__(message)
+        self.success_count = success_count
+        self.failed_items = failed_items
+
+    @property
+    def tried(self) -> int:
+        """Items settled before the session was lost (the rest, including the last one, are retried)"""
+        return self.success_count + len(self.failed_items)
+
+
+# Errors worth retrying: the element went stale, or the driver/transport timed out or hiccuped
+TRANSIENT_ERRORS = (
+    StaleElementReferenceException,
+    TimeoutException,
+    urllib3.exceptions.HTTPError,
+    ConnectionError,
+)
+
+
+def is_transient(error: BaseException) -> bool:
+    """Whether an error is likely to succeed on retry"""
+    if isinstance(error, DeadlineExceeded):
+        return False
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    # Appium reports WDA/UiAutomator2 hiccups as generic WebDriverExceptions
+    message = str(error).lower() if isinstance(error, WebDriverException) else ""
+    return any(marker in message for marker in ("timed out", "timeout", "socket hang up", "econnreset"))
+
+
+def is_device_error(error: BaseException) -> bool:
+    """
+    Whether an error says something about the device: a driver, session, transport or timeout
+    error (as opposed to products that could not be found, or a bug)
+    """
+    return isinstance(error, (WebDriverException, urllib3.exceptions.HTTPError, ConnectionError,
+                              TimeoutError, asyncio.TimeoutError, SessionLost))
+
+
+class Deadline:
+    """
+    Absolute point in time (monotonic clock) by which work must finish
+
+    Args:
+        expires_at: time.monotonic() value, or None for no limit
+    """
+
+    def __init__(self, expires_at: Optional[float] = None):
+        self.expires_at = expires_at
+
+    @classmethod
+    def after(cls, seconds: Optional[float]) -> "Deadline":
+        return cls(time.monotonic() + seconds if seconds else None)
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None if unbounded"""
+        if self.expires_at is None:
+            return None
+        return self.expires_at - time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def child(self, seconds: Optional[float]) -> "Deadline":
+        """Deadline `seconds` from now, never later than this one"""
+        if not seconds:
+            return Deadline(self.expires_at)
+        expires_at = time.monotonic() + seconds
+        if self.expires_at is not None:
+            expires_at = min(expires_at, self.expires_at)
+        return Deadline(expires_at)
+
+
+current_deadline: ContextVar[Deadline] = ContextVar("current_deadline", default=Deadline())
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float] = None, deadline: Optional[Deadline] = None):
+    """
+    Narrow the current deadline for the enclosed block
+
+    Args:
+        seconds: Budget for the block (capped by the enclosing deadline)
+        deadline: Explicit deadline to use instead (still capped by the enclosing one)
+    """
+    parent = current_deadline.get()
+    if deadline is not None:
+        scoped = Deadline(deadline.expires_at)
+        if parent.expires_at is not None:
+            scoped = Deadline(min(parent.expires_at, deadline.expires_at or parent.expires_at))
+    else:
+        scoped = parent.child(seconds)
+    token = current_deadline.set(scoped)
+    try:
+        yield scoped
+    finally:
+        current_deadline.reset(token)
+
+
+def cap_timeout(timeout: urllib3.Timeout) -> urllib3.Timeout:
+    """
+    Shrink a per-command HTTP timeout to the time left in the current deadline
+
+    Raises:
+        DeadlineExceeded: If the deadline has already passed
+    """
+    remaining = current_deadline.get().remaining()
+    if remaining is None:
+        return timeout
+    if remaining <= 0:
+        raise DeadlineExceeded("Deadline exceeded before driver command")
+    connect = timeout.connect_timeout
+    read = timeout.read_timeout
+    return urllib3.Timeout(
+        connect=min(connect, remaining) if isinstance(connect, (int, float)) else remaining,
+        read=min(read, remaining) if isinstance(read, (int, float)) else remaining,
+    )
+
+
+async def run_step(name: str, step: Callable[..., Awaitable[bool]], *args,
+                   timeout: Optional[float] = None, retries: int = 0,
+                   on_miss: Optional[Callable[[], Awaitable[bool]]] = None, **kwargs) -> bool:
+    """
+    Run an automation step under a deadline, retrying transient driver errors
+
+    Args:
+        name: Step name for logging
+        step: Coroutine function returning True on success
+        timeout: Step budget in seconds (capped by the enclosing item/job deadline)
+        retries: Extra attempts after a transient error (0 for non-idempotent steps)
+        on_miss: Called when the step returns False (its target was not found); if it returns
+            True (e.g. it dismissed a popup covering the target) the step runs again
+
+    Returns:
+        bool: Step result; False on timeout or once retries are exhausted
+    """
+    step_token = current_step.set(name)
+    started = time.perf_counter()
+    result = False
+    try:
+        result = await _run_attempts(name, step, args, kwargs, timeout, retries, on_miss)
+        return result
+    finally:
+        record_step_time(name, time.perf_counter() - started, failed=not result)
+        current_step.reset(step_token)
+
+
+async def _run_attempts(name: str, step: Callable[..., Awaitable[bool]], args: tuple, kwargs: dict,
+                        timeout: Optional[float], retries: int,
+                        on_miss: Optional[Callable[[], Awaitable[bool]]]) -> bool:
+    attempt = 0
+    misses_handled = 0
+    while True:
+        with deadline_scope(timeout) as deadline, \
+                span(name, "step", attempt=attempt + misses_handled + 1) as step_span:
+            if deadline.expired:
+                logger.error("   ⏱️  No time left for step '%s'", name)
+                step_span.set(outcome="deadline")
+                return False
+            try:
+                remaining = deadline.remaining()
+                result = await asyncio.wait_for(carry_profile(step(*args, **kwargs)), timeout=remaining)
+            except (asyncio.TimeoutError, DeadlineExceeded):
+                logger.error("   ⏱️  Step '%s' exceeded its deadline", name)
+                step_span.set(outcome="deadline")
+                return False
+            except Exception as e:
+                step_span.set(outcome=e.__class__.__name__)
+                if not is_transient(e) or attempt >= retries:
+                    logger.error("   ❌ Step '%s' failed: %s", name, e)
+                    return False
+                delay = RETRY_BASE_DELAY * (2 ** attempt) * random.uniform(0.8, 1.2)
+                logger.info("   🔁 Transient error in '%s' (%s), retry %d/%d in %.1fs",
+                            name, e.__class__.__name__, attempt + 1, retries, delay)
+            else:
+                if result or on_miss is None or misses_handled >= MAX_MISS_RETRIES or not await on_miss():
+                    step_span.set(outcome="ok" if result else "failed")
+                    return result
+                step_span.set(outcome="interrupted")
+                misses_handled += 1
+                logger.info("   🔁 Retrying '%s' after an interrupt was dismissed", name)
+                continue
+        attempt += 1
+        await asyncio.sleep(delay * AH_SLEEP_SCALE)
+
+
+class CircuitBreaker:
+    """
+    Takes a repeatedly failing device out of rotation
+
+    closed: device is used normally
+    open: device is skipped until `reset_seconds` have passed
+    half_open: one probe run is allowed; success closes, failure re-opens
+
+    Args:
+        failure_threshold: Consecutive failures that open the breaker
+        reset_seconds: How long the breaker stays open before a probe
+    """
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    @property
+    def available(self) -> bool:
+        return self.state != "open"
+
+    def retry_in(self) -> float:
+        """Seconds until an open breaker allows a probe"""
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+
+    def record_failure(self, error: str = "") -> bool:
+        """
+        Count a failure
+
+        Returns:
+            bool: True if this failure opened the breaker
+        """
+        self.failures += 1
+        self.last_error = error or self.last_error
+        was_half_open = self.state == "half_open"
+        if was_half_open or (self.opened_at is None and self.failures >= self.failure_threshold):
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+    def to_dict(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "retry_in": round(self.retry_in(), 1),
+            "last_error": self.last_error,
+        }
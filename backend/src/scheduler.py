@@ -0,0 +1,942 @@
+"""
+Automation job scheduler
+Assigns queued baskets to devices by priority, per-user fair share, device capability and
+account affinity, with admission control based on projected wait. With several API worker
+processes, a device is only used by the worker holding its lease in the shared registry
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import json
+import logging
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from .accounts import AccountSwitchFailed, can_switch_to, device_accounts
+from .ah_automation import forget_session
+from .artifacts import artifact_store
+from .config import (
+    AH_DEVICES,
+    APPIUM_QUIT_TIMEOUT,
+    SCHEDULER_SLICE_ITEMS,
+    SCHEDULER_MAX_WAIT,
+    SCHEDULER_ADMISSION,
+    SCHEDULER_FAIR_SHARE_HALF_LIFE,
+    JOB_DEADLINE_FACTOR,
+    JOB_MIN_DEADLINE,
+    SLICE_MAX_ATTEMPTS,
+    LEASE_POLL_INTERVAL,
+    ACCOUNT_MAX_WAIT,
+)
+from .context import current_device_id
+from .events import ITEM_RESULT, JobEventLog
+from .health import DeviceHealth, health_for
+from .metrics import metrics
+from .registry import LocalRegistry, Registry
+from .profiling import JobProfile, profile_block, profiler, should_profile
+from .resilience import CircuitBreaker, Deadline, SessionLost, deadline_scope, is_device_error
+from .timing import TimingModel, timing_model
+from .tracing import Trace, record_span, span, trace_scope, trace_store
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs kept around for status queries
+MAX_FINISHED_JOBS = 200
+
+
+class SchedulerError(Exception):
+    """Base class for scheduling errors"""
+
+
+class NoCompatibleDevice(SchedulerError):
+    """No configured device can run the requested device type (or reach the requested account)"""
+
+
+class AdmissionRejected(SchedulerError):
+    """Projected wait exceeds the configured bound"""
+
+    def __init__(self, projected_wait: float, max_wait: float):
+        self.projected_wait = projected_wait
+        self.max_wait = max_wait
+        super().__init__(
+            f"Projected wait {projected_wait:.0f}s exceeds the limit of {max_wait:.0f}s, try again later"
+        )
+
+
+class JobFailed(Exception):
+    """Raised by Job.wait() when the job ended with an error"""
+
+
+class Device:
+    """
+    One phone/emulator reachable through Appium
+
+    Args:
+        device_id: Unique name of the device
+        device_type: "ios" or "android"
+        capabilities: Extra Appium capabilities (e.g. "appium:udid") applied on top of the defaults
+        appium_url: Appium server URL for this device (default: APPIUM_SERVER_URL)
+        account: Account the app is logged into (None if unknown)
+    """
+
+    def __init__(self, device_id: str, device_type: str, capabilities: Optional[dict] = None,
+                 appium_url: Optional[str] = None, account: Optional[str] = None):
+        self.id = device_id
+        self.device_type = device_type.lower()
+        self.capabilities = capabilities or {}
+        self.appium_url = appium_url
+        self.account = account
+        self.driver = None
+        self.current_job: Optional["Job"] = None
+        self.slice_started_at: Optional[float] = None
+        self.slice_estimate = 0.0
+        self.breaker = CircuitBreaker()
+        # This process holds the device's lease (only then may it open a session on it)
+        self.leased = False
+        # Held while a session is being opened, so startup warm-up and a job never open two
+        # (only used on the device's own loop, see run())
+        self.session_lock = asyncio.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        """False while the device's circuit breaker is open"""
+        return self.breaker.available
+
+    @property
+    def health(self) -> DeviceHealth:
+        return health_for(self.id)
+
+    def _device_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name=f"device-{self.id}", daemon=True).start()
+            return self._loop
+
+    async def run(self, fn: Callable[..., Awaitable[Any]], *args) -> Any:
+        """
+        Run a coroutine function on the device's own thread and event loop
+
+        Driver commands block the thread they run on; running a device's work here lets devices
+        work in parallel and keeps the main loop (API, events, lease renewal) responsive. The
+        caller's context variables (job, deadline, trace) carry over; cancelling the caller
+        cancels the work at its next await.
+        """
+        loop = self._device_loop()
+        coro = fn(*args)
+        done: concurrent.futures.Future = concurrent.futures.Future()
+        tasks: List[asyncio.Task] = []
+
+        def settle(task: asyncio.Task):
+            if done.cancelled():
+                return
+            if task.cancelled():
+                done.cancel()
+            elif task.exception() is not None:
+                done.set_exception(task.exception())
+            else:
+                done.set_result(task.result())
+
+        def start():
+            if done.cancelled():
+                coro.close()
+                return
+            task = loop.create_task(coro)
+            tasks.append(task)
+            task.add_done_callback(settle)
+
+        def cancel():
+            for task in tasks:
+                task.cancel()
+
+        # The task copies the context start() runs in: the caller's
+        loop.call_soon_threadsafe(start, context=contextvars.copy_context())
+        try:
+            return await asyncio.wrap_future(done)
+        except asyncio.CancelledError:
+            loop.call_soon_threadsafe(cancel)
+            raise
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "device_type": self.device_type,
+            "account": self.account,
+            "session_active": self.driver is not None,
+            "leased": self.leased,
+            "busy": self.current_job is not None,
+            "current_job": self.current_job.id if self.current_job else None,
+            "breaker": self.breaker.to_dict(),
+            "health": self.health.to_dict(),
+        }
+
+
+def load_devices() -> List[Device]:
+    """
+    Devices from AH_DEVICES, or one iOS and one Android device from the single-device env settings
+
+    A device's account is the one it was last switched to, else its configured "account".
+    """
+    devices = None
+    if AH_DEVICES.strip():
+        try:
+            entries = json.loads(AH_DEVICES)
+            devices = [
+                Device(
+                    entry.get("id") or f"{entry['device_type']}-{idx + 1}",
+                    entry["device_type"],
+                    entry.get("capabilities"),
+                    entry.get("appium_url"),
+                    entry.get("account"),
+                )
+                for idx, entry in enumerate(entries)
+            ]
+        except Exception as e:
+            logger.error("Invalid AH_DEVICES configuration, using defaults: %s", e)
+    devices = devices or [Device("ios", "ios"), Device("android", "android")]
+    for device in devices:
+        device.account = device_accounts.get(device.id, device.account)
+    return devices
+
+
+class Job:
+    """
+    One basket submitted by a user
+
+    Args:
+        products: List of dicts with 'name' and 'quantity' keys
+        device_type: "ios" or "android"
+        user_id: Submitting user, used for fair share
+        priority: Higher runs first
+        profile: Run the job under the sampling profiler
+        log_level: Verbosity of the job's logs (e.g. "debug"), None for the server default
+        account: Account whose basket the products go to (None: whichever account the
+            device is logged into)
+    """
+
+    def __init__(self, products: List[dict], device_type: str, user_id: str = "anonymous",
+                 priority: int = 0, profile: bool = False,
+                 log_level: Optional[str] = None, account: Optional[str] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.products = products
+        self.device_type = device_type.lower()
+        self.user_id = user_id
+        self.account = account
+        self.priority = priority
+        # Status events for clients; the automation code sends to it like to a WebSocket
+        self.events = JobEventLog(self.id)
+        self.log_level = log_level
+        self.status = "queued"
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.next_index = 0
+        self.success_count = 0
+        self.failed_items: List[str] = []
+        self.device_id: Optional[str] = None
+        self.estimated_seconds = 0.0
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.deadline = Deadline()
+        self.slice_attempts = 0
+        # Slices that actually ran, and why the last one that could not run did not
+        self.slices_run = 0
+        self.last_slice_error: Optional[str] = None
+        self.trace: Optional[Trace] = None
+        self.queued_since = time.perf_counter()
+        self._started_perf: Optional[float] = None
+        self.profile: Optional[JobProfile] = (
+            JobProfile(self.id, profiler.interval) if should_profile(profile) else None
+        )
+        self._done = asyncio.Event()
+
+    @property
+    def total_products(self) -> int:
+        return len(self.products)
+
+    @property
+    def remaining_products(self) -> List[dict]:
+        return self.products[self.next_index:]
+
+    @property
+    def finished(self) -> bool:
+        return self._done.is_set()
+
+    def finish(self, error: Optional[str] = None):
+        """Mark the job completed (or failed) and wake up waiters"""
+        self.finished_at = time.time()
+        if error:
+            self.status = "failed"
+            self.error = error
+        else:
+            self.status = "completed"
+            self.result = {
+                "status": "success",
+                "message": f"Added {self.success_count}/{self.total_products} products to basket",
+                "products_added": self.success_count,
+                "total_products": self.total_products,
+                "failed_items": self.failed_items,
+                "job_id": self.id,
+            }
+            if self.profile:
+                self.result["profile_url"] = f"/jobs/{self.id}/profile"
+            artifacts = artifact_store.for_job(self.id)
+            if artifacts:
+                self.result["artifacts"] = artifacts
+        # Final events are published here so they reach the log even if no client is connected
+        if error:
+            self.events.publish({
+                "status": "error",
+                "message": f"Automation error: {error}",
+                "progress": 0.0
+            })
+        else:
+            self.events.publish({
+                "status": "completed",
+                "message": f"Successfully added {self.success_count}/{self.total_products} products",
+                "progress": 100.0
+            })
+            self.events.publish(self.result)
+        self.events.close()
+        self._done.set()
+
+    async def wait(self) -> dict:
+        """
+        Wait for the job to finish
+
+        Returns:
+            dict: Job result
+
+        Raises:
+            JobFailed: If the job ended with an error
+        """
+        await self._done.wait()
+        if self.error:
+            raise JobFailed(self.error)
+        return self.result
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "user_id": self.user_id,
+            "account": self.account,
+            "priority": self.priority,
+            "device_type": self.device_type,
+            "device_id": self.device_id,
+            "total_products": self.total_products,
+            "processed_products": self.next_index,
+            "products_added": self.success_count,
+            "failed_items": self.failed_items,
+            "artifacts": artifact_store.for_job(self.id),
+            "estimated_seconds": round(self.estimated_seconds, 1),
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "profiled": self.profile is not None,
+            "last_event_seq": self.events.last_seq,
+        }
+
+
+# Runs a slice of a job's products on a device; returns (success_count, failed_items)
+JobRunner = Callable[[Device, Job, List[dict]], Awaitable[Tuple[int, List[str]]]]
+
+# Logs a device's app into an account; raises AccountSwitchFailed if it could not
+AccountSwitcher = Callable[[Device, str], Awaitable[None]]
+
+
+class Scheduler:
+    """
+    Fair-share job scheduler with one worker per device
+
+    Jobs run in slices of `slice_items` products. Between slices the device goes back to the
+    scheduler, so a long basket cannot starve short ones. The next job for a free device is the
+    compatible job with the highest priority, then the lowest recent usage of its user plus the
+    predicted time of the job's next slice (so between equal users the shorter slice goes
+    first), then the earliest submission.
+
+    Within a priority, a device first takes jobs for the account it is logged into (or jobs
+    without an account), so one account's baskets run back to back. A job for another account
+    only makes the device switch accounts when no available device of its type is logged into
+    that account, or once it has been queued for ACCOUNT_MAX_WAIT seconds.
+
+    Args:
+        devices: Devices to schedule on
+        runner: Coroutine that runs a slice of a job on a device
+        slice_items: Products per slice
+        max_wait: Projected wait (seconds) above which new jobs are rejected or deferred
+        admission: "reject" or "defer"
+        half_life: Half-life (seconds) of a user's accumulated device time
+        registry: Device leases and job snapshots shared with other worker processes
+        timings: Item timing model used for estimates (default: the shared timing_model)
+        switcher: Coroutine that logs a device into another account (None: never switch)
+    """
+
+    def __init__(self, devices: List[Device], runner: JobRunner,
+                 slice_items: int = SCHEDULER_SLICE_ITEMS,
+                 max_wait: float = SCHEDULER_MAX_WAIT,
+                 admission: str = SCHEDULER_ADMISSION,
+                 half_life: float = SCHEDULER_FAIR_SHARE_HALF_LIFE,
+                 registry: Optional[Registry] = None, timings: Optional[TimingModel] = None,
+                 switcher: Optional[AccountSwitcher] = None):
+        self.devices = {device.id: device for device in devices}
+        self.runner = runner
+        self.slice_items = max(1, slice_items)
+        self.max_wait = max_wait
+        self.admission = admission
+        self.half_life = half_life
+        self.timings = timings or timing_model
+        self.switcher = switcher
+        self.jobs: Dict[str, Job] = {}
+        self._queue: List[Job] = []
+        self._deferred: List[Job] = []
+        self._usage: Dict[str, Tuple[float, float]] = {}
+        self.registry = registry or LocalRegistry()
+        self._cond: Optional[asyncio.Condition] = None
+        self._workers: Dict[str, asyncio.Task] = {}
+        self._lease_keeper: Optional[asyncio.Task] = None
+        self._lease_renewer: Optional[threading.Thread] = None
+
+    def estimate(self, products: List[dict], device_type: str, device_id: Optional[str] = None) -> float:
+        """Estimated seconds to run the given products on a device of this type (or this device)"""
+        return self.timings.estimate(products, device_type, device_id)
+
+    def eta(self, job: Job, event: Optional[dict] = None) -> float:
+        """
+        Predicted seconds until the job finishes
+
+        A queued job first waits for the projected backlog. For a running job, the time left is
+        counted from the product the event is about (if any), otherwise from the running
+        slice's elapsed time. Assumes the job keeps its device between slices.
+        """
+        if job.finished_at is not None:
+            return 0.0
+        device = self.devices.get(job.device_id) if job.device_id else None
+        if job.status != "running" or device is None:
+            remaining = self.projected_wait(job) + self.estimate(job.remaining_products, job.device_type)
+            if job.account and not self._account_devices(job):
+                remaining += self.timings.switch_seconds(job.device_type)
+            return round(remaining, 1)
+        index = event.get("index") if event else None
+        if index is not None:
+            start = index + 1 if event.get("status") == ITEM_RESULT else index
+            remaining = self.estimate(job.products[start:], device.device_type, device.id)
+        else:
+            slice_end = job.next_index + self.slice_items
+            remaining = self._running_remaining(device) + self.estimate(
+                job.products[slice_end:], device.device_type, device.id
+            )
+        return round(remaining, 1)
+
+    def _compatible_devices(self, device_type: str) -> List[Device]:
+        return [device for device in self.devices.values() if device.device_type == device_type]
+
+    def _account_devices(self, job: Job) -> List[Device]:
+        """Available devices of the job's type logged into the job's account"""
+        return [device for device in self._compatible_devices(job.device_type)
+                if device.account == job.account and device.available]
+
+    def _serves(self, device: Device, job: Job) -> bool:
+        """Whether the device can run the job without switching accounts"""
+        return job.account is None or job.account == device.account
+
+    def _may_switch_for(self, device: Device, job: Job) -> bool:
+        """Whether the device may switch to the job's account to run it"""
+        if self.switcher is None or not can_switch_to(job.account):
+            return False
+        if not any(other is not device for other in self._account_devices(job)):
+            return True
+        # A device of that account exists but is kept busy by others
+        return time.perf_counter() - job.queued_since >= ACCOUNT_MAX_WAIT
+
+    def _job_deadline(self, job: Job) -> Deadline:
+        if JOB_DEADLINE_FACTOR <= 0:
+            return Deadline()
+        return Deadline.after(max(JOB_MIN_DEADLINE, job.estimated_seconds * JOB_DEADLINE_FACTOR))
+
+    def _running_remaining(self, device: Device) -> float:
+        if not device.current_job or device.slice_started_at is None:
+            return 0.0
+        elapsed = time.monotonic() - device.slice_started_at
+        return max(0.0, device.slice_estimate - elapsed)
+
+    def projected_wait(self, job: Job) -> float:
+        """
+        Seconds until a device is expected to pick up the job
+
+        Counts queued work of equal or higher priority and the rest of running slices,
+        spread over the compatible devices.
+        """
+        devices = self._compatible_devices(job.device_type)
+        if not devices:
+            return float("inf")
+        available = [device for device in devices if device.available]
+        # With every device tripped, nothing runs before the first breaker allows a probe
+        backlog = 0.0 if available else min(device.breaker.retry_in() for device in devices)
+        devices = available or devices
+        backlog += sum(self._running_remaining(device) for device in devices)
+        backlog += sum(
+            self.estimate(queued.remaining_products, queued.device_type)
+            for queued in self._queue
+            if queued is not job and queued.device_type == job.device_type
+            and queued.priority >= job.priority
+        )
+        return backlog / len(devices)
+
+    def queue_position(self, job: Job) -> Optional[int]:
+        """1-based position among queued jobs for the same device type (None if not queued)"""
+        if job not in self._queue:
+            return None
+        candidates = sorted(
+            (queued for queued in self._queue if queued.device_type == job.device_type),
+            key=self._order_key,
+        )
+        return candidates.index(job) + 1
+
+    def _user_usage(self, user_id: str) -> float:
+        value, updated_at = self._usage.get(user_id, (0.0, time.monotonic()))
+        elapsed = time.monotonic() - updated_at
+        return value * 0.5 ** (elapsed / self.half_life) if self.half_life > 0 else value
+
+    def _charge(self, user_id: str, seconds: float):
+        self._usage[user_id] = (max(0.0, self._user_usage(user_id) + seconds), time.monotonic())
+
+    def _order_key(self, job: Job, device: Optional[Device] = None):
+        next_slice = self.estimate(job.remaining_products[:self.slice_items], job.device_type)
+        # Within a priority, jobs the device runs without switching accounts go first
+        switch = device is not None and not self._serves(device, job)
+        return (-job.priority, switch, self._user_usage(job.user_id) + next_slice, job.submitted_at)
+
+    def _condition(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    def start(self):
+        """Start the device workers and lease renewal (otherwise done on the first submit)"""
+        self._ensure_workers()
+
+    def _ensure_workers(self):
+        for device in self.devices.values():
+            task = self._workers.get(device.id)
+            if task is None or task.done():
+                self._workers[device.id] = asyncio.create_task(self._worker(device))
+        if self._lease_keeper is None or self._lease_keeper.done():
+            self._lease_keeper = asyncio.create_task(self._keep_leases())
+        if self._lease_renewer is None or not self._lease_renewer.is_alive():
+            self._lease_renewer = threading.Thread(target=self._renew_leases, name="lease-renewer", daemon=True)
+            self._lease_renewer.start()
+
+    async def submit(self, job: Job) -> Job:
+        """
+        Queue a job (or defer/reject it when the projected wait is too long)
+
+        Raises:
+            NoCompatibleDevice: If no device of the requested type is configured
+            AdmissionRejected: If the projected wait exceeds max_wait and admission is "reject"
+        """
+        if not self._compatible_devices(job.device_type):
+            raise NoCompatibleDevice(f"No {job.device_type} device is configured")
+        if job.account and not (self.switcher and can_switch_to(job.account)) and not any(
+            device.account == job.account for device in self._compatible_devices(job.device_type)
+        ):
+            raise NoCompatibleDevice(
+                f"No {job.device_type} device is logged into account {job.account} "
+                f"and no credentials are configured to switch one"
+            )
+
+        self._ensure_workers()
+        job.trace = trace_store.start(job.id)
+        job.events.progress_fields = lambda event: {"eta_seconds": self.eta(job, event)}
+        job.estimated_seconds = self.estimate(job.products, job.device_type)
+        wait = self.projected_wait(job)
+
+        if wait > self.max_wait:
+            if self.admission != "defer":
+                raise AdmissionRejected(wait, self.max_wait)
+            job.status = "deferred"
+            self._deferred.append(job)
+            logger.info("Deferred job %s from %s (projected wait %.0fs)", job.id, job.user_id, wait)
+        else:
+            self._enqueue(job)
+            logger.info(
+                "Queued job %s from %s: %d products on %s, estimated %.0fs, projected wait %.0fs",
+                job.id, job.user_id, job.total_products, job.device_type, job.estimated_seconds, wait,
+            )
+
+        self._register(job)
+        await self._publish(job)
+        async with self._condition():
+            self._condition().notify_all()
+        return job
+
+    def _enqueue(self, job: Job):
+        job.status = "queued"
+        job.queued_since = time.perf_counter()
+        self._queue.append(job)
+
+    def _register(self, job: Job):
+        self.jobs[job.id] = job
+        finished = sorted((j for j in self.jobs.values() if j.finished), key=lambda j: j.finished_at or 0)
+        for old in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            self.jobs.pop(old.id, None)
+
+    def _admit_deferred(self):
+        for job in list(self._deferred):
+            if self.projected_wait(job) <= self.max_wait:
+                self._deferred.remove(job)
+                self._enqueue(job)
+                logger.info("Admitted deferred job %s", job.id)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    async def get_remote(self, job_id: str) -> Optional[dict]:
+        """Status snapshot of a job submitted to another worker process"""
+        try:
+            return await asyncio.to_thread(self.registry.get_job, job_id)
+        except Exception as e:
+            logger.error("Could not read job %s from the registry: %s", job_id, e)
+            return None
+
+    async def _publish(self, job: Job):
+        """Make the job's current status visible to the other worker processes"""
+        try:
+            await asyncio.to_thread(self.registry.save_job, {**job.to_dict(), "eta_seconds": self.eta(job)})
+        except Exception as e:
+            logger.error("Could not save job %s to the registry: %s", job.id, e)
+
+    async def acquire_lease(self, device: Device) -> bool:
+        try:
+            device.leased = await asyncio.to_thread(self.registry.acquire, device.id)
+        except Exception as e:
+            logger.error("Could not acquire the lease on %s: %s", device.id, e)
+            device.leased = False
+        if device.leased:
+            logger.info("Acquired the lease on %s", device.id)
+            # Another worker process may have switched the device's account
+            device.account = await asyncio.to_thread(device_accounts.get, device.id, device.account)
+        return device.leased
+
+    async def release_lease(self, device: Device):
+        """Close the device's session and let another worker process use it"""
+        await self.drop_session(device)
+        if not device.leased:
+            return
+        device.leased = False
+        try:
+            await asyncio.to_thread(self.registry.release, device.id)
+            logger.info("Released the lease on %s", device.id)
+        except Exception as e:
+            logger.error("Could not release the lease on %s: %s", device.id, e)
+
+    async def release_all(self):
+        """Release the leases of idle devices (on shutdown)"""
+        for device in self.devices.values():
+            if device.current_job is None:
+                await self.release_lease(device)
+
+    def _renew_leases(self):
+        """
+        Renew held leases, on a thread of its own
+
+        Independent of every event loop, so no blocking driver command or busy loop can delay a
+        renewal past the lease's TTL.
+        """
+        while True:
+            time.sleep(max(1.0, self.registry.ttl / 3))
+            for device in list(self.devices.values()):
+                if not device.leased:
+                    continue
+                try:
+                    renewed = self.registry.renew(device.id)
+                except Exception as e:
+                    logger.error("Could not renew the lease on %s: %s", device.id, e)
+                    continue
+                # Not renewed after a release in the meantime is expected
+                if not renewed and device.leased:
+                    logger.error("Lost the lease on %s", device.id)
+                    device.leased = False
+
+    async def _keep_leases(self):
+        """Close the sessions of lost leases and hand idle devices over to workers that want them"""
+        while True:
+            await asyncio.sleep(max(1.0, self.registry.ttl / 3))
+            for device in self.devices.values():
+                if device.current_job is not None:
+                    continue
+                if not device.leased:
+                    await self.drop_session(device)
+                    continue
+                try:
+                    contended = await asyncio.to_thread(self.registry.contended, device.id)
+                except Exception as e:
+                    logger.error("Could not check the lease on %s: %s", device.id, e)
+                    continue
+                if contended:
+                    await self.release_lease(device)
+
+    async def _confirm_lease(self, device: Device) -> bool:
+        """Renew the device's lease before a slice; False (device released) if it is no longer ours"""
+        try:
+            renewed = await asyncio.to_thread(self.registry.renew, device.id)
+        except Exception as e:
+            logger.error("Could not renew the lease on %s: %s", device.id, e)
+            renewed = False
+        if not renewed:
+            logger.error("Lost the lease on %s before running a slice", device.id)
+            device.leased = False
+            await self.drop_session(device)
+        return renewed
+
+    def _runnable(self, device: Device, job: Job) -> bool:
+        return job.device_type == device.device_type and (
+            self._serves(device, job) or self._may_switch_for(device, job)
+        )
+
+    def _has_work(self, device: Device) -> bool:
+        return any(self._runnable(device, job) for job in self._queue)
+
+    def status(self) -> dict:
+        return {
+            "devices": [device.to_dict() for device in self.devices.values()],
+            "queued": len(self._queue),
+            "deferred": len(self._deferred),
+        }
+
+    def _pick(self, device: Device) -> Optional[Job]:
+        if not device.available or not device.leased:
+            return None
+        candidates = [job for job in self._queue if self._runnable(device, job)]
+        if not candidates:
+            return None
+        job = min(candidates, key=lambda job: self._order_key(job, device))
+        self._queue.remove(job)
+        return job
+
+    async def _next_job(self, device: Device) -> Job:
+        cond = self._condition()
+        while True:
+            async with cond:
+                job = self._pick(device)
+                if job:
+                    return job
+                if device.leased or not device.available or not self._has_work(device):
+                    # Breaker open: sleep until it allows a probe run
+                    timeout = None if device.available else device.breaker.retry_in() + 0.1
+                    try:
+                        await asyncio.wait_for(cond.wait(), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+            # Work is queued but another worker process may hold the device
+            if await self.acquire_lease(device):
+                continue
+            async with cond:
+                try:
+                    await asyncio.wait_for(cond.wait(), timeout=LEASE_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _set_account(self, device: Device, account: Optional[str]):
+        device.account = account
+        await asyncio.to_thread(device_accounts.set, device.id, account)
+
+    async def _switch_account(self, device: Device, account: str):
+        """
+        Log the device into another account, as a measured step of its own
+
+        The duration goes to the "account_switch" span, metrics and the timing model.
+
+        Raises:
+            AccountSwitchFailed: If the login did not succeed (the device's account is then unknown);
+                driver errors propagate as they are
+        """
+        previous = device.account
+        logger.info("Switching %s from account %s to %s", device.id, previous or "unknown", account)
+        started = time.perf_counter()
+        # Until the login is confirmed the app may be logged into neither account
+        await self._set_account(device, None)
+        try:
+            with span("account_switch", "scheduler", device=device.id):
+                await self.switcher(device, account)
+        except Exception:
+            metrics.increment("accounts.switch_failures")
+            raise
+        seconds = time.perf_counter() - started
+        await self._set_account(device, account)
+        metrics.increment("accounts.switches")
+        metrics.observe("accounts.switch_ms", seconds * 1000)
+        self.timings.record_switch(device.id, device.device_type, seconds)
+        logger.info("Switched %s to account %s in %.1fs", device.id, account, seconds)
+
+    async def drop_session(self, device: Device):
+        """
+        Close the device's session (e.g. when tripped, so the probe run starts fresh)
+
+        The quit runs in a thread, bounded by APPIUM_QUIT_TIMEOUT: a hung WebDriverAgent or
+        UiAutomator2 must not block the loop the other devices and websockets run on.
+        """
+        driver = device.driver
+        if driver is None:
+            return
+        device.driver = None
+        forget_session(driver)
+        try:
+            await asyncio.wait_for(asyncio.to_thread(driver.quit), timeout=APPIUM_QUIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Closing the session on %s took over %.0fs, abandoning it", device.id, APPIUM_QUIT_TIMEOUT)
+        except Exception as e:
+            logger.info("Error closing session on %s: %s", device.id, e)
+
+    async def _run_slice(self, device: Device, job: Job, products: List[dict],
+                         switch_to: Optional[str]) -> Tuple[int, List[str]]:
+        """Runs on the device's thread: switch accounts if needed, then add the slice's products"""
+        with profile_block(sys._getframe(), job.profile):
+            if switch_to:
+                await self._switch_account(device, switch_to)
+            with span("slice", "scheduler", device=device.id, start_index=job.next_index,
+                      products=len(products)) as slice_span:
+                success_count, failed_items = await self.runner(device, job, products)
+                slice_span.set(added=success_count)
+        return success_count, failed_items
+
+    async def _worker(self, device: Device):
+        # Spans and logs from this worker belong to its device
+        current_device_id.set(device.id)
+        while True:
+            job = await self._next_job(device)
+            if not await self._confirm_lease(device):
+                # Another worker process may own the device now: the job goes back to the queue
+                self._queue.append(job)
+                async with self._condition():
+                    self._condition().notify_all()
+                continue
+            if job.trace:
+                with trace_scope(job.trace):
+                    record_span("queued", "scheduler", job.queued_since)
+            products = job.products[job.next_index:job.next_index + self.slice_items]
+            estimate = self.estimate(products, device.device_type, device.id)
+            switch_to = job.account if not self._serves(device, job) else None
+            if switch_to:
+                estimate += self.timings.switch_seconds(device.device_type, device.id)
+
+            job.status = "running"
+            job.device_id = device.id
+            if job.started_at is None:
+                job.started_at = time.time()
+                job.deadline = self._job_deadline(job)
+                job._started_perf = time.perf_counter()
+            device.current_job = job
+            device.slice_started_at = time.monotonic()
+            device.slice_estimate = estimate
+            self._charge(job.user_id, estimate)
+            await self._publish(job)
+
+            error = None
+            device_error = session_lost = False
+            switch_failed = None
+            success_count = 0
+            failed_items: Optional[List[str]] = None
+            out_of_time = job.deadline.expired
+            try:
+                if out_of_time:
+                    logger.error("Job %s ran out of time, skipping %d products", job.id, len(products))
+                    failed_items = [product.get("name", "") for product in products]
+                else:
+                    with deadline_scope(deadline=job.deadline), trace_scope(job.trace):
+                        success_count, failed_items = await device.run(
+                            self._run_slice, device, job, products, switch_to
+                        )
+            except AccountSwitchFailed as e:
+                # Says nothing about the device's health: leave its breaker alone
+                switch_failed = str(e)
+                logger.error("Job %s could not run on %s: %s", job.id, device.id, switch_failed)
+            except SessionLost as e:
+                error = str(e)
+                device_error = session_lost = True
+                logger.error("Lost the session on %s during job %s: %s", device.id, job.id, error)
+                if e.tried:
+                    # Items settled before the session died stand; the rest go to the next slice
+                    success_count, failed_items = e.success_count, e.failed_items
+                    products = products[:e.tried]
+            except Exception as e:
+                error = str(e) or e.__class__.__name__
+                device_error = is_device_error(e)
+                logger.error("Slice of job %s failed on %s: %s", job.id, device.id, error)
+            finally:
+                elapsed = time.monotonic() - device.slice_started_at
+                device.current_job = None
+                device.slice_started_at = None
+                self._charge(job.user_id, elapsed - estimate)
+
+            # Products that cannot be found are the basket's problem, not the device's: only driver,
+            # session and timeout errors count toward the breaker
+            if out_of_time or switch_failed or (error is not None and not device_error):
+                pass
+            elif error is None:
+                device.breaker.record_success()
+            elif device.breaker.record_failure(error):
+                logger.warning(
+                    "Circuit breaker opened for %s after %d failures, retrying in %.0fs",
+                    device.id, device.breaker.failures, device.breaker.reset_seconds,
+                )
+                await self.drop_session(device)
+            if session_lost:
+                # A dead session is never reused, whether or not the breaker tripped
+                await self.drop_session(device)
+
+            if failed_items is None:
+                # The slice never ran: retry it (possibly on another device) before giving up on its products
+                job.last_slice_error = switch_failed or error
+                job.slice_attempts += 1
+                if job.slice_attempts < SLICE_MAX_ATTEMPTS and not job.deadline.expired:
+                    self._enqueue(job)
+                    self._admit_deferred()
+                    async with self._condition():
+                        self._condition().notify_all()
+                    continue
+                failed_items = [product.get("name", "") for product in products]
+            elif out_of_time:
+                job.last_slice_error = "Job ran out of time"
+            else:
+                job.slices_run += 1
+
+            job.slice_attempts = 0
+            job.success_count += success_count
+            job.failed_items.extend(failed_items)
+            metrics.increment("items.added", success_count)
+            metrics.increment("items.failed", len(failed_items))
+            job.next_index += len(products)
+
+            if job.next_index >= job.total_products:
+                if job.slices_run == 0:
+                    # Not a single product was tried: the job failed, it did not "add 0 products"
+                    job.finish(error=f"No slice of the job could run: {job.last_slice_error}")
+                else:
+                    job.finish()
+                if job.trace:
+                    with trace_scope(job.trace):
+                        record_span("job", "job", job._started_perf, products=job.total_products,
+                                    added=job.success_count, failed=len(job.failed_items))
+            else:
+                self._enqueue(job)
+            await self._publish(job)
+
+            # Between slices, hand the device over if another worker process is waiting for it
+            try:
+                contended = await asyncio.to_thread(self.registry.contended, device.id)
+            except Exception:
+                contended = False
+            if contended:
+                await self.release_lease(device)
+
+            self._admit_deferred()
+            async with self._condition():
+                self._condition().notify_all()
@@ -0,0 +1,157 @@
+"""
+Page source snapshots
+Parses a single page-source round trip into an element tree that can be queried locally
+"""
+
+import hashlib
+import logging
+import re
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_BOUNDS_RE = re.compile(r"\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]")
+
+# Containers whose children are dynamic content (search results, product lists)
+DYNAMIC_CONTAINERS = (
+    "XCUIElementTypeCell",
+    "android.widget.RecyclerView",
+    "android.widget.ListView",
+)
+
+# Element types that make up the stable "chrome" of a screen
+ANCHOR_TAGS = (
+    "XCUIElementTypeNavigationBar",
+    "XCUIElementTypeTabBar",
+    "XCUIElementTypeSearchField",
+    "XCUIElementTypeTextField",
+    "XCUIElementTypeButton",
+    "XCUIElementTypeToolbar",
+    "android.widget.EditText",
+    "android.widget.Button",
+    "android.widget.ImageButton",
+)
+
+
+def element_tag(element: ET.Element) -> str:
+    """Element type of a snapshot node (Android nodes carry it in 'class')"""
+    return element.get("class") or element.get("type") or element.tag
+
+
+def element_rect(element: ET.Element) -> Optional[Dict[str, int]]:
+    """
+    Read the on-screen rect of a snapshot node
+    
+    Returns:
+        dict with x, y, width and height, or None if the node has no geometry
+    """
+    bounds = element.get("bounds")
+    if bounds:
+        match = _BOUNDS_RE.match(bounds)
+        if not match:
+            return None
+        x1, y1, x2, y2 = (int(v) for v in match.groups())
+        return {"x": x1, "y": y1, "width": x2 - x1, "height": y2 - y1}
+    
+    try:
+        return {
+            "x": int(float(element.get("x"))),
+            "y": int(float(element.get("y"))),
+            "width": int(float(element.get("width"))),
+            "height": int(float(element.get("height"))),
+        }
+    except (TypeError, ValueError):
+        return None
+
+
+def element_is_displayed(element: ET.Element) -> bool:
+    """Whether a snapshot node is visible (missing attribute counts as visible)"""
+    visible = element.get("visible", element.get("displayed", "true"))
+    return visible.lower() == "true"
+
+
+def element_label(element: ET.Element) -> str:
+    """Best human-readable text of a snapshot node"""
+    for attr in ("label", "name", "text", "content-desc", "value"):
+        value = element.get(attr)
+        if value:
+            return value
+    return ""
+
+
+def _normalize_identifier(identifier: str) -> str:
+    # Buttons such as "Voeg toe: Halfvolle melk" embed product names and prices
+    identifier = identifier.split(":")[0]
+    return re.sub(r"[\d.,€]+", "#", identifier).strip()
+
+
+class Snapshot:
+    """One parsed page source"""
+    
+    def __init__(self, source: str):
+        self.source = source
+        self.root = ET.fromstring(source)
+        self._signature: Optional[str] = None
+    
+    @property
+    def size_bytes(self) -> int:
+        return len(self.source.encode("utf-8"))
+    
+    def iter(self) -> Iterator[ET.Element]:
+        """Iterate over all nodes in document order"""
+        return self.root.iter()
+    
+    def viewport(self) -> Optional[Dict[str, int]]:
+        """Rect of the application window (first node anchored at the origin)"""
+        for element in self.iter():
+            rect = element_rect(element)
+            if rect and rect["x"] == 0 and rect["y"] == 0 and rect["width"] and rect["height"]:
+                return rect
+        return None
+    
+    def find_all(self, tag: str) -> List[ET.Element]:
+        """All nodes of the given element type"""
+        return [element for element in self.iter() if element_tag(element) == tag]
+    
+    def _anchors(self, element: ET.Element, anchors: set):
+        tag = element_tag(element)
+        identifier = element.get("resource-id") or element.get("name") or element.get("content-desc")
+        if identifier and (tag in ANCHOR_TAGS or element.get("resource-id")):
+            anchors.add(f"{tag}#{_normalize_identifier(identifier)}")
+        if tag in DYNAMIC_CONTAINERS:
+            return
+        for child in element:
+            self._anchors(child, anchors)
+    
+    @property
+    def signature(self) -> str:
+        """
+        Stable fingerprint of the screen layout
+        
+        Built from the identifiers of navigation bars, buttons and input fields outside
+        list/result containers, so the same screen with different results matches.
+        """
+        if self._signature is None:
+            anchors = set()
+            self._anchors(self.root, anchors)
+            digest = hashlib.sha1("\n".join(sorted(anchors)).encode("utf-8"))
+            self._signature = digest.hexdigest()[:16]
+        return self._signature
+
+
+def take_snapshot(driver) -> Optional[Snapshot]:
+    """
+    Fetch and parse the current page source
+    
+    Args:
+        driver: Appium WebDriver
+    
+    Returns:
+        Snapshot, or None if the page source could not be read
+    """
+    try:
+        return Snapshot(driver.page_source)
+    except Exception as e:
+        logger.info("   Could not take page snapshot: %s", e)
+        return None
@@ -0,0 +1,268 @@
+"""
+Item timing model
+Learns per-step durations per device and per path (replayed rect vs full lookup, ranked vs
+selector pick, suggestion vs submitted search, extra quantity taps) from finished items, and
+account switch durations, and predicts how long a list of products will take on a device
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+from .config import SCHEDULER_DEFAULT_ITEM_SECONDS, SCHEDULER_TIMINGS_PATH
+from .context import current_step
+
+logger = logging.getLogger(__name__)
+
+# Steps of one item, in order (see add_item)
+STEPS = ("search", "select", "add")
+
+# Prior for one more tap on "+" until a device has measured it
+EXTRA_QUANTITY_SECONDS = 1.5
+
+# Prior for logging a device out of one account and into another (see accounts.py)
+ACCOUNT_SWITCH_SECONDS = 60.0
+
+# Queries whose search path timings are kept (least recently used dropped first)
+MAX_QUERIES = 1000
+
+# Seconds between writes of the model to disk
+SAVE_INTERVAL = 10.0
+
+# Format of the saved model; a file with another version is discarded and the model relearned
+MODEL_VERSION = 1
+
+
+class ItemTiming:
+    """Step durations and paths of the item being added, and the step it failed at"""
+
+    def __init__(self):
+        self.steps: Dict[str, float] = {}
+        self.paths: Dict[str, str] = {}
+        self.failed_step: Optional[str] = None
+
+
+current_item_timing: ContextVar[Optional[ItemTiming]] = ContextVar("current_item_timing", default=None)
+
+
+@contextmanager
+def item_timing() -> Iterator[ItemTiming]:
+    """Collect the step timings of one item (see run_step and note_path)"""
+    timing = ItemTiming()
+    token = current_item_timing.set(timing)
+    try:
+        yield timing
+    finally:
+        current_item_timing.reset(token)
+
+
+def note_path(path: str):
+    """Record which path the current step took (e.g. "replay" when a cached rect was tapped)"""
+    timing = current_item_timing.get()
+    step = current_step.get()
+    if timing is not None and step:
+        timing.paths[step] = path
+
+
+def skip_step(step: str, path: str):
+    """Record a step that a faster path made unnecessary (e.g. select after a suggestion opened the product)"""
+    timing = current_item_timing.get()
+    if timing is not None:
+        timing.steps[step] = 0.0
+        timing.paths[step] = path
+
+
+def record_step_time(step: str, seconds: float, failed: bool = False):
+    timing = current_item_timing.get()
+    if timing is not None:
+        timing.steps[step] = timing.steps.get(step, 0.0) + seconds
+        if failed:
+            timing.failed_step = step
+
+
+class TimingModel:
+    """
+    Exponentially weighted step durations, kept per device and per device type
+
+    An item is predicted as the sum of its steps (each weighted by how often the device takes
+    the fast path for it), the overhead between steps and the extra quantity taps. Devices
+    without enough history fall back to their device type, then to
+    SCHEDULER_DEFAULT_ITEM_SECONDS.
+
+    Args:
+        path: JSON file the model is persisted to
+        alpha: Weight of the newest sample
+    """
+
+    def __init__(self, path: str = SCHEDULER_TIMINGS_PATH, alpha: float = 0.2):
+        self.path = path
+        self.alpha = alpha
+        # scope ("device:<id>" / "type:<ios>") -> key -> [mean, samples]
+        self._scopes: Dict[str, Dict[str, List[float]]] = {}
+        # normalized query -> search path ("suggestion", "miss", "submit") -> [mean, samples]
+        # of the seconds from starting the search to the product page
+        self._queries: "OrderedDict[str, Dict[str, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = 0.0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.error("Could not load job timings %s: %s", self.path, e)
+            return
+        if not isinstance(data, dict) or data.get("version") != MODEL_VERSION:
+            logger.info("Discarding job timings %s of another format", self.path)
+            return
+        self._scopes = data["scopes"]
+        self._queries = OrderedDict(data["queries"])
+
+    def _update(self, scope: str, key: str, value: float):
+        self._update_entry(self._scopes.setdefault(scope, {}), key, value)
+
+    def _update_entry(self, stats: Dict[str, List[float]], key: str, value: float):
+        entry = stats.get(key)
+        if entry is None:
+            stats[key] = [value, 1]
+        else:
+            entry[0] += self.alpha * (value - entry[0])
+            entry[1] += 1
+
+    def _update_shares(self, scope: str, step: str, path: str):
+        """How often each path of a step is taken (1 for the path taken, 0 for the others)"""
+        taken = f"{step}/share/{path}"
+        keys = {key for key in self._scopes.get(scope, {}) if key.startswith(f"{step}/share/")} | {taken}
+        for key in keys:
+            self._update(scope, key, 1.0 if key == taken else 0.0)
+
+    def record_item(self, device_id: str, device_type: str, quantity: int, seconds: float,
+                    timing: Optional[ItemTiming] = None, query: Optional[str] = None):
+        """Learn from an item that was added (failed items say little about the next one)"""
+        with self._lock:
+            if timing is not None and query and "search" in timing.steps:
+                self._record_query(query, timing)
+            for scope in (f"device:{device_id}", f"type:{device_type}"):
+                self._update(scope, "item", seconds)
+                if timing is None:
+                    continue
+                for step, step_seconds in timing.steps.items():
+                    if step == "add" and quantity > 1:
+                        base = self._mean(scope, "add/" + timing.paths.get("add", "lookup"))
+                        if base is not None:
+                            self._update(scope, "extra_unit", max(0.0, (step_seconds - base) / (quantity - 1)))
+                        continue
+                    path = timing.paths.get(step, "lookup")
+                    self._update(scope, f"{step}/{path}", step_seconds)
+                    self._update_shares(scope, step, path)
+                if all(step in timing.steps for step in STEPS):
+                    self._update(scope, "overhead", max(0.0, seconds - sum(timing.steps.values())))
+            self._dirty = True
+        self.save()
+
+    def _record_query(self, query: str, timing: ItemTiming):
+        path = timing.paths.get("search")
+        path = path if path in ("suggestion", "miss") else "submit"
+        key = " ".join(query.lower().split())
+        stats = self._queries.pop(key, None) or {}
+        self._queries[key] = stats
+        while len(self._queries) > MAX_QUERIES:
+            self._queries.popitem(last=False)
+        self._update_entry(stats, path, timing.steps["search"] + timing.steps.get("select", 0.0))
+
+    def search_paths(self) -> Dict[str, Dict[str, dict]]:
+        """Per query: seconds from starting the search to the product page, per search path"""
+        with self._lock:
+            return {
+                query: {path: {"mean": round(entry[0], 3), "samples": int(entry[1])} for path, entry in stats.items()}
+                for query, stats in self._queries.items()
+            }
+
+    def record_switch(self, device_id: str, device_type: str, seconds: float):
+        """Learn from a finished account switch"""
+        with self._lock:
+            for scope in (f"device:{device_id}", f"type:{device_type}"):
+                self._update(scope, "account_switch", seconds)
+            self._dirty = True
+        self.save()
+
+    def _mean(self, scope: str, key: str) -> Optional[float]:
+        entry = self._scopes.get(scope, {}).get(key)
+        return entry[0] if entry else None
+
+    def _expected_step(self, scope: str, step: str) -> Optional[float]:
+        """Mean seconds of a step, its paths weighted by how often each is taken"""
+        stats = self._scopes.get(scope, {})
+        shares = {key.rsplit("/", 1)[1]: entry[0] for key, entry in stats.items() if key.startswith(f"{step}/share/")}
+        weighted = [(share, self._mean(scope, f"{step}/{path}")) for path, share in shares.items()]
+        weighted = [(share, mean) for share, mean in weighted if mean is not None]
+        total = sum(share for share, _ in weighted)
+        if not total:
+            return None
+        return sum(share * mean for share, mean in weighted) / total
+
+    def _base_seconds(self, scope: str) -> Optional[float]:
+        steps = [self._expected_step(scope, step) for step in STEPS]
+        overhead = self._mean(scope, "overhead")
+        if any(value is None for value in steps) or overhead is None:
+            return self._mean(scope, "item")
+        return sum(steps) + overhead
+
+    def item_seconds(self, device_type: str, quantity: int = 1, device_id: Optional[str] = None) -> float:
+        """Predicted seconds for one product"""
+        scopes = ([f"device:{device_id}"] if device_id else []) + [f"type:{device_type}"]
+        with self._lock:
+            base = next((value for value in map(self._base_seconds, scopes) if value is not None),
+                        SCHEDULER_DEFAULT_ITEM_SECONDS)
+            extra = next((value for value in (self._mean(scope, "extra_unit") for scope in scopes)
+                          if value is not None), EXTRA_QUANTITY_SECONDS)
+        return base + max(0, quantity - 1) * extra
+
+    def switch_seconds(self, device_type: str, device_id: Optional[str] = None) -> float:
+        """Predicted seconds for switching a device to another account"""
+        scopes = ([f"device:{device_id}"] if device_id else []) + [f"type:{device_type}"]
+        with self._lock:
+            return next((value for value in (self._mean(scope, "account_switch") for scope in scopes)
+                         if value is not None), ACCOUNT_SWITCH_SECONDS)
+
+    def estimate(self, products: List[dict], device_type: str, device_id: Optional[str] = None) -> float:
+        """Predicted seconds for a list of products (dicts with 'quantity')"""
+        return sum((self.item_seconds(device_type, product.get("quantity", 1), device_id)
+                    for product in products), 0.0)
+
+    def save(self, force: bool = False):
+        """Write the model to disk (at most every SAVE_INTERVAL seconds unless forced)"""
+        now = time.monotonic()
+        with self._lock:
+            if not self._dirty or (not force and now - self._saved_at < SAVE_INTERVAL):
+                return
+            data = json.dumps({"version": MODEL_VERSION, "scopes": self._scopes, "queries": self._queries}, indent=2)
+            self._dirty = False
+            self._saved_at = now
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error("Could not save job timings %s: %s", self.path, e)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                scope: {key: {"mean": round(entry[0], 3), "samples": int(entry[1])} for key, entry in stats.items()}
+                for scope, stats in self._scopes.items()
+            }
+
+
+timing_model = TimingModel()
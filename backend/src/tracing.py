@@ -0,0 +1,216 @@
+"""
+Span tracing of basket runs
+Nested timing spans (job -> slice -> item -> step -> driver command) recorded in memory per job
+and exported as Chrome trace-event JSON (open in chrome://tracing or ui.perfetto.dev)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+from .config import TRACING_ENABLED, TRACE_MAX_JOBS, TRACE_MAX_SPANS
+from .context import current_device_id
+
+# Longest locator / argument string kept on a span
+MAX_ARG_LENGTH = 200
+
+
+class Span:
+    """One timed operation; `args` are shown in the trace viewer"""
+
+    __slots__ = ("name", "category", "start", "end", "lane", "args")
+
+    def __init__(self, name: str, category: str, start: float, lane: str, args: dict):
+        self.name = name
+        self.category = category
+        self.start = start
+        self.end: Optional[float] = None
+        self.lane = lane
+        self.args = args
+
+    def set(self, **args):
+        """Attach extra arguments (outcome, byte counts, ...)"""
+        self.args.update(args)
+
+
+class _NoSpan:
+    """Stand-in when no trace is active, so callers never need to check"""
+
+    __slots__ = ()
+
+    def set(self, **args):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Trace:
+    """
+    Spans recorded for one job
+
+    Args:
+        job_id: Job the spans belong to
+        max_spans: Spans kept before further ones are dropped (and counted)
+    """
+
+    def __init__(self, job_id: str, max_spans: int = TRACE_MAX_SPANS):
+        self.job_id = job_id
+        self.max_spans = max_spans
+        self.origin = time.perf_counter()
+        self.wall_origin = time.time()
+        self.spans: List[Span] = []
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> bool:
+        with self._lock:
+            if len(self.spans) >= self.max_spans:
+                self.dropped += 1
+                return False
+            self.spans.append(span)
+            return True
+
+    def spans_since(self, start: float, lane: str) -> List[Span]:
+        """Spans of one lane (device) that started at or after `start`"""
+        with self._lock:
+            return [span for span in self.spans if span.lane == lane and span.start >= start]
+
+    def to_chrome(self) -> dict:
+        """Chrome trace-event format: complete ("X") events, one thread lane per device"""
+        with self._lock:
+            spans = list(self.spans)
+        lanes: Dict[str, int] = {}
+        events = []
+        for span in spans:
+            tid = lanes.setdefault(span.lane, len(lanes) + 1)
+            end = span.end if span.end is not None else time.perf_counter()
+            events.append({
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": round((span.start - self.origin) * 1e6, 1),
+                "dur": round((end - span.start) * 1e6, 1),
+                "pid": 1,
+                "tid": tid,
+                "args": span.args,
+            })
+        events.append({"name": "process_name", "ph": "M", "pid": 1, "args": {"name": f"job {self.job_id}"}})
+        for lane, tid in lanes.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": lane}})
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "job_id": self.job_id,
+                "started_at": self.wall_origin,
+                "spans": len(spans),
+                "dropped_spans": self.dropped,
+            },
+        }
+
+
+class TraceStore:
+    """Traces of the most recent jobs (oldest evicted first)"""
+
+    def __init__(self, max_jobs: int = TRACE_MAX_JOBS):
+        self.max_jobs = max_jobs
+        self._traces: "OrderedDict[str, Trace]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, job_id: str) -> Optional[Trace]:
+        if not TRACING_ENABLED:
+            return None
+        trace = Trace(job_id)
+        with self._lock:
+            self._traces[job_id] = trace
+            while len(self._traces) > self.max_jobs:
+                self._traces.popitem(last=False)
+        return trace
+
+    def get(self, job_id: str) -> Optional[Trace]:
+        with self._lock:
+            return self._traces.get(job_id)
+
+
+trace_store = TraceStore()
+
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def trace_scope(trace: Optional[Trace]):
+    """Record spans of the enclosed block into `trace`"""
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        current_trace.reset(token)
+
+
+def _lane() -> str:
+    return current_device_id.get() or "scheduler"
+
+
+def _clip(value):
+    if isinstance(value, str) and len(value) > MAX_ARG_LENGTH:
+        return value[:MAX_ARG_LENGTH] + "…"
+    return value
+
+
+@contextmanager
+def span(name: str, category: str, **args):
+    """
+    Time the enclosed block as a span of the active trace
+
+    The span's `outcome` is "ok", or the exception class name if the block raised.
+    Does nothing (and costs almost nothing) when no trace is active.
+    """
+    trace = current_trace.get()
+    if trace is None:
+        yield _NO_SPAN
+        return
+    current = Span(name, category, time.perf_counter(), _lane(), {key: _clip(value) for key, value in args.items()})
+    if not trace.add(current):
+        yield _NO_SPAN
+        return
+    try:
+        yield current
+    except BaseException as e:
+        current.args.setdefault("outcome", e.__class__.__name__)
+        raise
+    else:
+        current.args.setdefault("outcome", "ok")
+    finally:
+        current.end = time.perf_counter()
+
+
+def record_span(name: str, category: str, start: float, end: Optional[float] = None, **args) -> Optional[Span]:
+    """
+    Add an already-finished span (perf_counter timestamps) to the active trace
+
+    Returns:
+        The recorded Span, or None if no trace is active
+    """
+    trace = current_trace.get()
+    if trace is None:
+        return None
+    recorded = Span(name, category, start, _lane(), {key: _clip(value) for key, value in args.items()})
+    recorded.end = end if end is not None else time.perf_counter()
+    return recorded if trace.add(recorded) else None
+
+
+def command_args(command: str, params) -> dict:
+    """Span arguments for a WebDriver command: the locator for element lookups"""
+    if isinstance(params, dict) and "using" in params and "value" in params:
+        return {"locator": f"{params['using']}={params['value']}"}
+    return {}
+
+
+def response_bytes(response) -> Optional[int]:
+    """Size of a string command result, e.g. the page source"""
+    if isinstance(response, dict) and isinstance(response.get("value"), str):
+        return len(response["value"])
+    return None
@@ -0,0 +1,98 @@
+"""
+Traffic recording
+Appends one anonymized line per submitted basket (arrival time, hashed user, device type,
+priority, product names and quantities) to a JSONL trace that replay_traffic.py re-issues
+against the fake device backend
+"""
+
+import hashlib
+import json
+import logging
+import os
+import secrets
+import threading
+from typing import List, Optional
+from .config import TRAFFIC_MAX_MB, TRAFFIC_PATH, TRAFFIC_RECORD, TRAFFIC_SALT
+
+logger = logging.getLogger(__name__)
+
+# Longest product name kept (free text typed by users)
+MAX_NAME_LENGTH = 80
+
+
+class TrafficRecorder:
+    """
+    Writes the arrival of each basket to a JSONL trace
+
+    User ids are replaced by salted hashes and accounts, log levels and profiling flags are
+    left out. Once the trace exceeds `max_bytes` it is rotated to `<path>.1`.
+
+    Args:
+        path: Trace file
+        enabled: Record at all (AH_TRAFFIC_RECORD)
+        max_bytes: Size at which the trace is rotated
+        salt: Salt of the hashed user ids (random if empty)
+    """
+
+    def __init__(self, path: str = TRAFFIC_PATH, enabled: bool = TRAFFIC_RECORD,
+                 max_bytes: int = int(TRAFFIC_MAX_MB * 1024 * 1024), salt: str = TRAFFIC_SALT):
+        self.path = path
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.salt = salt or secrets.token_hex(16)
+        self._lock = threading.Lock()
+
+    def anonymize_user(self, user_id: str) -> str:
+        return "u-" + hashlib.sha256(f"{self.salt}:{user_id}".encode("utf-8")).hexdigest()[:12]
+
+    def record(self, arrived_at: float, user_id: str, device_type: str, priority: int, products: List[dict]):
+        """Append one basket to the trace (no-op unless recording is enabled)"""
+        if not self.enabled:
+            return
+        line = json.dumps({
+            "t": round(arrived_at, 3),
+            "user": self.anonymize_user(user_id),
+            "device_type": device_type,
+            "priority": priority,
+            "products": [
+                {"name": " ".join(str(product["name"]).lower().split())[:MAX_NAME_LENGTH],
+                 "quantity": product.get("quantity", 1)}
+                for product in products
+            ],
+        }, ensure_ascii=False)
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                    os.replace(self.path, f"{self.path}.1")
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            except Exception as e:
+                logger.error("Could not record traffic to %s: %s", self.path, e)
+
+
+traffic_recorder = TrafficRecorder()
+
+
+def load_trace(path: str, limit: Optional[int] = None) -> List[dict]:
+    """
+    Read a recorded trace, oldest arrival first
+
+    Lines that cannot be parsed are skipped; `limit` keeps only the first N baskets.
+    """
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                float(entry["t"])
+                entry["products"] = [product for product in entry["products"] if product.get("name")]
+            except Exception as e:
+                logger.warning("Skipping line %d of %s: %s", number, path, e)
+                continue
+            if entry["products"]:
+                entries.append(entry)
+    entries.sort(key=lambda entry: entry["t"])
+    return entries[:limit] if limit else entries
@@ -0,0 +1,227 @@
+"""
+Pooled keep-alive HTTP transport to Appium
+One tuned urllib3 pool per Appium server, shared by every session on that server,
+with per-command timeouts and instrumentation of connection reuse and round-trip times
+"""
+
+import json
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+import urllib3
+from appium.webdriver.appium_connection import AppiumConnection
+from .config import (
+    APPIUM_POOL_SIZE,
+    APPIUM_CONNECT_TIMEOUT,
+    APPIUM_READ_TIMEOUT,
+    APPIUM_SLOW_READ_TIMEOUT,
+    APPIUM_SESSION_TIMEOUT,
+)
+from .health import record_command
+from .metrics import metrics
+from .profiling import driver_io
+from .resilience import cap_timeout
+from .tracing import command_args, response_bytes, span
+
+logger = logging.getLogger(__name__)
+
+# Commands that start or stop WebDriverAgent / UiAutomator2 sessions
+SESSION_COMMANDS = {"newSession", "quit"}
+
+# Commands whose server-side work scales with screen size or involves gestures
+SLOW_COMMANDS = {
+    "getPageSource",
+    "screenshot",
+    "elementScreenshot",
+    "w3cExecuteScript",
+    "w3cExecuteScriptAsync",
+    "actions",
+    "activateApp",
+    "terminateApp",
+    "launchApp",
+}
+
+
+def command_timeout(command: str) -> urllib3.Timeout:
+    """Connect/read timeout for a WebDriver command"""
+    if command in SESSION_COMMANDS:
+        read = APPIUM_SESSION_TIMEOUT
+    elif command in SLOW_COMMANDS:
+        read = APPIUM_SLOW_READ_TIMEOUT
+    else:
+        read = APPIUM_READ_TIMEOUT
+    return urllib3.Timeout(connect=APPIUM_CONNECT_TIMEOUT, read=read)
+
+
+# W3C errors of commands that reached a healthy session (a lookup that found nothing is a
+# normal outcome of probing fallback locators); counted in appium.errors.* but not against the device
+EXPECTED_ERRORS = {"no such element", "no such alert", "stale element reference"}
+
+
+def response_error(response) -> Optional[str]:
+    """
+    W3C error code of a command response, or None if the command succeeded
+
+    RemoteConnection.execute returns error responses instead of raising: 4xx/5xx as the raw
+    body ({"value": {"error": ...}}), older drivers as a parsed body with a non-zero status.
+    """
+    if not isinstance(response, dict):
+        return None
+    status = response.get("status")
+    value = response.get("value")
+    if isinstance(value, str) and isinstance(status, int) and status >= 400:
+        try:
+            value = json.loads(value).get("value")
+        except (ValueError, AttributeError):
+            return f"http {status}"
+    if isinstance(value, dict) and value.get("error"):
+        return str(value["error"])
+    if isinstance(status, int) and status >= 400:
+        return f"http {status}"
+    if isinstance(status, int) and status != 0 and not 200 <= status < 300:
+        return f"status {status}"
+    return None
+
+
+def command_label(command: str, params) -> str:
+    """Metric label for a command; 'mobile:' scripts are split out by script name"""
+    if command.startswith("w3cExecuteScript") and isinstance(params, dict):
+        script = params.get("script")
+        if isinstance(script, str) and script.startswith("mobile:"):
+            return f"{command}[{script}]"
+    return command
+
+
+class _TimedPoolManager(urllib3.PoolManager):
+    """PoolManager that applies the timeout chosen for the command being executed"""
+    
+    def __init__(self, timeout_source, **connection_pool_kw):
+        super().__init__(**connection_pool_kw)
+        self._timeout_source = timeout_source
+    
+    def urlopen(self, method, url, redirect=True, **kw):
+        if "timeout" not in kw:
+            kw["timeout"] = self._timeout_source()
+        return super().urlopen(method, url, redirect=redirect, **kw)
+
+
+class PooledAppiumConnection(AppiumConnection):
+    """
+    Keep-alive command executor for webdriver.Remote
+    
+    Args:
+        remote_server_addr: Appium server URL
+        pool_size: Maximum pooled connections to the server (callers block when exhausted)
+    """
+    
+    def __init__(self, remote_server_addr: str, pool_size: int = APPIUM_POOL_SIZE):
+        self.pool_size = pool_size
+        self._local = threading.local()
+        super().__init__(
+            remote_server_addr,
+            keep_alive=True,
+            init_args_for_pool_manager={"maxsize": pool_size, "block": True},
+        )
+    
+    def _current_timeout(self) -> urllib3.Timeout:
+        return getattr(self._local, "timeout", None) or command_timeout("")
+    
+    def _get_connection_manager(self):
+        manager = super()._get_connection_manager()
+        if isinstance(manager, urllib3.ProxyManager):
+            return manager
+        return _TimedPoolManager(self._current_timeout, **manager.connection_pool_kw)
+    
+    def execute(self, command, params):
+        label = command_label(command, params)
+        # Never wait on Appium past the current job/item/step deadline
+        self._local.timeout = cap_timeout(command_timeout(command))
+        started = time.perf_counter()
+        try:
+            with span(label, "driver", **command_args(command, params)) as command_span, driver_io():
+                response = super().execute(command, params)
+                size = response_bytes(response)
+                if size is not None:
+                    command_span.set(bytes=size)
+        except Exception:
+            metrics.increment(f"appium.errors.{label}")
+            record_command(False)
+            raise
+        finally:
+            metrics.observe(f"appium.rtt.{label}", (time.perf_counter() - started) * 1000)
+            metrics.increment("appium.commands")
+        # Error responses come back without raising (WebDriver.execute raises them later)
+        error = response_error(response)
+        if error is not None:
+            metrics.increment(f"appium.errors.{label}")
+        record_command(error is None or error in EXPECTED_ERRORS)
+        return response
+    
+    def close(self):
+        # The pool is shared by every session on this server; driver.quit() must not drop it
+        pass
+    
+    def shutdown(self):
+        """Close all pooled connections"""
+        super().close()
+    
+    def pool_stats(self) -> dict:
+        """Connection reuse counters for this server"""
+        pools = []
+        for key in list(self._conn.pools.keys()):
+            try:
+                pools.append(self._conn.pools[key])
+            except KeyError:
+                continue
+        created = sum(pool.num_connections for pool in pools)
+        requests = sum(pool.num_requests for pool in pools)
+        idle = sum(pool.pool.qsize() for pool in pools if pool.pool is not None)
+        return {
+            "server": self._url,
+            "pool_size": self.pool_size,
+            "requests": requests,
+            "connections_created": created,
+            "connections_reused": max(0, requests - created),
+            "reuse_ratio": round(1 - created / requests, 3) if requests else 0.0,
+            "idle_connections": idle,
+        }
+
+
+_executors: Dict[str, PooledAppiumConnection] = {}
+_executors_lock = threading.Lock()
+
+
+def get_command_executor(server_url: str) -> PooledAppiumConnection:
+    """
+    Shared command executor for an Appium server
+    
+    Args:
+        server_url: Appium server URL
+    
+    Returns:
+        PooledAppiumConnection to pass as webdriver.Remote(command_executor=...)
+    """
+    with _executors_lock:
+        executor = _executors.get(server_url)
+        if executor is None:
+            executor = PooledAppiumConnection(server_url)
+            _executors[server_url] = executor
+            logger.info("Created Appium connection pool for %s (size %d)", server_url, executor.pool_size)
+        return executor
+
+
+def transport_stats() -> List[dict]:
+    """Pool statistics for every Appium server in use"""
+    with _executors_lock:
+        executors = list(_executors.values())
+    return [executor.pool_stats() for executor in executors]
+
+
+def close_all_executors():
+    """Close every pooled connection (server shutdown)"""
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown()
@@ -1,18 +1,28 @@
 #!/usr/bin/env python3
 """
 Test script to verify backend and Appium connections
+With --latency it also measures round-trip latency per driver command type, to tell a slow
+device, a slow Appium host and slow locators apart
 """
 
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
 import sys
 from appium import webdriver
 from appium.options.ios import XCUITestOptions
 from appium.options.android import UiAutomator2Options
+from appium.webdriver.common.appiumby import AppiumBy
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# A script run by hand against live servers; its test_* checks are not pytest tests
+__test__ = False
+
 def test_backend():
     """Test backend API"""
     print("Testing backend API...")
@@ -63,6 +73,27 @@ def test_appium_server():
     print("  Start it with: appium")
     return False
 
+def get_appium_options(device_type="ios"):
+    """Appium options for the configured device"""
+    if device_type.lower() == "ios":
+        options = XCUITestOptions()
+        options.platform_name = "iOS"
+        options.device_name = os.getenv("IOS_DEVICE_NAME", "iPhone")
+        options.platform_version = os.getenv("IOS_VERSION", "17.0")
+        options.bundle_id = os.getenv("AH_BUNDLE_ID", "nl.ah.ahapp")
+        options.udid = os.getenv("IOS_UDID", "")
+        options.automation_name = "XCUITest"
+        options.no_reset = True
+    else:  # Android
+        options = UiAutomator2Options()
+        options.platform_name = "Android"
+        options.device_name = os.getenv("ANDROID_DEVICE_NAME", "Android Device")
+        options.app_package = os.getenv("AH_PACKAGE", "nl.ah.app")
+        options.app_activity = os.getenv("AH_ACTIVITY", "nl.ah.app.MainActivity")
+        options.automation_name = "UiAutomator2"
+        options.no_reset = True
+    return options
+
 def test_device_connection(device_type="ios"):
     """Test device connection"""
     print(f"\nTesting {device_type} device connection...")
@@ -70,25 +101,7 @@ def test_device_connection(device_type="ios"):
     appium_url = os.getenv("APPIUM_SERVER_URL", "http://localhost:4723")
     
     try:
-        if device_type.lower() == "ios":
-            options = XCUITestOptions()
-            options.platform_name = "iOS"
-            options.device_name = os.getenv("IOS_DEVICE_NAME", "iPhone")
-            options.platform_version = os.getenv("IOS_VERSION", "17.0")
-            options.bundle_id = os.getenv("AH_BUNDLE_ID", "nl.ah.ahapp")
-            options.udid = os.getenv("IOS_UDID", "")
-            options.automation_name = "XCUITest"
-            options.no_reset = True
-        else:  # Android
-            options = UiAutomator2Options()
-            options.platform_name = "Android"
-            options.device_name = os.getenv("ANDROID_DEVICE_NAME", "Android Device")
-            options.app_package = os.getenv("AH_PACKAGE", "nl.ah.app")
-            options.app_activity = os.getenv("AH_ACTIVITY", "nl.ah.app.MainActivity")
-            options.automation_name = "UiAutomator2"
-            options.no_reset = True
-        
-        driver = webdriver.Remote(appium_url, options=options)
+        driver = webdriver.Remote(appium_url, options=get_appium_options(device_type))
         print(f"✓ Successfully connected to {device_type} device")
         print(f"  Device capabilities: {driver.capabilities}")
         driver.quit()
@@ -102,6 +115,244 @@ def test_device_connection(device_type="ios"):
         print("    4. .env file is configured correctly")
         return False
 
+# Element types that do nothing when clicked (the click probe must not navigate)
+INERT_TAGS = (
+    "XCUIElementTypeStaticText",
+    "XCUIElementTypeNavigationBar",
+    "XCUIElementTypeOther",
+    "android.widget.TextView",
+    "android.widget.FrameLayout",
+)
+
+# Page source root nodes (not findable elements)
+ROOT_TAGS = ("AppiumAUT", "hierarchy", "XCUIElementTypeApplication")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Test backend, Appium and device connections")
+    parser.add_argument("--latency", action="store_true",
+                        help="Measure round-trip latency per command type and print a comparison table")
+    parser.add_argument("--device-type", default=None, choices=["ios", "android"],
+                        help="Device type (asked interactively if omitted)")
+    parser.add_argument("--samples", type=int, default=20, help="Samples per command type (default: 20)")
+    parser.add_argument("--backend-url", default="http://localhost:8000", help="Backend base URL")
+    parser.add_argument("--fake", action="store_true", help="Probe the fake device backend instead of Appium")
+    parser.add_argument("--json", action="store_true", help="Print the latency report as JSON")
+    return parser.parse_args()
+
+def summarize_latency(samples_ms, errors, note=None):
+    """Latency distribution of one command type"""
+    from src.metrics import percentile
+
+    summary = {"count": len(samples_ms), "errors": errors}
+    if samples_ms:
+        summary.update(
+            p50=round(percentile(samples_ms, 0.50), 1),
+            p95=round(percentile(samples_ms, 0.95), 1),
+            max=round(max(samples_ms), 1),
+        )
+    if note:
+        summary["note"] = note
+    return summary
+
+def measure(command, samples):
+    """Run a command `samples` times and summarize its wall-clock latency"""
+    latencies = []
+    errors = 0
+    last_error = None
+    for _ in range(samples):
+        started = time.perf_counter()
+        try:
+            command()
+        except Exception as e:
+            errors += 1
+            last_error = str(e).strip().splitlines()[0] if str(e).strip() else e.__class__.__name__
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+    return summarize_latency(latencies, errors, last_error)
+
+def measure_http(url, samples):
+    def get():
+        response = requests.get(url, timeout=5)
+        # /health answers 503 while warming up, which still is a full round trip
+        if response.status_code >= 500 and response.status_code != 503:
+            raise RuntimeError(f"HTTP {response.status_code}")
+    return measure(get, samples)
+
+def appium_status_url():
+    # Appium 1.x URLs end in /wd/hub, which serves its own /status
+    return f"{os.getenv('APPIUM_SERVER_URL', 'http://localhost:4723').rstrip('/')}/status"
+
+def open_probe_session(device_type, fake):
+    if fake:
+        from src.config import AH_FAKE_LATENCY
+        from src.fake_driver import FakeDriver
+        return FakeDriver(device_type, latency=AH_FAKE_LATENCY)
+    appium_url = os.getenv("APPIUM_SERVER_URL", "http://localhost:4723")
+    return webdriver.Remote(appium_url, options=get_appium_options(device_type))
+
+def pick_probe_targets(driver):
+    """
+    Elements on the current screen to run the find/click/send_keys probes against
+
+    Taken from one page source, so every find below hits (a miss can cost an implicit wait).
+    Opens the search screen first when possible, so the search box can take keystrokes.
+    """
+    from src import ah_automation
+    from src.interaction import tap_rect
+    from src.locators import LocalFinder, evaluate_selectors
+    from src.snapshot import element_is_displayed, element_rect, take_snapshot
+
+    finder = LocalFinder(take_snapshot(driver))
+    search_field = evaluate_selectors(finder, ah_automation.SEARCH_FIELD_SELECTORS)
+    if not search_field["hit"]:
+        search_button = evaluate_selectors(finder, ah_automation.SEARCH_BUTTON_SELECTORS)
+        if search_button["hit"]:
+            winner = search_button["winner"]
+            tap_rect(driver, element_rect(finder.find(winner["by"], winner["selector"])[0]))
+            time.sleep(1.5)
+            finder = LocalFinder(take_snapshot(driver))
+            search_field = evaluate_selectors(finder, ah_automation.SEARCH_FIELD_SELECTORS)
+
+    targets = {"search_field": search_field["winner"]}
+    for element in finder.snapshot.iter():
+        # The root nodes are the app itself, which cannot be found like an element
+        if element.tag in ROOT_TAGS or not element_is_displayed(element):
+            continue
+        name = element.get("name") or element.get("content-desc")
+        resource_id = element.get("resource-id")
+        if name and "'" not in name and "accessibility_id" not in targets:
+            targets["accessibility_id"] = name
+            targets["xpath"] = f"//{element.tag}[@{'name' if element.get('name') else 'content-desc'}='{name}']"
+        if (resource_id or element.get("name")) and "id" not in targets:
+            targets["id"] = resource_id or element.get("name")
+        if element.tag in INERT_TAGS and (name or resource_id) and "click" not in targets:
+            targets["click"] = (AppiumBy.ID, resource_id) if resource_id else (AppiumBy.ACCESSIBILITY_ID, name)
+    return targets
+
+def measure_device(driver, samples):
+    """Latency per command type on an open session"""
+    from src.interaction import scroll_by, window_size
+
+    targets = pick_probe_targets(driver)
+    results = {}
+    not_on_screen = summarize_latency([], 0, "no suitable element on screen")
+
+    def resolve(by, selector):
+        try:
+            return driver.find_element(by, selector)
+        except Exception:
+            return None
+
+    for label, key, by in (
+        ("find (accessibility id)", "accessibility_id", AppiumBy.ACCESSIBILITY_ID),
+        ("find (id)", "id", AppiumBy.ID),
+        ("find (xpath)", "xpath", AppiumBy.XPATH),
+    ):
+        selector = targets.get(key)
+        results[label] = measure(lambda: driver.find_element(by, selector), samples) if selector else not_on_screen
+
+    element = targets.get("accessibility_id") and resolve(AppiumBy.ACCESSIBILITY_ID, targets["accessibility_id"])
+    results["get_attribute"] = measure(lambda: element.get_attribute("name"), samples) if element else not_on_screen
+
+    inert = targets.get("click") and resolve(*targets["click"])
+    results["click"] = measure(inert.click, samples) if inert else not_on_screen
+
+    field = targets.get("search_field") and resolve(targets["search_field"]["by"], targets["search_field"]["selector"])
+    if field:
+        results["send_keys"] = measure(lambda: field.send_keys("a"), samples)
+        try:
+            field.clear()
+        except Exception:
+            pass
+    else:
+        results["send_keys"] = not_on_screen
+
+    results["page_source"] = measure(lambda: driver.page_source, samples)
+
+    # The one-swipe scroll scroll_into_view uses; alternate directions so the screen ends
+    # where it started
+    size = window_size(driver)
+    offsets = iter([size["height"] // 5, -(size["height"] // 5)] * samples)
+    results["swipe (W3C actions)"] = measure(lambda: scroll_by(driver, next(offsets)), samples)
+    return results
+
+def bottleneck_hints(report):
+    """Plain-language reading of the latency table"""
+    commands = report["commands"]
+    hints = []
+
+    def p50(name):
+        return commands.get(name, {}).get("p50")
+
+    status = p50("appium GET /status")
+    find_a11y = p50("find (accessibility id)")
+    find_xpath = p50("find (xpath)")
+    page_source = p50("page_source")
+    if status is not None and status > 50:
+        hints.append(f"Appium host is slow: /status alone takes {status} ms (network or an overloaded server)")
+    if status is not None and find_a11y is not None and find_a11y > 5 * max(status, 1):
+        hints.append(f"Device round trips dominate: a find takes {find_a11y} ms vs {status} ms for /status "
+                     "(WebDriverAgent / UiAutomator2 or the USB link)")
+    if find_a11y and find_xpath and find_xpath > 2 * find_a11y:
+        hints.append(f"XPath is {find_xpath / find_a11y:.1f}x slower than accessibility id on this screen; "
+                     "prefer accessibility ids or snapshot lookups")
+    if page_source and find_a11y and page_source > 3 * find_a11y:
+        hints.append(f"page_source costs {page_source} ms ({page_source / find_a11y:.1f} finds); "
+                     "take one snapshot per screen, not per lookup")
+    if not hints:
+        hints.append("No single bottleneck stands out")
+    return hints
+
+def run_latency_probe(args):
+    """Measure backend, Appium and per-command device latency; returns the report"""
+    device_type = args.device_type or input("\nDevice type (ios/android): ").strip().lower() or "ios"
+    report = {"device_type": device_type, "samples": args.samples, "commands": {}}
+    commands = report["commands"]
+
+    # Backend, Appium host and session start are independent: check them at the same time
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        backend = pool.submit(measure_http, f"{args.backend_url.rstrip('/')}/health", args.samples)
+        appium = None if args.fake else pool.submit(measure_http, appium_status_url(), args.samples)
+        session = pool.submit(open_probe_session, device_type, args.fake)
+        commands["backend GET /health"] = backend.result()
+        if appium is not None:
+            commands["appium GET /status"] = appium.result()
+        started = time.perf_counter()
+        try:
+            driver = session.result()
+        except Exception as e:
+            report["session_error"] = str(e)
+            driver = None
+        report["session_start_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    if driver is not None:
+        try:
+            commands.update(measure_device(driver, args.samples))
+        finally:
+            driver.quit()
+    report["hints"] = bottleneck_hints(report)
+    return report
+
+def print_latency_report(report):
+    print("=" * 70)
+    print(f"Command latency ({report['device_type']}, {report['samples']} samples each, ms)")
+    print("=" * 70)
+    print(f"{'Command':<28}{'n':>5}{'p50':>9}{'p95':>9}{'max':>9}{'errors':>8}")
+    for name, summary in report["commands"].items():
+        if summary["count"]:
+            print(f"{name:<28}{summary['count']:>5}{summary['p50']:>9}{summary['p95']:>9}"
+                  f"{summary['max']:>9}{summary['errors']:>8}")
+        else:
+            print(f"{name:<28}{0:>5}{'-':>9}{'-':>9}{'-':>9}{summary['errors']:>8}")
+        if summary.get("note"):
+            print(f"  {summary['note']}")
+    print("-" * 70)
+    if report.get("session_error"):
+        print(f"✗ Could not open a session: {report['session_error']}")
+    for hint in report["hints"]:
+        print(f"• {hint}")
+    print("=" * 70)
+
 def main():
     print("=" * 50)
     print("Albert Heijn Automation - Connection Test")
@@ -139,6 +390,14 @@ def main():
 
 if __name__ == "__main__":
     try:
+        args = parse_args()
+        if args.latency:
+            report = run_latency_probe(args)
+            if args.json:
+                print(json.dumps(report, indent=2))
+            else:
+                print_latency_report(report)
+            sys.exit(0 if "session_error" not in report else 1)
         main()
     except KeyboardInterrupt:
         print("\n\nTest interrupted by user")
@@ -0,0 +1,17 @@
+"""
+Test setup
+Runs the backend against the in-process fake driver with a throwaway cache directory;
+the environment is set before anything from src is imported (config is read at import time)
+"""
+
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault("AH_CACHE_DIR", tempfile.mkdtemp(prefix="ah-tests-"))
+os.environ.setdefault("AH_FAKE_DRIVER", "true")
+os.environ.setdefault("AH_SLEEP_SCALE", "0")
+os.environ.setdefault("AH_WARMUP", "false")
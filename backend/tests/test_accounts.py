@@ -0,0 +1,30 @@
+import asyncio
+
+from src import accounts
+from src.accounts import DeviceAccounts, switch_account
+from src.fake_driver import FakeDriver
+
+
+def test_switch_logs_the_app_into_the_account(monkeypatch):
+    monkeypatch.setattr(accounts, "_credentials", {"sam@example.com": {"password": "secret"}})
+    driver = FakeDriver("ios", latency=0, account="kim@example.com")
+
+    assert asyncio.run(switch_account(driver, "ios", "sam@example.com"))
+    assert driver.account == "sam@example.com"
+    assert driver._screen == "search"
+
+
+def test_switch_without_credentials_leaves_the_app_alone(monkeypatch):
+    monkeypatch.setattr(accounts, "_credentials", {})
+    driver = FakeDriver("ios", latency=0, account="kim@example.com")
+
+    assert not asyncio.run(switch_account(driver, "ios", "sam@example.com"))
+    assert driver.account == "kim@example.com"
+    assert driver.command_count == 0
+
+
+def test_device_accounts_are_shared_through_the_file(tmp_path):
+    path = str(tmp_path / "accounts.json")
+    DeviceAccounts(path).set("iphone", "sam@example.com")
+    assert DeviceAccounts(path).get("iphone") == "sam@example.com"
+    assert DeviceAccounts(path).get("pixel", "kim@example.com") == "kim@example.com"
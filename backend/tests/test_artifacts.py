@@ -0,0 +1,13 @@
+from src.artifacts import ArtifactStore
+
+
+def test_artifact_is_only_found_under_its_own_job(tmp_path):
+    store = ArtifactStore(directory=str(tmp_path))
+    artifact_id = "0123456789abcdef"
+    store._pending = 1
+    store._save(artifact_id, {"id": artifact_id, "job_id": "job-a"}, "<page/>", None)
+
+    assert store.path("job-a", artifact_id) == str(tmp_path / f"{artifact_id}.zip")
+    assert store.path("job-b", artifact_id) is None
+    assert store.path("job-a", "fedcba9876543210") is None
+    assert store.path("job-a", "../job-a") is None
@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+from selenium.common.exceptions import WebDriverException
+
+from src import ah_automation
+from src.fake_driver import FakeDriver
+
+
+def test_driver_errors_while_ranking_reach_the_step(monkeypatch):
+    def broken_snapshot(driver):
+        raise WebDriverException("A session is either terminated or not started")
+
+    monkeypatch.setattr(ah_automation, "take_snapshot", broken_snapshot)
+    with pytest.raises(WebDriverException):
+        asyncio.run(ah_automation.click_first_product(FakeDriver("ios", latency=0), "ios", query="melk"))
+
+
+def test_ranking_problems_fall_back_to_the_selectors(monkeypatch):
+    def unreadable_snapshot(driver):
+        raise ValueError("not well-formed")
+
+    monkeypatch.setattr(ah_automation, "take_snapshot", unreadable_snapshot)
+    driver = FakeDriver("ios", latency=0)
+    assert asyncio.run(ah_automation.search_item(driver, "melk", "ios"))
+    assert asyncio.run(ah_automation.click_first_product(driver, "ios", query="melk"))
+
+
+def test_close_suggestion_opens_the_product_without_the_results_page(monkeypatch):
+    monkeypatch.setattr(ah_automation, "SUGGESTIONS_ENABLED", True)
+    driver = FakeDriver("ios", latency=0)
+    assert asyncio.run(ah_automation.search_item(driver, "melk", "ios"))
+    assert driver._screen == "detail"
+    assert "results" not in driver._history
@@ -0,0 +1,45 @@
+import asyncio
+import json
+
+from src.events import JobEventLog, NdjsonStream
+
+
+def test_reconnecting_subscriber_gets_only_the_missed_events():
+    events = JobEventLog("job-1", buffer_size=10)
+    for step in range(3):
+        events.publish({"status": "progress", "step": step})
+
+    async def resume():
+        received = []
+        async def read():
+            async for event in events.subscribe(since=1):
+                received.append(event["seq"])
+        reader = asyncio.create_task(read())
+        await asyncio.sleep(0)
+        events.publish({"status": "completed"})
+        events.close()
+        await reader
+        return received
+
+    assert asyncio.run(resume()) == [2, 3, 4]
+
+
+def test_evicted_events_show_as_a_gap():
+    events = JobEventLog("job-2", buffer_size=2)
+    for step in range(5):
+        events.publish({"status": "progress", "step": step})
+    events.close()
+    assert [event["seq"] for event in events.replay(since=0)] == [4, 5]
+
+
+def test_ndjson_stream_writes_one_event_per_line():
+    async def stream():
+        body = NdjsonStream()
+        await body.send_json({"status": "adding_item", "message": "Melk"})
+        await body.send_json({"status": "completed"})
+        body.close()
+        return [line async for line in body.lines()]
+
+    lines = asyncio.run(stream())
+    assert [json.loads(line)["status"] for line in lines] == ["adding_item", "completed"]
+    assert all(line.endswith("\n") and line.count("\n") == 1 for line in lines)
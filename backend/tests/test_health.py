@@ -0,0 +1,47 @@
+import asyncio
+
+from src import health
+from src.fake_driver import FakeDriver
+from src.health import HealthMonitor
+from src.scheduler import Device
+
+
+def leased_device(device_id: str, driver: FakeDriver) -> Device:
+    device = Device(device_id, driver.device_type)
+    device.driver = driver
+    device.leased = True
+    return device
+
+
+def test_session_is_recycled_when_the_server_memory_passes_the_threshold(monkeypatch):
+    monkeypatch.setattr(health, "HEALTH_MAX_SERVER_MEMORY_MB", 100)
+    recycled = []
+
+    async def recycle(device):
+        recycled.append(device.id)
+
+    driver = FakeDriver("android", latency=0)
+    device = leased_device("memory-android", driver)
+    monitor = HealthMonitor(None, recycle)
+
+    asyncio.run(monitor.check(device))
+    assert device.health.server_memory_mb < 100
+    assert recycled == []
+
+    driver.command_count = 20_000  # about 40 MB more for the simulated server
+    asyncio.run(monitor.check(device))
+    assert device.health.server_memory_mb >= 100
+    assert device.health.state == "degraded"
+    assert recycled == ["memory-android"]
+
+
+def test_ios_sessions_report_no_server_memory(monkeypatch):
+    monkeypatch.setattr(health, "HEALTH_MAX_SERVER_MEMORY_MB", 100)
+    device = leased_device("memory-ios", FakeDriver("ios", latency=0))
+
+    async def recycle(device):
+        raise AssertionError("healthy session recycled")
+
+    asyncio.run(HealthMonitor(None, recycle).check(device))
+    assert device.health.server_memory_mb is None
+    assert device.health.state == "healthy"
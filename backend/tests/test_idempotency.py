@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+from src.idempotency import IdempotentJobs, idempotency_key
+from src.registry import SqliteRegistry
+from src.scheduler import Job
+
+BASKET = [{"name": "Melk", "quantity": 2}, {"name": "kaas", "quantity": 1}]
+
+
+def test_same_basket_from_the_same_user_has_one_key():
+    reordered = [{"name": " kaas", "quantity": 1}, {"name": "melk", "quantity": 2}]
+    assert idempotency_key(None, "alice", "ios", None, BASKET) == idempotency_key(None, "alice", "ios", None, reordered)
+    assert idempotency_key(None, "alice", "ios", None, BASKET) != idempotency_key(None, "bob", "ios", None, BASKET)
+
+
+def test_anonymous_baskets_are_only_coalesced_by_client_key():
+    assert idempotency_key(None, "anonymous", "ios", None, BASKET) is None
+    assert idempotency_key("k1", "anonymous", "ios", None, BASKET) is not None
+
+
+class WorkerRegistry(SqliteRegistry):
+    """Registry of one simulated worker process"""
+
+    def __init__(self, path: str, owner: str, ttl: float = 30):
+        super().__init__(path, ttl=ttl)
+        self._owner = owner
+
+    @property
+    def owner(self) -> str:
+        return self._owner
+
+
+def test_duplicate_on_another_worker_follows_the_first_job(tmp_path):
+    path = str(tmp_path / "registry.db")
+    first = IdempotentJobs(WorkerRegistry(path, "worker-a"))
+    second = IdempotentJobs(WorkerRegistry(path, "worker-b"))
+    key = idempotency_key(None, "alice", "ios", None, BASKET)
+
+    async def main():
+        job = Job(BASKET, "ios", user_id="alice")
+        duplicate = Job(BASKET, "ios", user_id="alice")
+        return job, await first.claim(key, job), await second.claim(key, duplicate)
+
+    job, claimed, followed = asyncio.run(main())
+    assert claimed is job
+    assert followed == job.id
+
+
+def test_failed_or_expired_jobs_do_not_answer_their_key(tmp_path):
+    path = str(tmp_path / "registry.db")
+    first = WorkerRegistry(path, "worker-a")
+    second = WorkerRegistry(path, "worker-b")
+
+    first.claim_key("failed", "job-1", ttl=60)
+    first.save_job({"job_id": "job-1", "status": "failed", "finished_at": time.time()})
+    assert second.claim_key("failed", "job-2", ttl=60) == "job-2"
+
+    first.claim_key("completed", "job-3", ttl=60)
+    first.save_job({"job_id": "job-3", "status": "completed", "finished_at": time.time() - 120})
+    assert second.claim_key("completed", "job-4", ttl=60) == "job-4"
+
+
+def test_key_of_a_dead_worker_is_claimed_anew(tmp_path):
+    path = str(tmp_path / "registry.db")
+    dead = WorkerRegistry(path, "worker-a", ttl=0.1)
+    alive = WorkerRegistry(path, "worker-b", ttl=0.1)
+
+    dead.claim_key("basket", "job-1", ttl=60)
+    dead.save_job({"job_id": "job-1", "status": "running", "finished_at": None})
+    assert alive.claim_key("basket", "job-2", ttl=60) == "job-1"
+    time.sleep(0.2)
+    assert alive.claim_key("basket", "job-2", ttl=60) == "job-2"
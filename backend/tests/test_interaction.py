@@ -0,0 +1,21 @@
+from src.fake_driver import FakeDriver
+from src.interaction import forget_window_size, tap_element, visible_part
+
+
+def test_visible_element_is_tapped_without_scrolling():
+    driver = FakeDriver("ios", latency=0)
+    tab = driver.find_element("accessibility id", "Zoek")
+    driver.command_count = 0
+    tap_element(driver, tab)
+    tap_element(driver, tab)
+    assert driver.swipes == 0
+    # window size once per session, then rect and tap per element
+    assert driver.command_count == 1 + 2 * 2
+    forget_window_size(driver)
+
+
+def test_only_the_on_screen_part_of_a_rect_counts():
+    size = {"width": 390, "height": 844}
+    assert visible_part({"x": 0, "y": 800, "width": 390, "height": 100}, size) == \
+        {"x": 0, "y": 800, "width": 390, "height": 44}
+    assert visible_part({"x": 0, "y": 900, "width": 390, "height": 100}, size) is None
@@ -0,0 +1,48 @@
+import asyncio
+
+from src.fake_driver import FakeDriver
+from src.interrupts import dismiss_interrupts, find_interrupt
+from src.snapshot import Snapshot
+
+
+def ios_screen(content: str) -> Snapshot:
+    return Snapshot('<AppiumAUT><XCUIElementTypeApplication type="XCUIElementTypeApplication" name="AH" '
+                    f'visible="true" x="0" y="0" width="390" height="844">{content}'
+                    '</XCUIElementTypeApplication></AppiumAUT>')
+
+
+def button(label: str, y: int = 600) -> str:
+    return (f'<XCUIElementTypeButton type="XCUIElementTypeButton" name="{label}" label="{label}" '
+            f'visible="true" x="16" y="{y}" width="358" height="44"/>')
+
+
+def test_page_buttons_are_not_taken_for_a_promo_or_login_nag():
+    # A product page with its own "Sluiten" and a profile row offering "Inloggen"
+    page = ios_screen(button("Sluiten", 60) + button("Inloggen", 640))
+    assert find_interrupt(page) == (None, None)
+
+
+def test_promo_close_button_counts_inside_a_modal_container():
+    sheet = ios_screen('<XCUIElementTypeOther type="XCUIElementTypeOther" name="promo_sheet" '
+                       'visible="true" x="0" y="0" width="390" height="844">'
+                       + button("Sluiten") + '</XCUIElementTypeOther>')
+    handler, rect = find_interrupt(sheet)
+    assert handler.name == "promo"
+    assert rect["y"] == 600
+
+    android_dialog = Snapshot(
+        '<hierarchy><android.widget.FrameLayout class="android.widget.FrameLayout" '
+        'resource-id="nl.ah.app:id/design_bottom_sheet" displayed="true" bounds="[0,1200][1080,2340]">'
+        '<android.widget.Button class="android.widget.Button" text="Later" displayed="true" '
+        'bounds="[40,2100][1040,2220]"/><android.widget.TextView class="android.widget.TextView" '
+        'text="Inloggen voor je bonus" displayed="true" bounds="[40,1300][1040,1400]"/>'
+        '</android.widget.FrameLayout></hierarchy>')
+    handler, _ = find_interrupt(android_dialog)
+    assert handler.name == "login_nag"
+
+
+def test_fake_promo_is_dismissed():
+    driver = FakeDriver("ios", latency=0)
+    driver.show_popup()
+    assert asyncio.run(dismiss_interrupts(driver))
+    assert not driver._popup
@@ -0,0 +1,30 @@
+import asyncio
+
+import find_selectors_guide
+from src.fake_driver import FakeDriver
+from src.locators import LocalFinder, evaluate_selectors
+from src.snapshot import Snapshot
+
+
+def test_xpath_positions_and_predicates_match_the_driver():
+    finder = LocalFinder(Snapshot(
+        '<AppiumAUT><XCUIElementTypeCollectionView type="XCUIElementTypeCollectionView" name="results">'
+        '<XCUIElementTypeCell type="XCUIElementTypeCell" name="a" visible="false"/>'
+        '<XCUIElementTypeCell type="XCUIElementTypeCell" name="b" visible="true"/>'
+        '</XCUIElementTypeCollectionView></AppiumAUT>'))
+    assert [e.get("name") for e in finder.find("xpath", "//XCUIElementTypeCell[2]")] == ["b"]
+    assert [e.get("name") for e in finder.find("xpath", "//*[@name='results']/XCUIElementTypeCell")] == ["a", "b"]
+
+    result = evaluate_selectors(finder, [("accessibility id", "a"), ("accessibility id", "b")])
+    assert result["winner"]["index"] == 1
+    assert [candidate["hit"] for candidate in result["candidates"]] == [False, True]
+
+
+def test_batch_walk_validates_every_selector_list_on_the_fake_app():
+    driver = FakeDriver("ios", latency=0)
+    screens = asyncio.run(find_selectors_guide.capture_screens(driver, "ios", "melk", True, 0))
+    assert {"home", "search", "results", "detail"} <= set(screens)
+
+    report = find_selectors_guide.build_batch_report("ios", screens, 0.0)
+    assert report["ok"], [entry for entry in report["lists"] if entry["required"] and entry["status"] != "hit"]
+    assert driver.command_count < 30
@@ -0,0 +1,47 @@
+import logging
+import threading
+
+from src.logs import JobLevelLogger, job_log_level
+
+
+def test_debug_job_does_not_build_records_for_other_jobs():
+    logger = JobLevelLogger("src.test_logs")
+    logger.setLevel(logging.INFO)
+    built = []
+    logger.makeRecord = lambda *args, **kwargs: built.append(args[4]) or logging.LogRecord(*args[:7])
+    logger.propagate = False
+    enabled_elsewhere = []
+
+    def other_job():
+        enabled_elsewhere.append(logger.isEnabledFor(logging.DEBUG))
+        logger.debug("other job")
+
+    with job_log_level("debug"):
+        assert logger.isEnabledFor(logging.DEBUG)
+        logger.debug("debug job")
+        thread = threading.Thread(target=other_job)
+        thread.start()
+        thread.join()
+    logger.debug("after the job")
+
+    assert enabled_elsewhere == [False]
+    assert built == ["debug job"]
+
+
+def test_job_level_can_be_quieter_than_the_default():
+    logger = JobLevelLogger("src.test_logs_quiet")
+    logger.setLevel(logging.INFO)
+    with job_log_level("warning"):
+        assert not logger.isEnabledFor(logging.INFO)
+    assert logger.isEnabledFor(logging.INFO)
+
+
+def test_package_loggers_follow_job_levels_and_others_do_not():
+    package_logger = logging.getLogger("src.test_logs_package")
+    other_logger = logging.getLogger("thirdparty.test_logs")
+    package_logger.setLevel(logging.INFO)
+    other_logger.setLevel(logging.INFO)
+    assert isinstance(package_logger, JobLevelLogger)
+    with job_log_level("debug"):
+        assert package_logger.isEnabledFor(logging.DEBUG)
+        assert not other_logger.isEnabledFor(logging.DEBUG)
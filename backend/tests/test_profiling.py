@@ -0,0 +1,24 @@
+import sys
+import time
+
+from src.profiling import JobProfile, profile_block
+
+
+def test_sleeping_is_not_counted_as_cpu():
+    profile = JobProfile("sleeping-job", 0.002)
+    with profile_block(sys._getframe(), profile):
+        time.sleep(0.3)
+    summary = profile.to_dict()
+    assert summary["samples"] > 10
+    assert summary["blocked_seconds"] > summary["cpu_seconds"]
+    assert summary["driver_io_seconds"] == 0
+
+
+def test_busy_loop_is_counted_as_cpu():
+    profile = JobProfile("busy-job", 0.002)
+    with profile_block(sys._getframe(), profile):
+        ends = time.perf_counter() + 0.3
+        while time.perf_counter() < ends:
+            pass
+    summary = profile.to_dict()
+    assert summary["cpu_seconds"] > summary["blocked_seconds"]
@@ -0,0 +1,31 @@
+from src import ranking
+from src.ranking import ResultCandidate, choose_result, preference_store
+
+
+def candidates(*titles):
+    rect = {"x": 0, "y": 0, "width": 10, "height": 10}
+    return [ResultCandidate(index, title, "", "", rect, False) for index, title in enumerate(titles)]
+
+
+def test_fallback_pick_is_not_chosen_on_match(monkeypatch):
+    monkeypatch.setattr(ranking, "extract_results", lambda snapshot: candidates("Wasmiddel", "Tandpasta"))
+    best = choose_result(None, "halfvolle melk", "fallback-user")
+    assert best.title == "Wasmiddel"
+    assert not best.chosen_on_match
+
+
+def test_boost_alone_does_not_make_a_pick_chosen_on_match(monkeypatch):
+    monkeypatch.setattr(ranking, "extract_results", lambda snapshot: candidates("Wasmiddel", "Tandpasta"))
+    for _ in range(10):
+        preference_store.record("boosted-user", "halfvolle melk", "Tandpasta")
+    best = choose_result(None, "halfvolle melk", "boosted-user")
+    assert best.title == "Tandpasta"
+    assert not best.chosen_on_match
+
+
+def test_matching_pick_is_chosen_on_match(monkeypatch):
+    monkeypatch.setattr(ranking, "extract_results",
+                        lambda snapshot: candidates("Wasmiddel", "AH Halfvolle melk"))
+    best = choose_result(None, "halfvolle melk", "matching-user")
+    assert best.title == "AH Halfvolle melk"
+    assert best.chosen_on_match
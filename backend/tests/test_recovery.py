@@ -0,0 +1,43 @@
+import asyncio
+
+from src.ah_automation import click_first_product, recover_to_search, search_item
+from src.fake_driver import FakeDriver
+from src.recovery import is_search_screen
+from src.snapshot import Snapshot
+
+
+def android_screen(field: str) -> Snapshot:
+    return Snapshot(f'<hierarchy><android.widget.FrameLayout bounds="[0,0][1080,2340]">{field}'
+                    '</android.widget.FrameLayout></hierarchy>')
+
+
+def test_login_field_is_not_the_search_box():
+    login = android_screen('<android.widget.EditText class="android.widget.EditText" '
+                           'resource-id="nl.ah.app:id/email" text="E-mailadres" displayed="true" '
+                           'bounds="[40,400][1040,520]"/>')
+    assert not is_search_screen(login)
+
+
+def test_search_box_is_found_by_id_or_hint():
+    by_id = android_screen('<android.widget.EditText class="android.widget.EditText" '
+                           'resource-id="nl.ah.app:id/search_input" displayed="true" bounds="[40,100][1040,220]"/>')
+    by_hint = android_screen('<android.widget.EditText class="android.widget.EditText" hint="Zoek producten" '
+                             'displayed="true" bounds="[40,100][1040,220]"/>')
+    assert is_search_screen(by_id)
+    assert is_search_screen(by_hint)
+
+
+def test_ios_search_field_needs_no_id():
+    snapshot = Snapshot('<AppiumAUT><XCUIElementTypeSearchField type="XCUIElementTypeSearchField" '
+                        'visible="true" x="16" y="100" width="358" height="36"/></AppiumAUT>')
+    assert is_search_screen(snapshot)
+
+
+def test_recovery_closes_a_promo_and_returns_to_search():
+    driver = FakeDriver("ios", latency=0)
+    assert asyncio.run(search_item(driver, "melk", "ios"))
+    assert asyncio.run(click_first_product(driver, "ios", query="melk"))
+    driver.show_popup()
+
+    assert asyncio.run(recover_to_search(driver, "ios"))
+    assert driver._screen == "search" and not driver._popup
@@ -0,0 +1,39 @@
+import asyncio
+
+from src import ah_automation, replay
+from src.fake_driver import FakeDriver
+from src.replay import ReplayStore, commit_recording, discard_recording
+
+
+def open_first_result(driver, query):
+    assert asyncio.run(ah_automation.search_item(driver, query, "ios"))
+    assert asyncio.run(ah_automation.click_first_product(driver, "ios", query=query))
+
+
+def test_first_result_cell_is_replayed_on_a_known_results_screen(tmp_path, monkeypatch):
+    monkeypatch.setattr(replay, "replay_store", ReplayStore(str(tmp_path / "replay.json")))
+    monkeypatch.setattr(ah_automation, "RANKING_ENABLED", False)
+
+    recording = FakeDriver("ios", latency=0)
+    open_first_result(recording, "melk")
+    commit_recording(recording)
+    assert replay.replay_store.has_step(replay.device_profile(recording), "result_cell")
+
+    replaying = FakeDriver("ios", latency=0)
+    open_first_result(replaying, "kaas")
+    assert "result_cell" in [step for _, step, _ in replay._replayed[replaying.session_id]]
+    assert replaying._screen == "detail"
+
+
+def test_failed_item_invalidates_the_replayed_result_cell(tmp_path, monkeypatch):
+    monkeypatch.setattr(replay, "replay_store", ReplayStore(str(tmp_path / "replay.json")))
+    monkeypatch.setattr(ah_automation, "RANKING_ENABLED", False)
+
+    recording = FakeDriver("ios", latency=0)
+    open_first_result(recording, "melk")
+    commit_recording(recording)
+
+    replaying = FakeDriver("ios", latency=0)
+    open_first_result(replaying, "kaas")
+    discard_recording(replaying)
+    assert not replay.replay_store.has_step(replay.device_profile(replaying), "result_cell")
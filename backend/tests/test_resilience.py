@@ -0,0 +1,42 @@
+import asyncio
+
+from selenium.common.exceptions import TimeoutException
+
+from src.resilience import CircuitBreaker, run_step
+
+
+def test_breaker_opens_probes_and_closes_again():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.05)
+    assert not breaker.record_failure("session gone")
+    assert breaker.record_failure("session gone")
+    assert breaker.state == "open" and not breaker.available
+
+    asyncio.run(asyncio.sleep(0.06))
+    assert breaker.state == "half_open" and breaker.available
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_failed_probe_reopens_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    breaker.record_failure()
+    asyncio.run(asyncio.sleep(0.06))
+    assert breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_transient_errors_are_retried_and_misses_run_on_miss():
+    calls = []
+
+    async def flaky():
+        calls.append("step")
+        if len(calls) == 1:
+            raise TimeoutException("slow device")
+        return len(calls) > 2
+
+    async def dismissed():
+        calls.append("on_miss")
+        return True
+
+    assert asyncio.run(run_step("flaky", flaky, retries=1, on_miss=dismissed))
+    assert calls == ["step", "step", "on_miss", "step"]
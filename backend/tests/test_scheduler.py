@@ -0,0 +1,241 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from selenium.common.exceptions import WebDriverException
+
+from src.config import SLICE_MAX_ATTEMPTS
+from src.context import current_job_id
+from src.registry import Registry, SqliteRegistry
+from src.scheduler import Device, Job, JobFailed, Scheduler
+
+
+def test_device_run_uses_the_device_thread_and_caller_context():
+    device = Device("scheduler-test", "ios")
+
+    async def work():
+        time.sleep(0.01)  # a blocking driver command
+        return threading.current_thread().name, current_job_id.get()
+
+    async def main():
+        current_job_id.set("job-1")
+        return await device.run(work)
+
+    assert asyncio.run(main()) == ("device-scheduler-test", "job-1")
+
+
+def test_devices_run_blocking_work_in_parallel():
+    devices = [Device(f"parallel-{idx}", "ios") for idx in range(4)]
+
+    async def work():
+        time.sleep(0.2)
+
+    async def main():
+        started = time.perf_counter()
+        await asyncio.gather(*(device.run(work) for device in devices))
+        return time.perf_counter() - started
+
+    assert asyncio.run(main()) < 0.6
+
+
+class NamedRegistry(SqliteRegistry):
+    """Registry of one simulated worker process"""
+
+    def __init__(self, path: str, owner: str, ttl: float):
+        super().__init__(path, ttl=ttl)
+        self._owner = owner
+
+    @property
+    def owner(self) -> str:
+        return self._owner
+
+
+def test_registry_is_abstract():
+    with pytest.raises(TypeError):
+        Registry()
+
+
+def test_slice_is_not_run_on_a_lease_taken_over_by_another_worker(tmp_path):
+    path = str(tmp_path / "registry.db")
+    ours = NamedRegistry(path, "worker-a", ttl=0.2)
+    theirs = NamedRegistry(path, "worker-b", ttl=60)
+    runs = []
+
+    async def runner(device, job, products):
+        runs.append(device.id)
+        return len(products), []
+
+    async def main():
+        device = Device("leased-device", "ios")
+        scheduler = Scheduler([device], runner, registry=ours)
+        assert await scheduler.acquire_lease(device)
+        # Our lease expires (e.g. renewals stalled) and the other worker takes the device
+        time.sleep(0.3)
+        assert theirs.acquire(device.id)
+        job = Job([{"name": "melk", "quantity": 1}], "ios")
+        await scheduler.submit(job)
+        await asyncio.sleep(0.2)
+        return scheduler, device, job
+
+    scheduler, device, job = asyncio.run(main())
+    assert runs == []
+    assert not device.leased
+    assert job in scheduler._queue
+
+
+def run_job(runner, products):
+    """Run one job to the end on a fresh single-device scheduler"""
+    async def main():
+        device = Device("breaker-device", "ios")
+        scheduler = Scheduler([device], runner)
+        job = Job(products, "ios")
+        await scheduler.submit(job)
+        try:
+            return device, job, await job.wait()
+        except JobFailed as e:
+            return device, job, e
+
+    return asyncio.run(main())
+
+
+def test_products_that_cannot_be_found_leave_the_breaker_alone():
+    async def runner(device, job, products):
+        return 0, [product["name"] for product in products]
+
+    device, job, result = run_job(runner, [{"name": "onvindbaar", "quantity": 1}])
+    assert job.status == "completed"
+    assert result["failed_items"] == ["onvindbaar"]
+    assert device.breaker.failures == 0
+
+
+def test_job_fails_when_no_slice_could_run():
+    async def runner(device, job, products):
+        raise WebDriverException("A session is either terminated or not started")
+
+    device, job, result = run_job(runner, [{"name": "melk", "quantity": 1}])
+    assert isinstance(result, JobFailed)
+    assert job.status == "failed"
+    assert "not started" in job.error
+    assert device.breaker.failures == SLICE_MAX_ATTEMPTS
+
+
+def test_dead_session_trips_the_breaker_and_is_dropped():
+    from src.ah_automation import add_multiple_products
+    from src.fake_driver import FakeDriver
+
+    sessions = []
+
+    async def runner(device, job, products):
+        if device.driver is None:
+            # Every session opened on this device is dead on arrival
+            device.driver = FakeDriver("ios", latency=0)
+            device.driver._closed = True
+            sessions.append(device.driver)
+        return await add_multiple_products(device.driver, products, "ios")
+
+    device, job, result = run_job(runner, [{"name": "melk", "quantity": 1}, {"name": "kaas", "quantity": 1}])
+    assert isinstance(result, JobFailed)
+    assert "Driver commands failing" in job.error
+    assert device.breaker.state == "open"
+    assert device.driver is None
+    assert len(sessions) == SLICE_MAX_ATTEMPTS
+
+
+def test_session_lost_midway_keeps_the_items_already_added():
+    from src.ah_automation import add_multiple_products
+    from src.fake_driver import FakeDriver
+
+    drivers = []
+
+    async def runner(device, job, products):
+        if device.driver is None:
+            device.driver = FakeDriver("ios", latency=0)
+            drivers.append(device.driver)
+        driver = device.driver
+        if len(drivers) == 1:
+            # The first session dies once its first item is in the basket
+            original = driver.find_element
+
+            def find_element(*args, **kwargs):
+                if driver.basket:
+                    driver._closed = True
+                return original(*args, **kwargs)
+
+            driver.find_element = find_element
+        return await add_multiple_products(driver, products, "ios")
+
+    products = [{"name": "melk", "quantity": 1}, {"name": "kaas", "quantity": 1}]
+    device, job, result = run_job(runner, products)
+    assert job.status == "completed"
+    assert result["products_added"] == 2
+    assert len(drivers) == 2
+    assert sum(drivers[0].basket.values()) == 1
+    assert sum(drivers[1].basket.values()) == 1
+    assert device.breaker.failures == 0
+
+
+def test_dropping_a_session_forgets_its_per_session_state():
+    from src import ah_automation, interaction, ranking, replay
+
+    class Driver:
+        session_id = "closing-session"
+
+        def quit(self):
+            pass
+
+    driver = Driver()
+    replay._profiles[driver.session_id] = "model|1x1|1"
+    replay._pending[driver.session_id] = []
+    replay._replayed[driver.session_id] = []
+    ranking._pending_choice[driver.session_id] = ("anonymous", "melk", "Melk")
+    interaction._window_sizes[driver.session_id] = {"width": 1, "height": 1}
+    ah_automation._opened_from_suggestion.add(driver.session_id)
+
+    async def main():
+        device = Device("closing-device", "ios")
+        device.driver = driver
+        await Scheduler([device], None).drop_session(device)
+        return device
+
+    assert asyncio.run(main()).driver is None
+    for state in (replay._profiles, replay._pending, replay._replayed, ranking._pending_choice,
+                  interaction._window_sizes, ah_automation._opened_from_suggestion):
+        assert driver.session_id not in state
+
+
+def test_hung_session_close_does_not_block_the_loop(monkeypatch):
+    from src import scheduler as scheduler_module
+
+    monkeypatch.setattr(scheduler_module, "APPIUM_QUIT_TIMEOUT", 0.2)
+    release = threading.Event()
+
+    class HungDriver:
+        session_id = "hung-session"
+
+        def quit(self):
+            release.wait(5)
+
+    async def main():
+        device = Device("hung-device", "ios")
+        device.driver = HungDriver()
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.create_task(tick())
+        started = time.monotonic()
+        await Scheduler([device], None).drop_session(device)
+        elapsed = time.monotonic() - started
+        ticker.cancel()
+        release.set()
+        return device, elapsed, ticks
+
+    device, elapsed, ticks = asyncio.run(main())
+    assert device.driver is None
+    assert elapsed < 1
+    assert ticks > 5
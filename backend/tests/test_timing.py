@@ -0,0 +1,36 @@
+import json
+
+from src.config import SCHEDULER_DEFAULT_ITEM_SECONDS
+from src.timing import ItemTiming, TimingModel
+
+
+def item(steps, paths):
+    timing = ItemTiming()
+    timing.steps = dict(steps)
+    timing.paths = dict(paths)
+    return timing
+
+
+def test_step_paths_are_weighted_by_how_often_they_are_taken(tmp_path):
+    model = TimingModel(str(tmp_path / "timings.json"), alpha=0.5)
+    for _ in range(20):
+        model.record_item("phone", "ios", 1, 10.0, item({"search": 2.0, "select": 2.0, "add": 4.0}, {"add": "lookup"}),
+                          query="melk")
+        model.record_item("phone", "ios", 1, 7.0, item({"search": 2.0, "select": 2.0, "add": 1.0}, {"add": "replay"}),
+                          query="melk")
+    # Alternating paths: the last one taken (replay) weighs a bit more than the lookup
+    assert 7.0 < model.item_seconds("ios", device_id="phone") < 8.5
+
+
+def test_model_of_another_format_is_discarded(tmp_path):
+    path = tmp_path / "timings.json"
+    path.write_text(json.dumps({"ios": 5.0}))
+    assert TimingModel(str(path)).item_seconds("ios") == SCHEDULER_DEFAULT_ITEM_SECONDS
+
+
+def test_model_survives_a_save(tmp_path):
+    path = str(tmp_path / "timings.json")
+    model = TimingModel(path)
+    model.record_item("phone", "ios", 1, 12.0)
+    model.save(force=True)
+    assert TimingModel(path).item_seconds("ios", device_id="phone") == 12.0
@@ -0,0 +1,40 @@
+import pytest
+
+from src.tracing import Trace, TraceStore, span, trace_scope
+
+
+def test_spans_become_chrome_events_with_their_outcome():
+    trace = Trace("job-1")
+    with trace_scope(trace):
+        with span("search", "step", query="melk"):
+            pass
+        with pytest.raises(ValueError):
+            with span("select", "step"):
+                raise ValueError("no results")
+
+    chrome = trace.to_chrome()
+    events = {event["name"]: event for event in chrome["traceEvents"] if event["ph"] == "X"}
+    assert events["search"]["args"] == {"query": "melk", "outcome": "ok"}
+    assert events["select"]["args"]["outcome"] == "ValueError"
+    assert events["search"]["dur"] >= 0 and events["search"]["tid"] == events["select"]["tid"]
+
+
+def test_spans_outside_a_trace_and_past_the_cap_are_not_kept():
+    with span("idle", "step") as outside:
+        outside.set(outcome="ignored")
+
+    trace = Trace("job-2", max_spans=1)
+    with trace_scope(trace):
+        for name in ("first", "second"):
+            with span(name, "step"):
+                pass
+    assert [recorded.name for recorded in trace.spans] == ["first"]
+    assert trace.to_chrome()["otherData"]["dropped_spans"] == 1
+
+
+def test_store_keeps_the_most_recent_jobs():
+    store = TraceStore(max_jobs=2)
+    for job_id in ("a", "b", "c"):
+        store.start(job_id)
+    assert store.get("a") is None
+    assert store.get("c").job_id == "c"
@@ -0,0 +1,25 @@
+from src.traffic import TrafficRecorder, load_trace
+
+
+def test_recorded_trace_is_anonymized_and_replayable(tmp_path):
+    path = str(tmp_path / "traffic.jsonl")
+    recorder = TrafficRecorder(path, enabled=True, salt="test")
+    recorder.record(20.0, "alice@example.com", "ios", 1, [{"name": "  Halfvolle   MELK ", "quantity": 2}])
+    recorder.record(10.0, "bob", "android", 0, [{"name": "Kaas"}])
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("not json\n")
+
+    trace = load_trace(path)
+    assert [entry["t"] for entry in trace] == [10.0, 20.0]
+    assert trace[1]["products"] == [{"name": "halfvolle melk", "quantity": 2}]
+    assert trace[1]["user"] == recorder.anonymize_user("alice@example.com")
+    assert "alice" not in open(path, encoding="utf-8").read()
+
+
+def test_trace_is_rotated_past_its_size(tmp_path):
+    path = str(tmp_path / "traffic.jsonl")
+    recorder = TrafficRecorder(path, enabled=True, max_bytes=1, salt="test")
+    recorder.record(1.0, "alice", "ios", 0, [{"name": "melk"}])
+    recorder.record(2.0, "alice", "ios", 0, [{"name": "kaas"}])
+    assert [entry["t"] for entry in load_trace(path)] == [2.0]
+    assert [entry["t"] for entry in load_trace(f"{path}.1")] == [1.0]
@@ -0,0 +1,58 @@
+import json
+
+from selenium.webdriver.remote.remote_connection import RemoteConnection
+
+from src.context import current_device_id
+from src.health import health_for
+from src.metrics import metrics
+from src.transport import (
+    PooledAppiumConnection,
+    close_all_executors,
+    get_command_executor,
+    response_error,
+    transport_stats,
+)
+
+
+def error_response(status: int, error: str) -> dict:
+    """What RemoteConnection.execute returns (without raising) for a W3C error"""
+    return {"status": status, "value": json.dumps({"value": {"error": error, "message": error}})}
+
+
+def test_response_error_classifies_w3c_errors():
+    assert response_error({"value": None}) is None
+    assert response_error({"status": 0, "value": {"width": 1}}) is None
+    assert response_error(error_response(404, "invalid session id")) == "invalid session id"
+    assert response_error(error_response(404, "no such element")) == "no such element"
+    assert response_error({"status": 500, "value": "<html>"}) == "http 500"
+    assert response_error({"status": 13, "value": {"message": "boom"}}) == "status 13"
+
+
+def test_error_responses_count_against_device_health(monkeypatch):
+    responses = iter([
+        {"value": {"width": 390, "height": 844}},
+        error_response(404, "invalid session id"),
+        error_response(404, "no such element"),
+    ])
+    monkeypatch.setattr(RemoteConnection, "execute", lambda self, command, params: next(responses))
+    connection = PooledAppiumConnection("http://127.0.0.1:4723")
+    token = current_device_id.set("transport-test")
+    errors_before = metrics.snapshot()["counters"].get("appium.errors.getWindowRect", 0)
+    try:
+        for _ in range(3):
+            connection.execute("getWindowRect", {})
+    finally:
+        current_device_id.reset(token)
+
+    assert list(health_for("transport-test")._commands) == [True, False, True]
+    assert metrics.snapshot()["counters"]["appium.errors.getWindowRect"] - errors_before == 2
+
+
+def test_shutdown_closes_every_pool():
+    executor = get_command_executor("http://127.0.0.1:4799")
+    closed = []
+    executor.shutdown = lambda: closed.append(executor)
+    close_all_executors()
+    assert closed == [executor]
+    assert transport_stats() == []
+    assert get_command_executor("http://127.0.0.1:4799") is not executor
@@ -0,0 +1,18 @@
+import asyncio
+
+from src import main
+
+
+def test_warm_up_opens_every_session_on_the_search_screen():
+    async def warm():
+        try:
+            await main.warm_up()
+            return {device_id: dict(entry) for device_id, entry in main.warmup.devices.items()}
+        finally:
+            for device in main.scheduler.devices.values():
+                await main.scheduler.drop_session(device)
+            await main.scheduler.release_all()
+
+    devices = asyncio.run(warm())
+    assert main.warmup.state == "ready"
+    assert devices and all(entry["warm"] and entry["search_screen"] for entry in devices.values())
@@ -10,6 +10,14 @@ interface UseAutomationReturn {
   isRunning: boolean;
 }
 
+// Resuming the event stream of a running job after the WebSocket drops
+const MAX_RECONNECT_ATTEMPTS = 5;
+const RECONNECT_DELAY_MS = 1000;
+
+// One key per started basket, so the HTTP fallback joins the WebSocket's job instead of starting another
+const newIdempotencyKey = (): string =>
+  `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+
 export function useAutomation(apiBaseUrl: string): UseAutomationReturn {
   const [status, setStatus] = useState<AutomationStatus['status']>('idle');
   const [message, setMessage] = useState('');
@@ -21,66 +29,109 @@ export function useAutomation(apiBaseUrl: string): UseAutomationReturn {
     setStatus('connecting');
     setMessage('Connecting to automation service...');
     setProgress(0);
+    const idempotencyKey = newIdempotencyKey();
 
     try {
       // Use WebSocket for real-time updates
-      const wsUrl = apiBaseUrl.replace('http', 'ws') + '/ws/automate';
-      const ws = new WebSocket(wsUrl);
-
-      ws.onopen = () => {
-        console.log('WebSocket connected');
-        ws.send(JSON.stringify({
-          products,
-          device_type: deviceType,
-        }));
-      };
-
-      ws.onmessage = (event) => {
-        try {
-          const data: AutomationStatus = JSON.parse(event.data);
-          setStatus(data.status);
-          setMessage(data.message);
-          setProgress(data.progress);
-
-          if (data.status === 'completed') {
-            Alert.alert('Success', data.message);
-            setIsRunning(false);
-            ws.close();
-          } else if (data.status === 'error') {
-            Alert.alert('Error', data.message);
-            setIsRunning(false);
-            ws.close();
+      const wsBaseUrl = apiBaseUrl.replace('http', 'ws');
+      // Job id and last event sequence number, to resume the event stream if the connection drops
+      let jobId: string | null = null;
+      let lastSeq = 0;
+      let finished = false;
+      let reconnectAttempts = 0;
+
+      const connect = (url: string, request?: object): WebSocket => {
+        const socket = new WebSocket(url);
+
+        socket.onopen = () => {
+          console.log('WebSocket connected');
+          reconnectAttempts = 0;
+          if (request) {
+            socket.send(JSON.stringify(request));
           }
-        } catch (error) {
-          console.error('Error parsing WebSocket message:', error);
-        }
-      };
-
-      ws.onerror = (error) => {
-        console.error('WebSocket error:', error);
-        Alert.alert('Connection Error', 'Failed to connect to automation service. Make sure the backend is running on your MacBook.');
-        setIsRunning(false);
-        setStatus('error');
-        setMessage('Connection failed');
-      };
+        };
+
+        socket.onmessage = (event) => {
+          try {
+            const data: AutomationStatus & { job_id?: string; seq?: number } = JSON.parse(event.data);
+            if (data.job_id) {
+              jobId = data.job_id;
+            }
+            if (data.seq) {
+              if (data.seq <= lastSeq) {
+                return;
+              }
+              lastSeq = data.seq;
+            }
+            setStatus(data.status);
+            setMessage(data.message);
+            // The final result event carries no progress
+            if (typeof data.progress === 'number') {
+              setProgress(data.progress);
+            }
+
+            if (data.status === 'completed') {
+              finished = true;
+              Alert.alert('Success', data.message);
+              setIsRunning(false);
+              socket.close();
+            } else if (data.status === 'error') {
+              finished = true;
+              Alert.alert('Error', data.message);
+              setIsRunning(false);
+              socket.close();
+            }
+          } catch (error) {
+            console.error('Error parsing WebSocket message:', error);
+          }
+        };
 
-      ws.onclose = () => {
-        console.log('WebSocket closed');
-        // Check current status instead of captured status
-        setStatus((currentStatus) => {
-          if (currentStatus !== 'completed' && currentStatus !== 'error') {
-            setIsRunning(false);
-            return 'idle';
+        socket.onerror = (error) => {
+          console.error('WebSocket error:', error);
+          if (jobId) {
+            // The job keeps running on the server; onclose resumes the stream
+            return;
           }
-          return currentStatus;
-        });
+          Alert.alert('Connection Error', 'Failed to connect to automation service. Make sure the backend is running on your MacBook.');
+          setIsRunning(false);
+          setStatus('error');
+          setMessage('Connection failed');
+        };
+
+        socket.onclose = () => {
+          console.log('WebSocket closed');
+          if (!finished && jobId && reconnectAttempts < MAX_RECONNECT_ATTEMPTS) {
+            reconnectAttempts += 1;
+            setMessage('Connection lost, reconnecting...');
+            setTimeout(() => {
+              connect(`${wsBaseUrl}/ws/jobs/${jobId}?since=${lastSeq}`);
+            }, RECONNECT_DELAY_MS * reconnectAttempts);
+            return;
+          }
+          // Check current status instead of captured status
+          setStatus((currentStatus) => {
+            if (currentStatus !== 'completed' && currentStatus !== 'error') {
+              setIsRunning(false);
+              return 'idle';
+            }
+            return currentStatus;
+          });
+        };
+
+        return socket;
       };
 
+      const ws = connect(wsBaseUrl + '/ws/automate', {
+        products,
+        device_type: deviceType,
+        idempotency_key: idempotencyKey,
+      });
+
       // Fallback: Use HTTP if WebSocket fails
       setTimeout(() => {
-        if (ws.readyState !== WebSocket.OPEN) {
+        if (ws.readyState !== WebSocket.OPEN && !jobId) {
           console.log('WebSocket not ready, trying HTTP fallback');
-          startAutomationHTTP(products, deviceType);
+          startAutomationHTTP(products, deviceType, idempotencyKey);
         }
       }, 3000);
 
@@ -93,7 +144,7 @@ export function useAutomation(apiBaseUrl: string): UseAutomationReturn {
     }
   }, [apiBaseUrl]);
 
-  const startAutomationHTTP = async (products: Product[], deviceType: 'ios' | 'android') => {
+  const startAutomationHTTP = async (products: Product[], deviceType: 'ios' | 'android', idempotencyKey: string) => {
     try {
       const response = await fetch(`${apiBaseUrl}/automate`, {
         method: 'POST',
@@ -103,6 +154,7 @@ export function useAutomation(apiBaseUrl: string): UseAutomationReturn {
         body: JSON.stringify({
           products,
           device_type: deviceType,
+          idempotency_key: idempotencyKey,
         }),
       });
 
@@ -13,5 +13,6 @@ export interface AutomationStatus {
 export interface AutomationRequest {
   products: Product[];
   device_type: 'ios' | 'android';
+  idempotency_key?: string;
 }
 